@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Store pre-simplified copies of every boundary in census_name_lookup so the
+geography endpoints can pick one with ?resolution= instead of running
+ST_SimplifyPreserveTopology on each request.
+
+Run once after loading a TIGER release (it's safe to re-run):
+
+    python build_geom_resolutions.py tiger2022
+
+Each level is simplified shape by shape, so the rings of a single geography
+stay valid, but neighbors aren't simplified against each other.
+"""
+import click
+from sqlalchemy import create_engine, text
+import tomllib
+
+from census_extractomatic._api.reference import GEOM_RESOLUTIONS
+
+
+@click.command()
+@click.argument("releases", nargs=-1, required=True)
+@click.option("--config", default="config.toml", help="Config file path")
+def build(releases, config):
+    """Add and fill the geom_<resolution> columns for each TIGER release."""
+
+    try:
+        with open(config, "rb") as f:
+            db = tomllib.load(f)["db"]
+    except FileNotFoundError:
+        click.echo(f"Error: Config file {config} not found", err=True)
+        return
+
+    engine = create_engine(
+        f"postgresql://{db['username']}:{db['password']}"
+        f"@{db['host']}:{db['port']}/{db['name']}"
+    )
+
+    levels = [
+        (column, tolerance)
+        for column, tolerance in GEOM_RESOLUTIONS.values()
+        if tolerance is not None
+    ]
+
+    for release in releases:
+        with engine.begin() as connection:
+            sumlevels = [
+                row.sumlevel
+                for row in connection.execute(
+                    text(
+                        f"SELECT DISTINCT sumlevel FROM {release}.census_name_lookup;"
+                    )
+                )
+            ]
+
+            for column, _ in levels:
+                connection.execute(
+                    text(
+                        f"""ALTER TABLE {release}.census_name_lookup
+                            ADD COLUMN IF NOT EXISTS {column} geometry;"""
+                    )
+                )
+
+        # One summary level per transaction keeps the rewrites a manageable size
+        for sumlevel in sumlevels:
+            assignments = ",\n".join(
+                f"{column} = ST_SimplifyPreserveTopology(geom, {tolerance})"
+                for column, tolerance in levels
+            )
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        f"""UPDATE {release}.census_name_lookup
+                            SET {assignments}
+                            WHERE sumlevel = :sumlevel;"""
+                    ),
+                    {"sumlevel": sumlevel},
+                )
+            click.echo(f"{release} {sumlevel}: simplified")
+
+        with engine.begin() as connection:
+            connection.execute(text(f"ANALYZE {release}.census_name_lookup;"))
+
+
+if __name__ == "__main__":
+    build()
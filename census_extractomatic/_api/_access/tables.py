@@ -10,6 +10,7 @@ from .ts_custom_functions import (
     to_tsquery,
     prep_q_for_text_search,
 )
+from ..trigram import set_similarity_threshold
 
 
 def wrap_up_columns(column_rows):
@@ -97,6 +98,30 @@ def search_tables(q, release, db, limit=5, offset=0):
     return result
 
 
+def search_tables_by_similarity(q, release, db, limit=5, offset=0):
+    """
+    Tables with a title similar to q (pg_trgm word_similarity), most
+    similar first, for when a misspelled search finds nothing else. Needs
+    the trigram index from migrations/0004_add_trigram_indexes.sql.
+
+    Only for when there's no TableIndex for the release, which answers the
+    same thing in memory (TableIndex.similar_tables).
+    """
+    set_similarity_threshold(db)
+
+    return db.execute(
+        text(
+            f"""SELECT *
+            FROM {release}.census_table_metadata
+            WHERE :q <% table_title
+            ORDER BY word_similarity(:q, table_title) DESC, table_id
+            LIMIT :limit
+            OFFSET :offset;"""
+        ),
+        {"q": q, "limit": limit, "offset": offset},
+    )
+
+
 def get_column_metadata(table_id, release, db):
     census_column_metadata = Table("census_column_metadata", schema=release)
 
@@ -19,7 +19,9 @@ from .reference import (
     PARENT_CHILD_CONTAINMENT,
     UNOFFICIAL_CHILDREN,
     SUMLEV_NAMES,
+    geom_column,
 )
+from .trigram import set_similarity_threshold
 
 # from returns.result import Failure, Result
 # Eventually wrap all db calls with this
@@ -337,7 +339,9 @@ def prepare_download():
 # All query the same table, most using geoids
 
 
-def get_geography_info(geoids, db, with_geom=False, fetchone=False):
+def get_geography_info(
+    geoids, db, with_geom=False, fetchone=False, resolution="high"
+):
     """
     This is almost identical to the functions below.
 
@@ -355,7 +359,7 @@ def get_geography_info(geoids, db, with_geom=False, fetchone=False):
 
     if with_geom:
         select.append(
-            "       ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom, 0.00005), 6) as geom"
+            f"       ST_AsGeoJSON({geom_column(resolution)}, 6) as geom"
         )
 
     select_compiled = ",\n".join(select)
@@ -389,6 +393,7 @@ def search_geos_by_point(
     limit=15,
     offset=0,
     sumlevs: tuple[str, ...] | None = None,
+    resolution="medium",
 ):
     select = [
         "SELECT DISTINCT geoid",
@@ -401,7 +406,7 @@ def search_geos_by_point(
 
     if with_geom:
         select.append(
-            "       ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom, 0.0001), 6) as geom"
+            f"       ST_AsGeoJSON({geom_column(resolution)}, 6) as geom"
         )
 
     select_compiled = ",\n".join(select)
@@ -438,8 +443,14 @@ def search_geos_by_point(
     )
 
 
-def prep_q_for_text_search(q):
-    return q.replace(" ", " | ")
+# Text match quality, nudged up for bigger places and down for less
+# important summary levels (priority sorts ascending elsewhere). The log
+# keeps a city of a million from burying an exact match on a small town.
+GEO_TEXT_SCORE = """
+    ts_rank(searchable_geo_name, query, 1)
+    * log(coalesce(population, 0) + 10)
+    / coalesce(nullif(priority, 0), 50)
+"""
 
 
 def search_geos_by_query(
@@ -449,38 +460,115 @@ def search_geos_by_query(
     limit=15,
     offset=0,
     sumlevs: tuple[str, ...] | None = None,
+    resolution="medium",
+    release="tiger2021",
 ):
     """
-    For this to work correctly it requires specific setup in the
-    database. First there must be a text search column added to the tiger2021 table:
+    Ranked full text search over geography names. q is parsed with
+    websearch_to_tsquery, so quoted phrases, 'or' and '-word' all work.
+
+    This needs the searchable_geo_name column and its GIN index from
+    migrations/0002_add_geo_name_search.sql.
+    """
+
+    select = [
+        "SELECT geo.geoid",
+        "       geo.sumlevel",
+        "       geo.population",
+        "       geo.display_name",
+        "       geo.full_geoid",
+        "       geo.priority",
+    ]
+
+    if with_geom:
+        select.append(
+            f"       ST_AsGeoJSON(geo.{geom_column(resolution)}, 6) as geom"
+        )
+
+    select_compiled = ",\n".join(select)
+
+    where_clause = [
+        "WHERE searchable_geo_name @@ query",
+    ]
+
+    if sumlevs is not None:
+        where_clause.append("AND sumlevel IN :sumlevs")
+
+    where_compiled = "\n".join(where_clause)
+
+    # census_name_lookup can have a row per alias of a geography, so keep
+    # each geography's best scoring row (by its ctid, so the row returned is
+    # the one that scored) before paging.
+    return db.execute(
+        text(
+            f"""
+            WITH matches AS (
+                SELECT DISTINCT ON (full_geoid) ctid AS row_id, full_geoid,
+                       {GEO_TEXT_SCORE} AS score
+                FROM {release}.census_name_lookup,
+                     websearch_to_tsquery('english', :q) AS query
+                {where_compiled}
+                ORDER BY full_geoid, score DESC, display_name
+            ),
+            page AS (
+                SELECT row_id, full_geoid, score
+                FROM matches
+                ORDER BY score DESC, full_geoid
+                LIMIT :limit
+                OFFSET :offset
+            )
+            {select_compiled}
+            FROM page
+            JOIN {release}.census_name_lookup AS geo ON geo.ctid = page.row_id
+            ORDER BY page.score DESC, page.full_geoid;
+            """
+        ),
+        {
+            "q": q,
+            "limit": limit,
+            "offset": offset,
+            "sumlevs": tuple(sumlevs) if sumlevs is not None else None,
+        },
+    )
 
-        ALTER TABLE tiger2021.census_name_lookup
-            ADD COLUMN searchable_geo_name tsvector
-                GENERATED ALWAYS AS (to_tsvector('english', coalesce(display_name, ''))) STORED;
 
-    Then you create an index on that for faster searching (there are no frequent writes so no performance worries):
+def search_geos_by_similarity(
+    q,
+    db,
+    with_geom=False,
+    limit=15,
+    offset=0,
+    sumlevs: tuple[str, ...] | None = None,
+    resolution="medium",
+    release="tiger2021",
+):
+    """
+    Geographies with a display name similar to q (pg_trgm word_similarity),
+    for when a misspelled name finds nothing with search_geos_by_query.
+    Most similar first, then by priority and population.
 
-        CREATE INDEX display_name_search_idx ON tiger2021.census_name_lookup USING GIN (searchable_geo_name);
+    This needs the trigram index from migrations/0004_add_trigram_indexes.sql.
     """
 
     select = [
-        "SELECT DISTINCT geoid",
-        "                sumlevel",
-        "                population",
-        "                display_name",
-        "                full_geoid",
-        "                priority",
+        "SELECT geo.geoid",
+        "       geo.sumlevel",
+        "       geo.population",
+        "       geo.display_name",
+        "       geo.full_geoid",
+        "       geo.priority",
     ]
 
     if with_geom:
         select.append(
-            "       ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom, 0.0001), 6) as geom"
+            f"       ST_AsGeoJSON(geo.{geom_column(resolution)}, 6) as geom"
         )
 
     select_compiled = ",\n".join(select)
 
     where_clause = [
-        "WHERE ST_Intersects(geom, ST_SetSRID(ST_Point(:lon, :lat),4326))",
+        "WHERE :q <% display_name",
+        "AND lower(display_name) NOT LIKE :not_defined",
     ]
 
     if sumlevs is not None:
@@ -488,22 +576,187 @@ def search_geos_by_query(
 
     where_compiled = "\n".join(where_clause)
 
-    prepped_q = prep_q_for_text_search(q)
+    set_similarity_threshold(db)
 
     return db.execute(
         text(
             f"""
+            WITH matches AS (
+                SELECT DISTINCT ON (full_geoid) ctid AS row_id, full_geoid,
+                       priority, population,
+                       word_similarity(:q, display_name) AS similarity
+                FROM {release}.census_name_lookup
+                {where_compiled}
+                ORDER BY full_geoid, similarity DESC, display_name
+            ),
+            page AS (
+                SELECT row_id, full_geoid, similarity, priority, population
+                FROM matches
+                ORDER BY similarity DESC, priority, population DESC NULLS LAST, full_geoid
+                LIMIT :limit
+                OFFSET :offset
+            )
             {select_compiled}
-            FROM tiger2021.census_name_lookup
-            {where_compiled}
-            ORDER BY sumlevel ASC, population DESC NULLS LAST
-            LIMIT :limit
-            OFFSET :offset;
+            FROM page
+            JOIN {release}.census_name_lookup AS geo ON geo.ctid = page.row_id
+            ORDER BY page.similarity DESC, page.priority,
+                     page.population DESC NULLS LAST, page.full_geoid;
+            """
+        ),
+        {
+            "q": q,
+            "not_defined": "%not defined%",
+            "limit": limit,
+            "offset": offset,
+            "sumlevs": tuple(sumlevs) if sumlevs is not None else None,
+        },
+    )
+
+
+def search_geos_by_proximity(
+    db,
+    sumlevs: tuple[str, ...],
+    lat=None,
+    lon=None,
+    geoid=None,
+    limit=10,
+    with_geom=False,
+    resolution="low",
+    release="tiger2021",
+):
+    """
+    The limit geographies in sumlevs closest to a point (lat, lon) or to
+    another geography (geoid), closest first, with their distance in
+    meters. Anything containing the point is 0 meters away.
+
+    The GiST index finds the nearest candidates with <->, which measures in
+    degrees, so a few more are fetched than needed and put in order by
+    their distance in meters. The index is only used when the other side of
+    <-> is constant for the query, hence the scalar subquery for the origin.
+    """
+
+    if geoid is not None:
+        origin = f"""
+            SELECT geom
+            FROM {release}.census_name_lookup
+            WHERE full_geoid = :geoid
+            LIMIT 1
+        """
+    else:
+        origin = "SELECT ST_SetSRID(ST_Point(:lon, :lat), 4326) AS geom"
+
+    where_clause = [
+        "WHERE lookup.sumlevel IN :sumlevs",
+        "AND lower(lookup.display_name) NOT LIKE :not_defined",
+    ]
+
+    if geoid is not None:
+        where_clause.append("AND lookup.full_geoid != :geoid")
+
+    where_compiled = "\n".join(where_clause)
+
+    select = [
+        "SELECT nearest.geoid",
+        "       nearest.sumlevel",
+        "       nearest.population",
+        "       nearest.display_name",
+        "       nearest.full_geoid",
+        "       nearest.priority",
+        "       nearest.distance",
+    ]
+
+    if with_geom:
+        select.append("       nearest.geom")
+
+    select_compiled = ",\n".join(select)
+
+    geom_select = (
+        f", ST_AsGeoJSON(geo.{geom_column(resolution)}, 6) AS geom"
+        if with_geom
+        else ""
+    )
+
+    return db.execute(
+        text(
+            f"""
+            WITH origin AS ({origin}),
+            candidates AS (
+                SELECT lookup.full_geoid
+                FROM {release}.census_name_lookup AS lookup
+                {where_compiled}
+                ORDER BY lookup.geom <-> (SELECT geom FROM origin)
+                LIMIT :candidates
+            ),
+            nearest AS (
+                SELECT DISTINCT ON (geo.full_geoid)
+                       geo.geoid, geo.sumlevel, geo.population,
+                       geo.display_name, geo.full_geoid, geo.priority,
+                       ST_Distance(geo.geom::geography, origin.geom::geography) AS distance
+                       {geom_select}
+                FROM candidates
+                JOIN {release}.census_name_lookup AS geo USING (full_geoid)
+                CROSS JOIN origin
+                ORDER BY geo.full_geoid
+            )
+            {select_compiled}
+            FROM nearest
+            ORDER BY nearest.distance, nearest.priority, nearest.full_geoid
+            LIMIT :limit;
+            """
+        ),
+        {
+            "lat": lat,
+            "lon": lon,
+            "geoid": geoid,
+            "sumlevs": tuple(sumlevs),
+            "not_defined": "%not defined%",
+            # census_name_lookup can have a row per alias of a geography
+            "candidates": limit * 4 + 10,
+            "limit": limit,
+        },
+    )
+
+
+def locate_points(db, lats, lons, sumlevs: tuple[str, ...], release="tiger2021"):
+    """
+    Reverse geocode a batch of points in one query. Returns a {sumlevel:
+    full_geoid} dict per point, in the same order as the points, with the
+    best (by priority) containing geography in each sumlevel.
+    """
+    result = db.execute(
+        text(
+            f"""
+            WITH points AS (
+                SELECT n, ST_SetSRID(ST_Point(lon, lat), 4326) AS geom
+                FROM unnest(
+                    CAST(:lats AS float8[]), CAST(:lons AS float8[])
+                ) WITH ORDINALITY AS p(lat, lon, n)
+            )
+            SELECT DISTINCT ON (points.n, geo.sumlevel)
+                   points.n, geo.sumlevel, geo.full_geoid
+            FROM points
+            JOIN {release}.census_name_lookup AS geo
+                ON ST_Intersects(geo.geom, points.geom)
+            WHERE geo.sumlevel IN :sumlevs
+            AND lower(geo.display_name) NOT LIKE :not_defined
+            ORDER BY points.n, geo.sumlevel, geo.priority,
+                     geo.population DESC NULLS LAST, geo.full_geoid;
             """
         ),
-        {"q": prepped_q, "limit": limit, "offset": offset, "sumlevs": sumlevs},
+        {
+            "lats": list(lats),
+            "lons": list(lons),
+            "sumlevs": tuple(sumlevs),
+            "not_defined": "%not defined%",
+        },
     )
 
+    located = [{} for _ in lats]
+    for row in result:
+        located[row.n - 1][row.sumlevel] = row.full_geoid
+
+    return located
+
 
 @dataclass
 class ViewportLocation:
@@ -556,6 +809,87 @@ class ViewportLocation:
     def max_corner(self):
         return ViewportLocation(self.zoom, self.x + 1, self.y + 1).lat_lon
 
+    def bounds(self):
+        """
+        The (west, south, east, north) extent of the tile in degrees. Tile
+        rows count down from the north, so the 'min' corner is actually the
+        north-west corner of the tile.
+        """
+        north, west = self.min_corner()
+        south, east = self.max_corner()
+
+        return west, south, east, north
+
+    @classmethod
+    def containing(cls, zoom, lat, lon):
+        """
+        The inverse of lat_lon: the tile at this zoom that holds the point.
+        """
+        tiles_across = 2**zoom
+        lat_rad = math.radians(lat)
+
+        x = int((lon + 180.0) / 360.0 * tiles_across)
+        y = int(
+            (1 - math.asinh(math.tan(lat_rad)) / math.pi) / 2 * tiles_across
+        )
+
+        # Points on the east or south edge of the map belong to the last tile
+        clamp = lambda val: min(max(val, 0), tiles_across - 1)
+
+        return cls(zoom, clamp(x), clamp(y))
+
+    @classmethod
+    def covering(cls, zoom, west, south, east, north):
+        """
+        Every tile at this zoom that touches the bounding box, row by row.
+        """
+        top_left = cls.containing(zoom, north, west)
+        bottom_right = cls.containing(zoom, south, east)
+
+        for y in range(top_left.y, bottom_right.y + 1):
+            for x in range(top_left.x, bottom_right.x + 1):
+                yield cls(zoom, x, y)
+
+    def metatile(self, size=4):
+        """
+        The size x size block of tiles (aligned to multiples of size) that
+        this tile belongs to. Blocks are cut off at the edge of the map, so
+        at low zooms they can be smaller.
+        """
+        left = self.x - self.x % size
+        top = self.y - self.y % size
+
+        return [
+            ViewportLocation(self.zoom, x, y)
+            for y in range(top, min(top + size, self.tiles_across))
+            for x in range(left, min(left + size, self.tiles_across))
+        ]
+
+
+def block_params(locs: list[ViewportLocation]):
+    """
+    Per-tile bounds as parallel arrays (for unnest) plus the bounds of the
+    whole block, so a block of tiles can be fetched with one index scan and
+    split up per tile in the same query.
+    """
+    bounds = [loc.bounds() for loc in locs]
+    wests, souths, easts, norths = zip(*bounds)
+
+    return {
+        "xs": [loc.x for loc in locs],
+        "ys": [loc.y for loc in locs],
+        "wests": list(wests),
+        "souths": list(souths),
+        "easts": list(easts),
+        "norths": list(norths),
+        "block_west": min(wests),
+        "block_south": min(souths),
+        "block_east": max(easts),
+        "block_north": max(norths),
+        # All the tiles in a block are the same zoom
+        "tile_buffer": locs[0].tile_buffer(),
+    }
+
 
 def get_neighboring_boundaries(sumlevel, loc: ViewportLocation, db):
     miny, minx = loc.min_corner()
@@ -594,6 +928,191 @@ def get_neighboring_boundaries(sumlevel, loc: ViewportLocation, db):
     return result
 
 
+# Mapbox vector tiles are drawn on a 4096 unit grid, so the same ~10 pixel
+# buffer the GeoJSON tiles use works out to 160 tile units.
+MVT_EXTENT = 4096
+MVT_BUFFER = 160
+
+
+def get_boundary_tile_mvt(
+    sumlevel, loc: ViewportLocation, db, release="tiger2021", layer="boundaries"
+) -> bytes:
+    """
+    The vector tile version of get_neighboring_boundaries. Geometries are
+    clipped to the buffered tile in lat/lon, then projected and encoded by
+    PostGIS, so the tile comes back as a single protobuf blob and never
+    passes through json on the way out.
+    """
+    west, south, east, north = loc.bounds()
+
+    result = db.execute(
+        text(
+            f"""WITH bounds AS (
+                SELECT ST_MakeEnvelope(:west, :south, :east, :north, 4326) AS envelope,
+                       ST_Transform(
+                           ST_MakeEnvelope(:west, :south, :east, :north, 4326), 3857
+                       )::box2d AS tile_box
+            ),
+            features AS (
+                SELECT ST_AsMVTGeom(
+                           ST_Transform(
+                               ST_ClipByBox2D(
+                                   geom, ST_Expand(bounds.envelope, :tile_buffer)::box2d
+                               ), 3857
+                           ),
+                           bounds.tile_box, :extent, :buffer, true
+                       ) AS geom,
+                       full_geoid AS geoid,
+                       display_name AS name
+                FROM {release}.census_name_lookup, bounds
+                WHERE sumlevel=:sumlev
+                AND ST_Intersects(bounds.envelope, geom)
+            )
+            SELECT ST_AsMVT(features, :layer, :extent, 'geom') AS tile
+            FROM features
+            WHERE geom IS NOT NULL;
+            """
+        ),
+        {
+            "west": west,
+            "south": south,
+            "east": east,
+            "north": north,
+            "sumlev": sumlevel,
+            "tile_buffer": loc.tile_buffer(),
+            "extent": MVT_EXTENT,
+            "buffer": MVT_BUFFER,
+            "layer": layer,
+        },
+    )
+
+    tile = result.scalar()
+
+    return bytes(tile) if tile else b""
+
+
+BLOCK_TILES_CTE = """
+    tiles AS (
+        SELECT x, y,
+               ST_MakeEnvelope(west, south, east, north, 4326) AS envelope,
+               ST_Transform(
+                   ST_MakeEnvelope(west, south, east, north, 4326), 3857
+               )::box2d AS tile_box
+        FROM unnest(
+            CAST(:xs AS integer[]), CAST(:ys AS integer[]),
+            CAST(:wests AS float8[]), CAST(:souths AS float8[]),
+            CAST(:easts AS float8[]), CAST(:norths AS float8[])
+        ) AS t(x, y, west, south, east, north)
+    ),
+    block AS (
+        SELECT full_geoid, display_name, geom
+        FROM {release}.census_name_lookup
+        WHERE sumlevel=:sumlev
+        AND ST_Intersects(
+            ST_MakeEnvelope(:block_west, :block_south, :block_east, :block_north, 4326),
+            geom
+        )
+    )
+"""
+
+
+def get_boundary_metatile_mvt(
+    sumlevel,
+    locs: list[ViewportLocation],
+    db,
+    release="tiger2021",
+    layer="boundaries",
+) -> dict[tuple[int, int], bytes]:
+    """
+    get_boundary_tile_mvt for a whole block of tiles (see
+    ViewportLocation.metatile) in one query. Returns {(x, y): tile} with an
+    entry for every tile asked for, empty or not.
+    """
+    result = db.execute(
+        text(
+            f"""WITH {BLOCK_TILES_CTE.format(release=release)},
+            features AS (
+                SELECT tiles.x,
+                       tiles.y,
+                       ST_AsMVTGeom(
+                           ST_Transform(
+                               ST_ClipByBox2D(
+                                   block.geom, ST_Expand(tiles.envelope, :tile_buffer)::box2d
+                               ), 3857
+                           ),
+                           tiles.tile_box, :extent, :buffer, true
+                       ) AS geom,
+                       block.full_geoid AS geoid,
+                       block.display_name AS name
+                FROM tiles
+                JOIN block ON ST_Intersects(tiles.envelope, block.geom)
+            )
+            SELECT features.x, features.y, ST_AsMVT(feature, :layer, :extent, 'geom') AS tile
+            FROM features
+            CROSS JOIN LATERAL (
+                SELECT features.geoid, features.name, features.geom
+            ) AS feature
+            WHERE features.geom IS NOT NULL
+            GROUP BY features.x, features.y;
+            """
+        ),
+        {
+            **block_params(locs),
+            "sumlev": sumlevel,
+            "extent": MVT_EXTENT,
+            "buffer": MVT_BUFFER,
+            "layer": layer,
+        },
+    )
+
+    tiles = {(loc.x, loc.y): b"" for loc in locs}
+    for row in result:
+        tiles[(row.x, row.y)] = bytes(row.tile) if row.tile else b""
+
+    return tiles
+
+
+def get_neighboring_boundaries_metatile(
+    sumlevel, locs: list[ViewportLocation], db, release="tiger2021"
+) -> dict[tuple[int, int], list]:
+    """
+    get_neighboring_boundaries for a whole block of tiles in one query.
+    Returns {(x, y): rows} with an entry for every tile asked for.
+    """
+    result = db.execute(
+        text(
+            f"""WITH {BLOCK_TILES_CTE.format(release=release)}
+            SELECT tiles.x,
+                   tiles.y,
+                   ST_AsGeoJSON(
+                       ST_SimplifyPreserveTopology(
+                           ST_Intersection(
+                               ST_Buffer(tiles.envelope, :tile_buffer, 'join=mitre'),
+                               block.geom
+                           ), :simplify_threshold
+                       ), 5
+                   ) AS geom,
+                   block.full_geoid,
+                   block.display_name
+            FROM tiles
+            JOIN block ON ST_Intersects(tiles.envelope, block.geom)
+            ORDER BY tiles.y, tiles.x;
+            """
+        ),
+        {
+            **block_params(locs),
+            "sumlev": sumlevel,
+            "simplify_threshold": locs[0].simplify_threshold(),
+        },
+    )
+
+    tiles = {(loc.x, loc.y): [] for loc in locs}
+    for row in result:
+        tiles[(row.x, row.y)].append(row)
+
+    return tiles
+
+
 def get_details_for_geoids(geoids, db):
     result = db.execute(
         text(
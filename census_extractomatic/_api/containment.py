@@ -0,0 +1,108 @@
+"""
+The geographies of a summary level inside a parent geography, for tearsheet
+requests like 'tracts|05000US26163'.
+
+Every group in a request is resolved with one query, and the answers are
+kept (least recently used dropped first) per geography vintage, summary
+level and parent, since containment doesn't change once it's loaded.
+
+Only children at least MIN_PERCENT_COVERED percent inside the parent count,
+like /1.0/data/compare, so a tract that touches the county line doesn't
+turn up in the neighboring county's sheet. The summary levels available
+under each parent (for the tearsheet's geography search) are precomputed
+in census_child_sumlevels, see migrations/0005_add_child_sumlevels.sql.
+"""
+
+from collections import OrderedDict, defaultdict
+import threading
+
+from sqlalchemy import text
+
+
+MIN_PERCENT_COVERED = 10
+
+CONTAINMENT_CACHE_SIZE = 1024
+
+
+class ContainmentCache:
+    def __init__(self, maxsize=CONTAINMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            children = self._entries.get(key)
+            if children is not None:
+                self._entries.move_to_end(key)
+            return children
+
+    def put(self, key, children: tuple):
+        with self._lock:
+            self._entries[key] = children
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_containment_cache = ContainmentCache()
+
+
+def fetch_within(db, geo_schema, groups) -> dict[tuple[str, str], list[str]]:
+    """
+    The child geoids of each (sumlevel, parent_geoid) in groups, all in one
+    query.
+    """
+    rows = db.execute(
+        text(
+            f"""
+            SELECT g.sumlevel, g.parent_geoid, c.child_geoid
+            FROM unnest(CAST(:sumlevels AS text[]), CAST(:parents AS text[]))
+                AS g(sumlevel, parent_geoid)
+            JOIN {geo_schema}.census_geo_containment c
+              ON c.parent_geoid = g.parent_geoid
+             AND c.child_geoid LIKE g.sumlevel || '%'
+            WHERE c.percent_covered > :min_percent_covered
+            ORDER BY g.sumlevel, g.parent_geoid, c.child_geoid;
+            """
+        ),
+        {
+            "sumlevels": [sumlevel for sumlevel, _ in groups],
+            "parents": [parent for _, parent in groups],
+            "min_percent_covered": MIN_PERCENT_COVERED,
+        },
+    )
+
+    within = defaultdict(list)
+    for row in rows:
+        within[(row.sumlevel, row.parent_geoid)].append(row.child_geoid)
+
+    return within
+
+
+def find_within(
+    groups, db, geo_schema="tiger2022", cache=_containment_cache, fetch=fetch_within
+) -> dict[tuple[str, str], tuple[str, ...]]:
+    """
+    The child geoids of each (sumlevel, parent_geoid) in groups, from the
+    cache where possible and with a single query for the rest.
+    """
+    found = {}
+    missing = []
+    for group in dict.fromkeys(groups):
+        children = cache.get((geo_schema, *group))
+        if children is None:
+            missing.append(group)
+        else:
+            found[group] = children
+
+    if missing:
+        fetched = fetch(db, geo_schema, missing)
+        for group in missing:
+            found[group] = tuple(fetched.get(group, ()))
+            cache.put((geo_schema, *group), found[group])
+
+    return found
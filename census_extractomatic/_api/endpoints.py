@@ -55,7 +55,7 @@ from .download_data import (
     prepare_geojson_response,
 )
 
-from ._access.tables import search_tables
+from .table_index import get_table_index
 from ._access.geography import get_details_for_geoids
 from .http_utils import crossdomain
 from .reference import (
@@ -65,6 +65,7 @@ from .reference import (
     ACS_NAMES,
     default_table_search_release,
     supported_formats,
+    GEOM_RESOLUTIONS,
 )
 
 
@@ -119,6 +120,7 @@ def before_request():
         "q": {"valid": NonemptyString()},
         "sumlevs": {"valid": StringList(item_validator=OneOf(SUMLEV_NAMES))},
         "geom": {"valid": Bool()},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "medium"},
         "limit": {"valid": ValidInteger()},
         "offset": {"valid": ValidInteger()},
     }
@@ -145,6 +147,7 @@ def geo_search():
             limit=limit,
             offset=offset,
             sumlevs=request.qwargs.sumlevs,
+            resolution=request.qwargs.resolution,
         )
 
     elif request.qwargs.q:
@@ -155,6 +158,7 @@ def geo_search():
             limit=limit,
             offset=offset,
             sumlevs=request.qwargs.sumlevs,
+            resolution=request.qwargs.resolution,
         )
     else:
         abort(400, "Must provide either a lat/lon OR a query term.")
@@ -216,7 +220,12 @@ def geo_tiles(release, sumlevel, zoom, x, y):
 
 
 @app.route("/1.0/geo/<release>/<geoid>")
-@qwarg_validate({"geom": {"valid": Bool(), "default": False}})
+@qwarg_validate(
+    {
+        "geom": {"valid": Bool(), "default": False},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "high"},
+    }
+)
 @crossdomain(origin="*")
 def geo_lookup(release, geoid):
     geoid_parts = geoid.upper().split("US")
@@ -224,7 +233,11 @@ def geo_lookup(release, geoid):
         abort(404, "Invalid GeoID")
 
     result = get_geography_info(
-        (geoid,), db.session, with_geom=request.qwargs.geom, fetchone=True
+        (geoid,),
+        db.session,
+        with_geom=request.qwargs.geom,
+        fetchone=True,
+        resolution=request.qwargs.resolution,
     )
 
     if not result:
@@ -329,10 +342,8 @@ def table_ts():
     if not (offset := request.qwargs.offset):
         offset = 0
 
-    result = search_tables(
+    result = get_table_index(request.qwargs.acs, db.session).search_tables(
         request.qwargs.q,
-        request.qwargs.acs,
-        db.session,
         limit=limit,
         offset=offset,
     )
@@ -585,6 +596,7 @@ def data_pull(table_ids, geoids, acs, db):
 @qwarg_validate(
     {
         "geo_ids": {"valid": StringList(), "required": True},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "adaptive"},
     }
 )
 @crossdomain(origin="*")
@@ -600,6 +612,7 @@ def show_specified_geo_data(release):
         geoids,
         db.session,
         with_geom=True,
+        resolution=request.qwargs.resolution,
     )
 
     return prepare_fake_geojson_response(
@@ -682,6 +695,7 @@ def download_specified_data(acs):
         "within": {"valid": NonemptyString(), "required": True},
         "sumlevel": {"valid": OneOf(SUMLEV_NAMES), "required": True},
         "geom": {"valid": Bool(), "default": False},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "low"},
     }
 )
 @crossdomain(origin="*")
@@ -706,6 +720,7 @@ def data_compare_geographies_within_parent(acs, table_id):
         db.session,
         with_geom=request.qwargs.geom,
         fetchone=True,
+        resolution=request.qwargs.resolution,
     )
 
     child_list = tuple(
@@ -715,7 +730,12 @@ def data_compare_geographies_within_parent(acs, table_id):
         )
     )
 
-    children = get_geography_info(child_list, db.session, with_geom=True)
+    children = get_geography_info(
+        child_list,
+        db.session,
+        with_geom=True,
+        resolution=request.qwargs.resolution,
+    )
 
     parent_result = fetch_data(
         (table_id,), (parent.full_geoid,), acs, db.session
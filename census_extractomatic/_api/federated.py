@@ -0,0 +1,108 @@
+"""
+One search box, several backends: run the geography, table and variable
+searches at the same time, wait no longer than a fixed budget for them, and
+merge whatever came back into a single ranked list.
+
+A backend that misses the deadline is left out of the results (and marked
+'timeout' in the per-source timings) rather than holding up the response.
+Its database work is cut off by a statement_timeout of the same budget, so
+it doesn't keep running long after nobody is waiting for it.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import logging
+import time
+
+from sqlalchemy import text
+
+
+logger = logging.getLogger()
+
+
+SourceResult = namedtuple("SourceResult", ["status", "ms", "hits"])
+
+# Reciprocal rank fusion constant. The scores of the different backends
+# can't be compared, but their ranks can: a hit scores 1 / (k + rank).
+RRF_K = 60
+
+_federated_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="federated")
+
+
+def _timed(search):
+    start = time.perf_counter()
+    try:
+        hits = search()
+        status = "ok"
+    except Exception:
+        logger.exception("Federated search backend failed")
+        hits, status = [], "error"
+
+    return SourceResult(status, (time.perf_counter() - start) * 1000, hits)
+
+
+def fan_out(searches: dict, budget: float) -> dict[str, SourceResult]:
+    """
+    Call every search (a function of no arguments returning a ranked list)
+    concurrently, waiting at most budget seconds for all of them.
+    """
+    start = time.perf_counter()
+    futures = {
+        name: _federated_pool.submit(_timed, search)
+        for name, search in searches.items()
+    }
+    wait(futures.values(), timeout=budget)
+
+    results = {}
+    for name, future in futures.items():
+        if future.done():
+            results[name] = future.result()
+        else:
+            future.cancel()
+            waited = (time.perf_counter() - start) * 1000
+            results[name] = SourceResult("timeout", waited, [])
+
+    return results
+
+
+def fuse(results: dict[str, SourceResult], limit=20, k=RRF_K) -> list[dict]:
+    """
+    Merge the sources' hits (dicts with an 'id') by reciprocal rank fusion.
+    A hit found by more than one source (a table from both the table and
+    variable searches) is listed once, with every source that found it and
+    the sum of its scores. Ties go to the source listed first, then to the
+    better rank.
+    """
+    fused = {}
+    for order, (source, result) in enumerate(results.items()):
+        for rank, hit in enumerate(result.hits, start=1):
+            entry = fused.setdefault(
+                hit["id"],
+                {"hit": hit, "score": 0.0, "sources": [], "first": (order, rank)},
+            )
+            entry["score"] += 1 / (k + rank)
+            entry["sources"].append(source)
+
+    ranked = sorted(
+        fused.values(), key=lambda entry: (-entry["score"], entry["first"])
+    )
+
+    return [
+        {**entry["hit"], "sources": entry["sources"], "score": round(entry["score"], 6)}
+        for entry in ranked[:limit]
+    ]
+
+
+@contextmanager
+def budgeted_connection(engine, budget: float):
+    """
+    A connection whose statements are cancelled by Postgres after budget
+    seconds.
+    """
+    with engine.connect() as connection:
+        connection.execute(
+            text("SELECT set_config('statement_timeout', :ms, true);"),
+            {"ms": str(max(1, int(budget * 1000)))},
+        )
+        yield connection
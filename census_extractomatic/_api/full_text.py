@@ -0,0 +1,166 @@
+"""
+Ranked search over search_metadata (see full-text-search/metadata_script.sql)
+for /2.1/full-text/search.
+
+Each object type is scored in SQL and only its best offset + limit rows come
+back, so a broad query like 'income' doesn't pull thousands of rows into
+Python to be scored and sorted there. The per-type queries run at the same
+time on their own connections and their results are merged.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import re
+
+from sqlalchemy import text
+
+
+SEARCH_TYPES = ("profile", "table", "topic")
+
+# Every score is in [0, 1] (roughly) so the types can be ranked together.
+#
+# Profiles: priority runs from 5 (nation) to 320, and counts for 0.8 of the
+# score; log population relative to the US counts for the rest. An empty or
+# zero population counts as 1.
+#
+# Tables: Postgres relevance for tables falls in [1E-8, 1E-2], so log10 of
+# it (clamped to [1E-9, 1E-1]) is mapped onto [0, 1].
+#
+# Topics: anything with relevance over 0.4 goes first, the rest is doubled
+# to appear slightly higher.
+SEARCH_QUERIES = {
+    "profile": """
+        SELECT text1 AS display_name,
+               text2 AS sumlevel,
+               text3 AS sumlevel_name,
+               text4 AS full_geoid,
+               'profile' AS type,
+               (1 - (CAST(text6 AS INT) - 5) / 315.0) * 0.8
+               + (1 + ln(
+                   coalesce(nullif(CAST(nullif(text5, '') AS BIGINT), 0), 1)
+                   / 318857056.0
+               ) / ln(318857056.0)) * 0.2 AS score
+        FROM search_metadata
+        WHERE document @@ to_tsquery('simple', :search_term)
+        AND type = 'profile'
+        ORDER BY score DESC, full_geoid
+        LIMIT :n;
+    """,
+    "table": """
+        SELECT text1 AS tabulation_code,
+               text2 AS table_title,
+               text3 AS topics,
+               text4 AS simple_table_title,
+               text5 AS tables,
+               'table' AS type,
+               (log(least(greatest(
+                   ts_rank(document, to_tsquery(:search_term), 2|8|32),
+                   1e-9
+               ), 1e-1)) + 9) / 8.0 AS score
+        FROM search_metadata
+        WHERE document @@ to_tsquery(:search_term)
+        AND type = 'table'
+        ORDER BY score DESC, tabulation_code
+        LIMIT :n;
+    """,
+    "topic": """
+        SELECT text1 AS topic_name,
+               text3 AS url,
+               'topic' AS type,
+               CASE WHEN ts_rank(document, to_tsquery(:search_term)) > 0.4
+                    THEN 1
+                    ELSE ts_rank(document, to_tsquery(:search_term)) * 2
+               END AS score
+        FROM search_metadata
+        WHERE document @@ to_tsquery(:search_term)
+        AND type = 'topic'
+        ORDER BY score DESC, topic_name
+        LIMIT :n;
+    """,
+}
+
+_search_pool = ThreadPoolExecutor(
+    max_workers=len(SEARCH_TYPES), thread_name_prefix="full-text"
+)
+
+
+def to_prefix_tsquery(q):
+    """
+    'median household inc' -> 'median & household & inc:*'
+
+    Only the words are kept, so punctuation in the search box can't make
+    to_tsquery throw a syntax error. None if there aren't any words (or
+    no q at all).
+    """
+    words = re.findall(r"\w+", q or "")
+    if not words:
+        return None
+
+    return " & ".join(words) + ":*"
+
+
+def choose_table(tables):
+    """Choose a representative table for a list of table_ids.
+
+    In the case where a tabulation has multiple iterations / subtables, we
+    want one that is representative of all of them. The preferred order is:
+        'C' table with no iterations
+      > 'B' table with no iterations
+      > 'C' table with iterations (arbitrarily choosing 'A' iteration)
+      > 'B' table with iterations (arbitrarily choosing 'A' iteration)
+    since, generally, simpler, more complete tables are more useful.
+
+    Table IDs are in the format [B/C]#####[A-I]. If any iteration is
+    present, all of them are (e.g., if B10001A is present, so are B10001B,
+    ... , B10001I.)
+    """
+
+    tabulation_code = re.match(r"^(B|C)(\d+)[A-Z]?", tables[0]).group(2)
+
+    for candidate in (
+        "C" + tabulation_code,
+        "B" + tabulation_code,
+        "C" + tabulation_code + "A",
+        "B" + tabulation_code + "A",
+    ):
+        if candidate in tables:
+            return candidate
+
+    return ""
+
+
+def search_one_type(engine, object_type, search_term, n):
+    with engine.connect() as db:
+        rows = db.execute(
+            text(SEARCH_QUERIES[object_type]), {"search_term": search_term, "n": n}
+        )
+        return [dict(row._mapping) for row in rows]
+
+
+def top_results(ranked_lists, limit, offset=0):
+    """
+    Merge lists that are each sorted by score (best first) and return the
+    limit rows after offset.
+    """
+    merged = heapq.merge(*ranked_lists, key=lambda row: -row["score"])
+
+    return [row for i, row in zip(range(offset + limit), merged) if i >= offset]
+
+
+def search_metadata(engine, q, object_types=SEARCH_TYPES, limit=20, offset=0):
+    """
+    Rows for the best matches of q among object_types, best first, each a
+    dict with a 'type' and a 'score'.
+    """
+    search_term = to_prefix_tsquery(q)
+    if search_term is None:
+        return []
+
+    futures = [
+        _search_pool.submit(
+            search_one_type, engine, object_type, search_term, offset + limit
+        )
+        for object_type in object_types
+    ]
+
+    return top_results([future.result() for future in futures], limit, offset)
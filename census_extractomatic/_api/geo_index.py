@@ -0,0 +1,450 @@
+"""
+In-memory indexes over census_name_lookup for the geography search
+endpoints, so typeahead and map clicks don't hit Postgres every time.
+
+The indexes are built once per worker (see build_search_indexes in api.py)
+and never change afterwards, since a TIGER release doesn't change once it's
+loaded. If a worker takes a request before its index is built, the index is
+built right then.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+import heapq
+import logging
+import math
+import threading
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from sqlalchemy import text
+
+from .reference import SUMLEV_NAMES
+from .trigram import DEFAULT_THRESHOLD, FALLBACK_BELOW, TrigramIndex
+
+logger = logging.getLogger()
+
+
+GeoEntry = namedtuple(
+    "GeoEntry",
+    ["full_geoid", "sumlevel", "display_name", "population", "priority"],
+)
+
+
+def rank(entry: GeoEntry):
+    """
+    Same order as 'ORDER BY priority, population DESC NULLS LAST', with
+    the geoid to break ties so results don't shuffle between workers.
+    """
+    return (
+        entry.priority is None,
+        entry.priority or 0,
+        entry.population is None,
+        -(entry.population or 0),
+        entry.full_geoid,
+    )
+
+
+class PrefixIndex:
+    """
+    A sorted array of lowercased prefix_match_names for prefix lookups with
+    bisect. The short prefixes people type first match a big slice of the
+    array though, so for those the best top_k geographies per (prefix,
+    sumlevel) are worked out up front and merged at query time.
+
+    Display names are also trigram indexed for fuzzy_search, to catch
+    misspellings that no prefix matches.
+    """
+
+    def __init__(self, rows, depth=3, top_k=25):
+        self.depth = depth
+        self.top_k = top_k
+
+        entries = {}
+        names = []
+        for row in rows:
+            entry = entries.setdefault(
+                row.full_geoid,
+                GeoEntry(
+                    row.full_geoid,
+                    row.sumlevel,
+                    row.display_name,
+                    row.population,
+                    row.priority,
+                ),
+            )
+            names.append((row.prefix_match_name.lower(), entry.full_geoid))
+
+        names.sort()
+        self._entries = entries
+        self._names = [name for name, _ in names]
+        self._geoids = [geoid for _, geoid in names]
+
+        top = defaultdict(set)
+        for name, geoid in names:
+            entry = entries[geoid]
+            for length in range(1, min(depth, len(name)) + 1):
+                top[(name[:length], entry.sumlevel)].add(geoid)
+
+        self._top = {
+            key: sorted((entries[geoid] for geoid in geoids), key=rank)[:top_k]
+            for key, geoids in top.items()
+        }
+
+        self._fuzzy_entries = list(entries.values())
+        self._fuzzy = TrigramIndex(entry.display_name for entry in self._fuzzy_entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def from_db(cls, db, release, **kwargs):
+        result = db.execute(
+            text(
+                f"""SELECT DISTINCT full_geoid, sumlevel, display_name,
+                           population, priority, prefix_match_name
+                FROM {release}.census_name_lookup
+                WHERE prefix_match_name IS NOT NULL
+                AND lower(display_name) NOT LIKE :not_defined
+                AND sumlevel != '150';"""
+            ),
+            {"not_defined": "%not defined%"},
+        )
+
+        return cls(result, **kwargs)
+
+    def search(self, q, sumlevs, limit=25) -> list[GeoEntry]:
+        """
+        Geographies with a prefix_match_name starting with q (ignoring case)
+        in one of the sumlevs, best first.
+        """
+        q = q.lower()
+        sumlevs = set(sumlevs)
+
+        if 0 < len(q) <= self.depth and limit <= self.top_k:
+            # Each list is already ranked, and a geoid only ever has one
+            # sumlevel, so merging them can't produce duplicates.
+            merged = heapq.merge(
+                *[self._top.get((q, sumlevel), []) for sumlevel in sumlevs],
+                key=rank,
+            )
+            return [entry for _, entry in zip(range(limit), merged)]
+
+        start = bisect_left(self._names, q)
+        end = bisect_left(self._names, q + "\uffff", lo=start)
+
+        matches = {
+            geoid
+            for geoid in self._geoids[start:end]
+            if self._entries[geoid].sumlevel in sumlevs
+        }
+
+        return heapq.nsmallest(
+            limit, (self._entries[geoid] for geoid in matches), key=rank
+        )
+
+    def typeahead(self, q, sumlevs, limit=25) -> list[GeoEntry]:
+        """
+        search, topped up with fuzzy_search matches when there are only a
+        few (q is probably misspelled).
+        """
+        entries = self.search(q, sumlevs, limit=limit)
+        if len(entries) >= FALLBACK_BELOW:
+            return entries
+
+        found = {entry.full_geoid for entry in entries}
+        return entries + [
+            entry
+            for entry in self.fuzzy_search(q, sumlevs, limit=limit)
+            if entry.full_geoid not in found
+        ][: limit - len(entries)]
+
+    def fuzzy_search(
+        self, q, sumlevs, limit=25, threshold=DEFAULT_THRESHOLD
+    ) -> list[GeoEntry]:
+        """
+        Geographies in sumlevs whose display name is similar to q, most
+        similar first (then by rank).
+        """
+        sumlevs = set(sumlevs)
+        matches = [
+            (similarity, self._fuzzy_entries[i])
+            for similarity, i in self._fuzzy.search(q, threshold)
+            if self._fuzzy_entries[i].sumlevel in sumlevs
+        ]
+
+        return [
+            entry
+            for _, entry in heapq.nsmallest(
+                limit, matches, key=lambda match: (-match[0], rank(match[1]))
+            )
+        ]
+
+
+class SpatialIndex:
+    """
+    Point-in-polygon lookups for every geography in a few states, without
+    going to PostGIS. There's an STR-tree of bounding boxes per sumlevel,
+    and the candidates it returns are checked exactly against the
+    (prepared) full resolution boundaries.
+
+    Only points inside the loaded states can be answered here: search
+    returns None for anything else and the caller should ask the database.
+    A sumlevel that was loaded but has nothing in those states (NECTAs
+    outside New England, say) is covered too, it just never matches.
+    """
+
+    # The nation is left out, and so are block groups since geo search
+    # never returns them.
+    LOADED_SUMLEVELS = frozenset(SUMLEV_NAMES) - {"010", "150"}
+
+    def __init__(self, rows, states, sumlevels=()):
+        """
+        sumlevels are the ones rows were loaded for, including any with no
+        rows at all.
+        """
+        by_sumlevel = defaultdict(lambda: ([], []))
+        for sumlevel in sumlevels:
+            # An empty tree, unless rows turn up for it
+            by_sumlevel[sumlevel]
+        seen = set()
+        for row in rows:
+            # census_name_lookup can have a row per alias of a geography
+            if row.full_geoid in seen:
+                continue
+            seen.add(row.full_geoid)
+
+            entries, geoms = by_sumlevel[row.sumlevel]
+            entries.append(
+                GeoEntry(
+                    row.full_geoid,
+                    row.sumlevel,
+                    row.display_name,
+                    row.population,
+                    row.priority,
+                )
+            )
+            geoms.append(bytes(row.geom))
+
+        self._entries = {}
+        self._geoms = {}
+        self._trees = {}
+        self._positions = {}
+        for sumlevel, (entries, wkbs) in by_sumlevel.items():
+            geoms = shapely.from_wkb(wkbs)
+            shapely.prepare(geoms)
+
+            self._entries[sumlevel] = entries
+            self._geoms[sumlevel] = geoms
+            self._trees[sumlevel] = STRtree(geoms)
+            for i, entry in enumerate(entries):
+                self._positions[entry.full_geoid] = (sumlevel, i)
+
+        self.states = states
+        self.sumlevels = frozenset(self._trees)
+
+        coverage = shapely.union_all(shapely.from_wkb(list(states.values())))
+        shapely.prepare(coverage)
+        self._coverage = coverage
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    @classmethod
+    def from_db(cls, db, release, state_fips: list[str]):
+        state_geoids = [f"04000US{fips}" for fips in state_fips]
+
+        states = db.execute(
+            text(
+                f"""SELECT full_geoid, ST_AsBinary(geom) AS geom
+                FROM {release}.census_name_lookup
+                WHERE full_geoid IN :geoids;"""
+            ),
+            {"geoids": tuple(state_geoids)},
+        )
+        states = {row.full_geoid: bytes(row.geom) for row in states}
+
+        # Anything containing a point in these states overlaps their extent
+        result = db.execute(
+            text(
+                f"""SELECT full_geoid, sumlevel, display_name,
+                       population, priority, ST_AsBinary(geom) AS geom
+                FROM {release}.census_name_lookup
+                WHERE geom && (
+                    SELECT ST_Extent(geom)
+                    FROM {release}.census_name_lookup
+                    WHERE full_geoid IN :geoids
+                )
+                AND sumlevel IN :sumlevels
+                AND lower(display_name) NOT LIKE :not_defined;"""
+            ),
+            {
+                "geoids": tuple(state_geoids),
+                "sumlevels": tuple(sorted(cls.LOADED_SUMLEVELS)),
+                "not_defined": "%not defined%",
+            },
+        )
+
+        return cls(result, states, cls.LOADED_SUMLEVELS)
+
+    def search(self, lat, lon, sumlevs, limit=25, offset=0):
+        """
+        Geographies in sumlevs that contain (or touch) the point, best first,
+        or None if the point or one of the sumlevs isn't loaded.
+        """
+        if not set(sumlevs) <= self.sumlevels:
+            return None
+
+        point = shapely.Point(lon, lat)
+        if not self._coverage.intersects(point):
+            return None
+
+        found = []
+        for sumlevel in sumlevs:
+            candidates = self._trees[sumlevel].query(point)
+            hits = candidates[
+                shapely.intersects(self._geoms[sumlevel][candidates], point)
+            ]
+            found.extend(self._entries[sumlevel][i] for i in np.sort(hits))
+
+        return sorted(found, key=rank)[offset : offset + limit]
+
+    def locate(self, lats, lons, sumlevs):
+        """
+        For a batch of points, the best geography in each sumlevel that
+        contains each one: a list with a {sumlevel: GeoEntry} dict per point,
+        or None for points outside the loaded states (ask the database), or
+        for every point if one of the sumlevs isn't loaded.
+        """
+        if not set(sumlevs) <= self.sumlevels:
+            return [None] * len(lats)
+
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        inside = np.flatnonzero(shapely.intersects(self._coverage, points))
+
+        located = [None] * len(points)
+        for i in inside:
+            located[i] = {}
+
+        for sumlevel in sumlevs:
+            point_ids, geom_ids = self._trees[sumlevel].query(
+                points[inside], predicate="intersects"
+            )
+            for point_id, geom_id in zip(inside[point_ids], geom_ids):
+                entry = self._entries[sumlevel][geom_id]
+                best = located[point_id].get(sumlevel)
+                if best is None or rank(entry) < rank(best):
+                    located[point_id][sumlevel] = entry
+
+        return located
+
+    def nearest(self, sumlevs, limit=10, lat=None, lon=None, geoid=None):
+        """
+        The limit geographies in sumlevs closest to a point, or to another
+        geography, as (GeoEntry, meters) pairs, closest first. Anything the
+        point is inside of is 0 meters away. None if the answer could lie
+        outside the loaded states, or geoid isn't loaded.
+
+        The trees are in degrees, so the search box grows until the
+        geographies found in it are provably closer, in meters, than
+        anything outside it could be.
+        """
+        if not set(sumlevs) <= self.sumlevels:
+            return None
+
+        if geoid is not None:
+            if geoid not in self._positions:
+                return None
+            sumlevel, i = self._positions[geoid]
+            origin = self._geoms[sumlevel][i]
+        else:
+            origin = shapely.Point(lon, lat)
+            if not self._coverage.intersects(origin):
+                return None
+
+        west, south, east, north = origin.bounds
+        radius = 0.01
+        while True:
+            search_box = shapely.box(
+                west - radius, south - radius, east + radius, north + radius
+            )
+            if not self._coverage.contains(search_box):
+                return None
+
+            found = []
+            for sumlevel in sumlevs:
+                candidates = self._trees[sumlevel].query(search_box)
+                for i in np.sort(candidates):
+                    entry = self._entries[sumlevel][i]
+                    if entry.full_geoid == geoid:
+                        continue
+                    meters = geodesic_distance(origin, self._geoms[sumlevel][i])
+                    found.append((meters, rank(entry), entry))
+
+            found.sort(key=lambda match: match[:2])
+
+            # Anything outside the box is more than radius degrees away,
+            # which is at least this many meters wherever the box is.
+            widest_lat = min(90, max(abs(south), abs(north)) + radius)
+            outside = EARTH_RADIUS * math.radians(radius) * math.cos(
+                math.radians(widest_lat)
+            )
+            if len(found) >= limit and found[limit - 1][0] <= outside:
+                return [(entry, meters) for meters, _, entry in found[:limit]]
+
+            radius *= 2
+
+
+EARTH_RADIUS = 6371008.8  # meters
+
+
+def geodesic_distance(a, b) -> float:
+    """
+    Meters between the closest points of two lon/lat geometries (0 if they
+    touch), by the haversine formula.
+    """
+    if a.intersects(b):
+        return 0.0
+
+    (lon1, lat1), (lon2, lat2) = shapely.shortest_line(a, b).coords
+    lat1, lat2 = math.radians(lat1), math.radians(lat2)
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+
+
+_prefix_indexes = {}
+_prefix_indexes_lock = threading.Lock()
+_spatial_indexes = {}
+_spatial_indexes_lock = threading.Lock()
+
+
+def get_prefix_index(release, db) -> PrefixIndex:
+    if release not in _prefix_indexes:
+        with _prefix_indexes_lock:
+            if release not in _prefix_indexes:
+                index = PrefixIndex.from_db(db, release)
+                logger.info(f"Built {release} prefix index ({len(index)} geos)")
+                _prefix_indexes[release] = index
+
+    return _prefix_indexes[release]
+
+
+def get_spatial_index(release, db, state_fips) -> SpatialIndex | None:
+    """
+    None if no states are configured, since there'd be nothing to search.
+    """
+    if not state_fips:
+        return None
+
+    if release not in _spatial_indexes:
+        with _spatial_indexes_lock:
+            if release not in _spatial_indexes:
+                index = SpatialIndex.from_db(db, release, state_fips)
+                logger.info(f"Built {release} spatial index ({len(index)} geos)")
+                _spatial_indexes[release] = index
+
+    return _spatial_indexes[release]
@@ -251,3 +251,19 @@ ALLOWED_TIGER = [
 
 allowed_searches = ["table", "profile", "topic", "all"]
 supported_formats = ['csv', 'geojson', 'shapefile', 'excel']
+
+# Pre-simplified copies of census_name_lookup.geom, built once per TIGER
+# release by build_geom_resolutions.py so endpoints don't simplify at request
+# time. Each is (column, tolerance in degrees as a SQL expression).
+GEOM_RESOLUTIONS = {
+    "low": ("geom_low", "0.001"),
+    "medium": ("geom_medium", "0.0001"),
+    "high": ("geom_high", "0.00005"),
+    "adaptive": ("geom_adaptive", "ST_Perimeter(geom) / 2500"),
+    "full": ("geom", None),
+}
+
+
+def geom_column(resolution):
+    column, _ = GEOM_RESOLUTIONS[resolution]
+    return column
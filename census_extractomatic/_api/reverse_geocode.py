@@ -0,0 +1,129 @@
+"""
+Batch reverse geocoding for POST /1.0/geo/locate: many points in, the
+containing geography in each requested sumlevel out.
+
+Points are looked up a chunk at a time, in memory where the spatial index
+covers them and with one set-based PostGIS join for the rest, and each
+chunk is written out as soon as it's done so big batches stream.
+"""
+
+from collections import namedtuple
+import csv
+import io
+import json
+
+
+Point = namedtuple("Point", ["id", "lat", "lon"])
+
+CHUNK_SIZE = 5000
+
+
+def check_point(id, lat, lon) -> Point:
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError(f"Point {id} needs a numeric lat and lon")
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Point {id} is off the map ({lat}, {lon})")
+
+    return Point(id, lat, lon)
+
+
+def parse_json_points(data) -> list[Point]:
+    """
+    Either a list of points or {"points": [...]}, where each point is an
+    object with a lat, a lon and optionally an id (otherwise its position,
+    counting from 1).
+    """
+    if isinstance(data, dict):
+        data = data.get("points")
+
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of points")
+
+    points = []
+    for n, point in enumerate(data, start=1):
+        if not isinstance(point, dict):
+            raise ValueError(f"Point {n} should be an object with a lat and lon")
+        points.append(check_point(point.get("id", n), point.get("lat"), point.get("lon")))
+
+    return points
+
+
+def parse_csv_points(body: str) -> list[Point]:
+    """
+    A CSV with a header row and lat and lon columns (or latitude and
+    longitude), and optionally an id column.
+    """
+    reader = csv.DictReader(io.StringIO(body))
+    columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+
+    lat_column = columns.get("lat") or columns.get("latitude")
+    lon_column = columns.get("lon") or columns.get("longitude")
+    id_column = columns.get("id")
+    if not (lat_column and lon_column):
+        raise ValueError("The CSV needs lat and lon columns")
+
+    return [
+        check_point(row[id_column] if id_column else n, row[lat_column], row[lon_column])
+        for n, row in enumerate(reader, start=1)
+    ]
+
+
+def reverse_geocode(points, locate_in_memory, locate_in_db, chunk_size=CHUNK_SIZE):
+    """
+    Yields (point, {sumlevel: full_geoid}) for each point, in order.
+
+    locate_in_memory(lats, lons) returns a {sumlevel: full_geoid} dict or
+    None (not covered) per point; locate_in_db(lats, lons) a dict per point.
+    """
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start : start + chunk_size]
+        lats = [point.lat for point in chunk]
+        lons = [point.lon for point in chunk]
+
+        located = locate_in_memory(lats, lons)
+
+        missing = [i for i, found in enumerate(located) if found is None]
+        if missing:
+            from_db = locate_in_db(
+                [lats[i] for i in missing], [lons[i] for i in missing]
+            )
+            for i, found in zip(missing, from_db):
+                located[i] = found
+
+        yield from zip(chunk, located)
+
+
+def ndjson_lines(results, sumlevs):
+    for point, geoids in results:
+        yield json.dumps(
+            {
+                "id": point.id,
+                "lat": point.lat,
+                "lon": point.lon,
+                "geoids": {sumlevel: geoids.get(sumlevel) for sumlevel in sumlevs},
+            }
+        ) + "\n"
+
+
+def csv_lines(results, sumlevs):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(["id", "lat", "lon"] + [f"geoid_{sumlevel}" for sumlevel in sumlevs])
+    yield flush()
+
+    for point, geoids in results:
+        writer.writerow(
+            [point.id, point.lat, point.lon]
+            + [geoids.get(sumlevel, "") for sumlevel in sumlevs]
+        )
+        yield flush()
@@ -0,0 +1,263 @@
+"""
+In-memory inverted indexes over census_table_metadata and
+census_column_metadata, one per release, so table search doesn't scan the
+metadata tables (or run to_tsvector on every title) for each request.
+
+Like the geography indexes, these are built when a worker starts (see
+build_search_indexes in api.py), or on the first search of a release that
+wasn't built up front, and never change afterwards. They also serve as the
+catalog of which tables and columns exist, so /validate-program can check
+variables without a query.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+import logging
+import math
+import re
+import threading
+
+from sqlalchemy import text
+
+from .trigram import FALLBACK_BELOW, TrigramIndex
+
+
+logger = logging.getLogger()
+
+
+ColumnEntry = namedtuple(
+    "ColumnEntry", ["column_id", "column_title", "indent", "parent_column_id"]
+)
+
+# Where a word turns up says a lot about how relevant the table is: a match
+# in the title counts four times as much as one in a column title.
+TABLE_FIELD_WEIGHTS = {
+    "table_title": 4.0,
+    "simple_table_title": 4.0,
+    "topics": 2.0,
+    "universe": 1.5,
+}
+COLUMN_TITLE_WEIGHT = 1.0
+
+# The last word of a query is treated as a prefix (people are still typing
+# it), but a one letter prefix shouldn't pull in half the vocabulary.
+MAX_PREFIX_EXPANSION = 50
+
+STOPWORDS = frozenset(
+    ["a", "an", "and", "by", "for", "in", "of", "on", "or", "the", "to", "with"]
+)
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def stem(word):
+    """
+    Just enough stemming that plurals match: 'families' -> 'family',
+    'households' -> 'household'.
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(value) -> list[str]:
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        value = " ".join(item for item in value if item)
+
+    return [
+        stem(word) for word in WORD.findall(value.lower()) if word not in STOPWORDS
+    ]
+
+
+class TableIndex:
+    def __init__(self, tables, columns):
+        self.tables = {row.table_id: row for row in tables}
+        self._ids = sorted((table_id.lower(), table_id) for table_id in self.tables)
+
+        self.columns = defaultdict(list)
+        for row in columns:
+            self.columns[row.table_id].append(
+                ColumnEntry(
+                    row.column_id, row.column_title, row.indent, row.parent_column_id
+                )
+            )
+        for table_columns in self.columns.values():
+            table_columns.sort()
+
+        # For checking that variables exist without going to the database
+        self._table_ids = {table_id.lower() for table_id in self.tables}
+        self._column_ids = {
+            column.column_id.lower()
+            for table_columns in self.columns.values()
+            for column in table_columns
+        }
+
+        postings = defaultdict(lambda: defaultdict(float))
+        for table_id, table in self.tables.items():
+            for field, weight in TABLE_FIELD_WEIGHTS.items():
+                for word in tokenize(getattr(table, field, None)):
+                    postings[word][table_id] += weight
+
+            # Once per table, so tables with hundreds of columns don't win
+            # just by repeating 'Male:' and 'Female:' a lot.
+            column_words = {
+                word
+                for column in self.columns[table_id]
+                for word in tokenize(column.column_title)
+            }
+            for word in column_words:
+                postings[word][table_id] += COLUMN_TITLE_WEIGHT
+
+        table_count = len(self.tables)
+        self._postings = {
+            word: (math.log(1 + table_count / len(tables)), dict(tables))
+            for word, tables in postings.items()
+        }
+        self._vocabulary = sorted(self._postings)
+
+        self._title_ids = list(self.tables)
+        self._titles = TrigramIndex(
+            self.tables[table_id].table_title for table_id in self._title_ids
+        )
+
+    def __len__(self):
+        return len(self.tables)
+
+    @classmethod
+    def from_db(cls, db, release):
+        tables = db.execute(
+            text(f"SELECT * FROM {release}.census_table_metadata;")
+        ).fetchall()
+        columns = db.execute(
+            text(
+                f"""SELECT table_id, column_id, column_title, indent, parent_column_id
+                FROM {release}.census_column_metadata;"""
+            )
+        ).fetchall()
+
+        return cls(tables, columns)
+
+    def _expand(self, word, prefix):
+        if not prefix:
+            return [word] if word in self._postings else []
+
+        start = bisect_left(self._vocabulary, word)
+        end = bisect_left(self._vocabulary, word + "\uffff", lo=start)
+
+        return self._vocabulary[start:end][:MAX_PREFIX_EXPANSION]
+
+    def rank(self, q) -> list[tuple[tuple, str]]:
+        """
+        (sort key, table_id) for every table matching any word of q. Tables
+        matching more of the words come first, then by tf-idf style score.
+        The sort keys are on roughly the same scale for every release, so
+        results from several indexes can be merged.
+
+        When few tables match, tables with a title similar to q (misspelled
+        words) are added after them, most similar first.
+        """
+        words = tokenize(q)
+        if not words:
+            return []
+
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for position, word in enumerate(words):
+            is_last = position == len(words) - 1
+
+            best = {}
+            for expanded in self._expand(word, prefix=is_last):
+                idf, tables = self._postings[expanded]
+                for table_id, weight in tables.items():
+                    best[table_id] = max(best.get(table_id, 0), idf * weight)
+
+            for table_id, score in best.items():
+                scores[table_id] += score
+                matched[table_id] += 1
+
+        ranked = sorted(
+            ((-matched[table_id], -scores[table_id], table_id), table_id)
+            for table_id in scores
+        )
+        if len(ranked) >= FALLBACK_BELOW:
+            return ranked
+
+        for similarity, table_id in self._similar_titles(q):
+            if table_id not in scores:
+                ranked.append(((0, -similarity, table_id), table_id))
+
+        return sorted(ranked)
+
+    def _similar_titles(self, q) -> list[tuple[float, str]]:
+        return sorted(
+            (
+                (similarity, self._title_ids[i])
+                for similarity, i in self._titles.search(q)
+            ),
+            key=lambda match: (-match[0], match[1]),
+        )
+
+    def similar_tables(self, q, limit=5, offset=0):
+        """
+        Table metadata rows with a title similar to q, most similar first,
+        the same as search_tables_by_similarity without going to the
+        database.
+        """
+        similar = self._similar_titles(q)[offset : offset + limit]
+        return [self.tables[table_id] for _, table_id in similar]
+
+    def search_tables(self, q, limit=5, offset=0):
+        """
+        Ranked table metadata rows (as stored in census_table_metadata).
+        """
+        ranked = self.rank(q)[offset : offset + limit]
+        return [self.tables[table_id] for _, table_id in ranked]
+
+    def has_table(self, table_id) -> bool:
+        return table_id.lower() in self._table_ids
+
+    def has_column(self, column_id) -> bool:
+        return column_id.lower() in self._column_ids
+
+    def tables_by_id_prefix(self, prefix):
+        prefix = prefix.lower()
+        start = bisect_left(self._ids, (prefix,))
+        end = bisect_left(self._ids, (prefix + "\uffff",), lo=start)
+
+        return [self.tables[table_id] for _, table_id in self._ids[start:end]]
+
+
+_table_indexes = {}
+_table_indexes_lock = threading.Lock()
+
+
+def find_missing(variables, indexes) -> tuple[set[str], set[str]]:
+    """
+    Of variables like 'B01001001' (a table id and a three digit column
+    number), the tables none of indexes has, and the columns none of them
+    has among the tables that are there. Both upper case.
+    """
+    missing_tables, missing_columns = set(), set()
+    for variable in variables:
+        table_id = variable[:-3]
+        if not any(index.has_table(table_id) for index in indexes):
+            missing_tables.add(table_id.upper())
+        elif not any(index.has_column(variable) for index in indexes):
+            missing_columns.add(variable.upper())
+
+    return missing_tables, missing_columns
+
+
+def get_table_index(release, db) -> TableIndex:
+    if release not in _table_indexes:
+        with _table_indexes_lock:
+            if release not in _table_indexes:
+                index = TableIndex.from_db(db, release)
+                logger.info(f"Built {release} table index ({len(index)} tables)")
+                _table_indexes[release] = index
+
+    return _table_indexes[release]
@@ -0,0 +1,185 @@
+"""
+Pre-rendered vector tiles live in MBTiles files (one per TIGER release and
+summary level) so the tile endpoint can hand them out without touching
+PostGIS. The format is just SQLite with a fixed schema:
+
+    https://github.com/mapbox/mbtiles-spec/blob/master/1.3/spec.md
+
+Two quirks of the spec to keep in mind:
+
+- Rows are stored in TMS order, which counts up from the south, while the
+  endpoint (and ViewportLocation) count down from the north.
+- Vector tile data is stored gzipped, so stored tiles are served with a
+  'Content-Encoding: gzip' header instead of being decompressed (unless
+  the client doesn't accept gzip).
+
+Each web worker thread keeps its stores open between requests (see
+read_stored_tile) rather than opening the file for every tile.
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name text, value text);
+CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level  integer,
+    tile_column integer,
+    tile_row    integer,
+    tile_data   blob
+);
+CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+    ON tiles (zoom_level, tile_column, tile_row);
+"""
+
+
+def tile_store_path(directory, release, sumlevel):
+    return os.path.join(directory, f"{release}_{sumlevel}.mbtiles")
+
+
+def tms_row(zoom, y):
+    return 2**zoom - 1 - y
+
+
+class MBTilesStore:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open an existing store read-only, or return None if the tiles for
+        this release & sumlevel haven't been rendered.
+        """
+        if not os.path.exists(path):
+            return None
+
+        return cls(sqlite3.connect(f"file:{path}?mode=ro", uri=True))
+
+    @classmethod
+    def create(cls, path, name, bounds, min_zoom, max_zoom, layer="boundaries"):
+        connection = sqlite3.connect(path)
+        connection.executescript(SCHEMA)
+
+        store = cls(connection)
+        store.set_metadata(
+            {
+                "name": name,
+                "format": "pbf",
+                "type": "overlay",
+                "bounds": ",".join(str(val) for val in bounds),
+                "minzoom": str(min_zoom),
+                "maxzoom": str(max_zoom),
+                "json": json.dumps(
+                    {
+                        "vector_layers": [
+                            {
+                                "id": layer,
+                                "fields": {"geoid": "String", "name": "String"},
+                                "minzoom": min_zoom,
+                                "maxzoom": max_zoom,
+                            }
+                        ]
+                    }
+                ),
+            }
+        )
+
+        return store
+
+    def set_metadata(self, metadata: dict[str, str]):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?);",
+                metadata.items(),
+            )
+
+    def metadata(self) -> dict[str, str]:
+        rows = self.connection.execute("SELECT name, value FROM metadata;")
+        return dict(rows.fetchall())
+
+    def put_many(self, tiles):
+        """
+        Takes (zoom, x, y, tile) tuples with uncompressed tile bytes. Empty
+        tiles are stored too, otherwise the endpoint would keep falling back
+        to live rendering for every tile with nothing in it.
+        """
+        with self.connection:
+            self.connection.executemany(
+                """INSERT OR REPLACE INTO tiles
+                   (zoom_level, tile_column, tile_row, tile_data)
+                   VALUES (?, ?, ?, ?);""",
+                (
+                    (zoom, x, tms_row(zoom, y), gzip.compress(tile))
+                    for zoom, x, y, tile in tiles
+                ),
+            )
+
+    def get(self, zoom, x, y) -> bytes | None:
+        """
+        Returns the gzipped tile, or None if the tile was never rendered.
+        """
+        row = self.connection.execute(
+            """SELECT tile_data
+               FROM tiles
+               WHERE zoom_level=? AND tile_column=? AND tile_row=?;""",
+            (zoom, x, tms_row(zoom, y)),
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+_open_stores = threading.local()
+
+
+def _get_store(path) -> MBTilesStore | None:
+    """
+    This thread's read-only store for path, opened the first time it's
+    needed. sqlite3 connections can't be shared between threads. A file
+    that's been replaced (re-rendered and moved into place) is opened again.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    stores = getattr(_open_stores, "stores", None)
+    if stores is None:
+        stores = _open_stores.stores = {}
+
+    version = (stat.st_ino, stat.st_dev)
+    opened = stores.get(path)
+    if opened is not None:
+        if opened[0] == version:
+            return opened[1]
+        opened[1].close()
+
+    store = MBTilesStore.open(path)
+    if store is not None:
+        stores[path] = (version, store)
+    return store
+
+
+def read_stored_tile(directory, release, sumlevel, zoom, x, y) -> bytes | None:
+    if not directory:
+        return None
+
+    store = _get_store(tile_store_path(directory, release, sumlevel))
+    if store is None:
+        return None
+
+    return store.get(zoom, x, y)
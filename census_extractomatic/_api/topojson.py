@@ -0,0 +1,239 @@
+"""
+A small TopoJSON encoder for the endpoints that send back lots of adjacent
+geographies at once (all the tracts in a county, etc.).
+
+    https://github.com/topojson/topojson-specification
+
+GeoJSON repeats every shared border once for each side. Here the coordinates
+are quantized to an integer grid, each border is stored once as an 'arc', and
+each arc is delta-encoded, so neighboring polygons mostly refer to the same
+short lists of small integers.
+
+Only Polygon and MultiPolygon geometries are supported since that's all
+census_name_lookup holds.
+"""
+
+DEFAULT_QUANTIZATION = 100_000
+
+
+def topology(objects, quantization=DEFAULT_QUANTIZATION):
+    """
+    Takes {object name: [GeoJSON feature, ...]} and returns a TopoJSON
+    Topology dict. Every object shares the same pool of arcs, so a parent
+    and its children can go in separate objects without repeating the
+    parent's outline.
+
+    A feature's 'id' and 'properties' are carried over to its geometry.
+    """
+    objects = {name: list(features) for name, features in objects.items()}
+
+    quantize, transform = _quantizer(
+        [feature["geometry"] for features in objects.values() for feature in features],
+        quantization,
+    )
+
+    # Quantize first so the junction search sees exactly the points that
+    # will end up in the arcs.
+    shapes = {
+        name: [_quantize_geometry(feature["geometry"], quantize) for feature in features]
+        for name, features in objects.items()
+    }
+
+    rings = [
+        ring
+        for polygons_by_feature in shapes.values()
+        for polygons in polygons_by_feature
+        for polygon in polygons or []
+        for ring in polygon
+    ]
+    junctions = _find_junctions(rings)
+    arcs = _ArcIndex()
+
+    topo_objects = {}
+    for name, features in objects.items():
+        geometries = []
+        for feature, polygons in zip(features, shapes[name]):
+            geometry = _encode_geometry(feature, polygons, junctions, arcs)
+            geometries.append(geometry)
+
+        topo_objects[name] = {"type": "GeometryCollection", "geometries": geometries}
+
+    return {
+        "type": "Topology",
+        "transform": transform,
+        "objects": topo_objects,
+        "arcs": [_delta_encode(arc) for arc in arcs.arcs],
+    }
+
+
+def _polygons(geometry):
+    if geometry is None:
+        return None
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+
+    raise ValueError(f"Can't encode {geometry['type']} geometries as TopoJSON")
+
+
+def _quantizer(geometries, quantization):
+    xs, ys = [], []
+    for geometry in geometries:
+        for polygon in _polygons(geometry) or []:
+            for ring in polygon:
+                for x, y, *_ in ring:
+                    xs.append(x)
+                    ys.append(y)
+
+    if not xs:
+        return (lambda point: point), {"scale": [1, 1], "translate": [0, 0]}
+
+    x0, y0 = min(xs), min(ys)
+    # A single point (or a perfectly flat box) would give a zero scale
+    kx = (max(xs) - x0) / (quantization - 1) or 1
+    ky = (max(ys) - y0) / (quantization - 1) or 1
+
+    def quantize(point):
+        return (round((point[0] - x0) / kx), round((point[1] - y0) / ky))
+
+    return quantize, {"scale": [kx, ky], "translate": [x0, y0]}
+
+
+def _quantize_ring(ring, quantize):
+    points = []
+    for point in ring:
+        point = quantize(point)
+        if not points or points[-1] != point:
+            points.append(point)
+
+    # Rings are stored open here; the closing point is added back per arc.
+    while len(points) > 1 and points[-1] == points[0]:
+        points.pop()
+
+    return points
+
+
+def _quantize_geometry(geometry, quantize):
+    """
+    Returns a list of polygons, each a list of open rings, dropping rings
+    that collapse to fewer than three points at this quantization (and any
+    polygon whose exterior collapses).
+    """
+    polygons = _polygons(geometry)
+    if polygons is None:
+        return None
+
+    quantized = []
+    for polygon in polygons:
+        rings = [_quantize_ring(ring, quantize) for ring in polygon]
+        if len(rings[0]) < 3:
+            continue
+        quantized.append([ring for ring in rings if len(ring) >= 3])
+
+    return quantized
+
+
+def _find_junctions(rings):
+    """
+    A junction is a point where two lines meet or part ways, which shows up
+    as the point being visited with different neighbors on different passes.
+    A border shared by two polygons is walked in opposite directions, so the
+    neighbors are compared without regard to order.
+    """
+    neighbors = {}
+    junctions = set()
+
+    for ring in rings:
+        count = len(ring)
+        for i, point in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % count]))
+            if neighbors.setdefault(point, pair) != pair:
+                junctions.add(point)
+
+    return junctions
+
+
+def _cut_ring(ring, junctions):
+    """
+    Split a ring into arcs that run from junction to junction. A ring with
+    no junctions is a single closed arc, started at its smallest point so
+    that the same ring seen from the other side dedupes against it.
+    """
+    starts = [i for i, point in enumerate(ring) if point in junctions]
+
+    if not starts:
+        start = min(range(len(ring)), key=ring.__getitem__)
+        rotated = ring[start:] + ring[:start]
+        return [rotated + [rotated[0]]]
+
+    start = starts[0]
+    rotated = ring[start:] + ring[:start] + [ring[start]]
+
+    arcs = []
+    current = [rotated[0]]
+    for point in rotated[1:]:
+        current.append(point)
+        if point in junctions:
+            arcs.append(current)
+            current = [point]
+
+    return arcs
+
+
+class _ArcIndex:
+    def __init__(self):
+        self.arcs = []
+        self._index = {}
+
+    def get(self, arc):
+        """
+        The arc's index, or its one's complement if the arc is already
+        stored running the other way (per the spec).
+        """
+        key = tuple(arc)
+
+        if key in self._index:
+            return self._index[key]
+
+        reverse = key[::-1]
+        if reverse in self._index:
+            return ~self._index[reverse]
+
+        self._index[key] = len(self.arcs)
+        self.arcs.append(key)
+
+        return self._index[key]
+
+
+def _encode_geometry(feature, polygons, junctions, arcs):
+    if not polygons:
+        geometry = {"type": None}
+    else:
+        encoded = [
+            [[arcs.get(arc) for arc in _cut_ring(ring, junctions)] for ring in polygon]
+            for polygon in polygons
+        ]
+
+        if feature["geometry"]["type"] == "Polygon":
+            geometry = {"type": "Polygon", "arcs": encoded[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "arcs": encoded}
+
+    if "id" in feature:
+        geometry["id"] = feature["id"]
+    if feature.get("properties"):
+        geometry["properties"] = feature["properties"]
+
+    return geometry
+
+
+def _delta_encode(arc):
+    x, y = arc[0]
+    encoded = [[x, y]]
+
+    for next_x, next_y in arc[1:]:
+        encoded.append([next_x - x, next_y - y])
+        x, y = next_x, next_y
+
+    return encoded
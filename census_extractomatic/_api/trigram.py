@@ -0,0 +1,167 @@
+"""
+An in-memory trigram index for typo tolerant lookups, the in-process
+equivalent of pg_trgm's word_similarity (see
+migrations/0004_add_trigram_indexes.sql for the database side).
+
+Trigrams are made the way pg_trgm makes them: lowercase each word, pad it
+with two spaces in front and one behind, and take every three characters,
+so 'Hamtramk' still shares most of its trigrams with 'Hamtramck'.
+"""
+
+from collections import defaultdict
+import re
+
+import numpy as np
+from sqlalchemy import text
+
+
+# pg_trgm's default word_similarity_threshold is 0.6, which is too strict
+# for a couple of typos ('houshold incme' is 0.56 in 'Household Income').
+DEFAULT_THRESHOLD = 0.4
+
+# Fuzzy matches are only looked for when the exact (or prefix) search finds
+# fewer results than this.
+FALLBACK_BELOW = 5
+
+# How many of the texts sharing the most trigrams with a query get their
+# similarity worked out exactly.
+MAX_CANDIDATES = 1000
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def words(value) -> list[str]:
+    return WORD.findall(value.lower())
+
+
+def word_trigrams(word) -> list[str]:
+    """The word's trigrams in order (repeats included)."""
+    padded = f"  {word} "
+    return [padded[i : i + 3] for i in range(len(padded) - 2)]
+
+
+def trigrams(value) -> set[str]:
+    return set().union(*(word_trigrams(word) for word in words(value)))
+
+
+def word_similarity(q, value) -> float:
+    """
+    pg_trgm's word_similarity(q, value), from 0 to 1: the greatest
+    similarity between q's set of trigrams and any continuous extent of
+    value's trigrams in order, not necessarily whole words. An extent's
+    similarity is the trigrams it shares with q over all the (distinct)
+    trigrams in either. The extents tried are the ones pg_trgm tries
+    (iterate_word_similarity in trgm_op.c), so the two give the same score.
+    """
+    query = trigrams(q)
+    if not query:
+        return 0.0
+
+    ordered = [trigram for word in words(value) for trigram in word_trigrams(word)]
+
+    best = 0.0
+    lower = -1
+    shared = distinct = 0
+    # Last position of each trigram in the current extent
+    last = {}
+
+    for upper, trigram in enumerate(ordered):
+        # Extents start at a trigram that's in q
+        if lower >= 0 or trigram in query:
+            if trigram not in last:
+                distinct += 1
+                shared += trigram in query
+            last[trigram] = upper
+
+        # ... and end at one
+        if trigram not in query:
+            continue
+
+        if lower < 0:
+            lower = upper
+
+        similarity = shared / (len(query) + distinct - shared)
+
+        # See if starting the extent later does better
+        new_lower = lower
+        trial_shared, trial_distinct = shared, distinct
+        for start in range(lower, upper + 1):
+            trial = trial_shared / (len(query) + trial_distinct - trial_shared)
+            if trial > similarity:
+                similarity = trial
+                new_lower, shared, distinct = start, trial_shared, trial_distinct
+
+            if last[ordered[start]] == start:
+                trial_distinct -= 1
+                trial_shared -= ordered[start] in query
+
+        for start in range(lower, new_lower):
+            if last[ordered[start]] == start:
+                del last[ordered[start]]
+        lower = new_lower
+
+        best = max(best, similarity)
+
+    return best
+
+
+class TrigramIndex:
+    """
+    Texts by position, with a posting array of positions per trigram. Texts
+    sharing the most trigrams with the query are scored with word_similarity.
+    """
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+
+        postings = defaultdict(list)
+        for i, value in enumerate(self.texts):
+            for trigram in trigrams(value or ""):
+                postings[trigram].append(i)
+
+        self._postings = {
+            trigram: np.array(ids, dtype=np.int32)
+            for trigram, ids in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(self, q, threshold=DEFAULT_THRESHOLD) -> list[tuple[float, int]]:
+        """
+        (similarity, position) of every text at least threshold similar to
+        q, most similar first.
+        """
+        query = trigrams(q)
+        found = [self._postings[t] for t in query if t in self._postings]
+        if not found:
+            return []
+
+        shared = np.bincount(np.concatenate(found), minlength=len(self.texts))
+
+        # A text can't be threshold similar without sharing at least this
+        # share of q's trigrams.
+        candidates = np.flatnonzero(shared >= threshold * len(query))
+        if len(candidates) > MAX_CANDIDATES:
+            best = np.argsort(-shared[candidates], kind="stable")[:MAX_CANDIDATES]
+            candidates = candidates[best]
+
+        scored = [
+            (word_similarity(q, self.texts[i]), int(i)) for i in candidates
+        ]
+
+        return sorted(
+            (match for match in scored if match[0] >= threshold),
+            key=lambda match: (-match[0], match[1]),
+        )
+
+
+def set_similarity_threshold(db, threshold=DEFAULT_THRESHOLD):
+    """
+    Use threshold for pg_trgm's <% operator for the rest of the current
+    transaction, so the database and in-memory fallbacks agree.
+    """
+    db.execute(
+        text("SELECT set_config('pg_trgm.word_similarity_threshold', :t, true);"),
+        {"t": str(threshold)},
+    )
@@ -2,39 +2,73 @@
 """
 Classes in this file serve as rough module boundaries.
 
-- Indicators are either variables, or 'cooked' formulas with lesp
+- Indicators are either variables, or 'cooked' formulas (see formulas.py)
 - Variables are raw values from the db
 
 """
 
 
+from contextlib import contextmanager
+import time
+
+from psycopg2.errors import QueryCanceled
 from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 import tomli
 from pypika import (
     Query,
     Table,
     Column,
     Schema,
-    Parameter,
-    AliasedQuery,
     CustomFunction,
 )
-from pypika import functions as fn
-from collections import defaultdict
-import pandas as pd
-from lesp.core import execute
-from lesp.analyze import extract_variables, validate_program, LespCompileError
-from .datatypes import make_maybe, Empty, TearValue, serialize_maybes
+from collections import namedtuple
+import heapq
+from .datatypes import TearColumn, fetch_columns
+from .formulas import compile_formula, Formula, FormulaError, Plan
+from .tearsheet_namespaces import (
+    namespace_cache,
+    namespace_key,
+    extend_namespace,
+    NamespaceEntry,
+)
+from .tearsheet_workers import (
+    build_records,
+    check_sheet_size,
+    compute_sheet,
+    TearsheetLimitError,
+    MAX_TEARSHEET_CELLS,
+    TEARSHEET_TIME_LIMIT,
+)
+from ._api.reference import geom_column
+from ._api.table_index import find_missing, get_table_index
+from ._api.containment import find_within
 
 
 DEFAULT_ACS_YEAR = "acs2022_5yr"
 DEFAULT_D3_YEAR = "d3_2024"
 
 
+IndicatorSearchRow = namedtuple(
+    "IndicatorSearchRow",
+    ["table_id", "table_title", "column_id", "column_title", "indent"],
+)
+
+
 with open("config.toml", "rb") as f:
     conf = tomli.load(f)
 
 
+@contextmanager
+def timed(timings: dict, stage: str):
+    """Record how long the block took, in milliseconds, as timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+
 class Indicator:
     special_variables = {
         "land_area": "aland",
@@ -42,20 +76,11 @@ class Indicator:
         "geom": "geom",
     }
 
-    acs_schema = Schema(DEFAULT_ACS_YEAR)
-    d3_schema = Schema(DEFAULT_D3_YEAR)
-
-    unified_table_q = unified_table_q = Query.from_(
-        acs_schema.census_table_metadata
-    ).select("*") + Query.from_(d3_schema.census_table_metadata).select(
-        "*"
-    )
-
     @staticmethod
     def validate_indicator(formula: str) -> tuple[bool, str]:
         try:
-            validate_program(formula)
-        except LespCompileError as e:
+            compile_formula(formula)
+        except FormulaError as e:
             return (False, e.args[0])
 
         return (True, "")
@@ -64,26 +89,23 @@ class Indicator:
     def prep_ind_request(
         cls,
         indicators: list[str],
-    ) -> tuple[list[tuple[str, str]], list[str]]:
+    ) -> tuple[list[tuple[str, Formula]], list[str]]:
         formulae = []
         variables = []
         for ind in indicators:
-            if "|" in ind:  # lesp strings have to be aliased
+            if "|" in ind:  # formulas have to be aliased
                 title, function = ind.split("|")
 
                 if title in cls.special_variables:
                     raise ValueError(
                         f"'{title}' is a reserved indicator name, choose something else."
                     )
-
-                formulae.append((title, function.lower()))
-                variables.extend(
-                    [var.lower() for var in extract_variables(function)]
-                )
             else:
-                formulae.append((ind, ind.lower()))
-                variables.append(ind.lower())
-                # TODO: This needs to be validated further!
+                title, function = ind, ind
+
+            formula = compile_formula(function)
+            formulae.append((title, formula))
+            variables.extend(formula.variables)
 
         return formulae, variables
 
@@ -121,73 +143,99 @@ class Indicator:
 
 
     @classmethod
-    def explain(*args, **kwargs):
+    def explain(cls, prepared_geos, formulae, variables, db, release, timings):
+        """
+        Run a tearsheet request one stage at a time, adding each stage's wall
+        time to timings, and report what it pulled and how: the tables and
+        columns, the query with Postgres's EXPLAIN (ANALYZE, BUFFERS) for it,
+        and the plan the indicators were computed with.
+        """
+        variables = list(dict.fromkeys(variables))
+        query = cls.namespace_query(prepared_geos, variables)
+
+        db.execute(
+            text("SET search_path TO :acs, d3_2024, d3_present, public;"),
+            {"acs": release},
+        )
+
+        with timed(timings, "fetch"):
+            columns = fetch_columns(db.execute(text(query)))
+
+        query_plan = db.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + query))
+
+        with timed(timings, "wrap"):
+            namespace = cls.wrap_values(columns, variables)
+
+        plan = Plan(formulae)
+        with timed(timings, "evaluate"):
+            results = plan.evaluate(namespace)
+
+        with timed(timings, "serialize"):
+            build_records(namespace, results)
+
         return {
-            "apology": "It would be lovely if this feature were working, but it just isn't yet."
+            "release": release,
+            "rows": len(namespace["geoid"]),
+            "tables": sorted(
+                {var[:-3] for var in variables if var not in cls.special_variables}
+            ),
+            "columns": [name for name in columns if name not in ("geoid", "name")],
+            "sql": query,
+            "query_plan": [row[0] for row in query_plan],
+            "indicators": [
+                {
+                    "name": ind_name,
+                    "formula": formula.text,
+                    "variables": sorted(formula.variables),
+                    "steps": formula.describe(),
+                }
+                for ind_name, formula in formulae
+            ],
+            "plan": plan.describe(),
         }
 
     @classmethod
     def wrap_values(
-        cls, dataframe: pd.DataFrame, variables: list[str], geom=False
-    ) -> pd.DataFrame:
+        cls, columns: dict, variables: list[str], geom=False
+    ) -> dict:
         """
-        Wrap up dataframe into combined estimate and moes for combination.
+        Wrap up each variable's estimates and moes (columns as they come
+        from fetch_columns) into a TearColumn for combination. The
+        namespace maps variable names to their columns, with geoid, name
+        (and geom) passed through as arrays.
         """
 
-        wrapped_rows = []
-        for _, row in dataframe.iterrows():
-            """
-            Remember that we're fully iterating, so each row should be
-            handled at the value level.
-            """
-            wrapped_row = {}
-            wrapped_row["geoid"] = row["geoid"]
-            wrapped_row["name"] = row["name"]
-
-            if geom:
-                wrapped_row["geom"] = row["geom"]
-
-            for var in variables:
-                if var in cls.special_variables:
-
-                    # Get the special var real name if alias is provided
-                    # otherwise use the name provided.
-                    real_var_name = cls.special_variables.get(var, var)
-
-                    # Special variables don't have errors
-                    wrapped_row[var] = TearValue(
-                        make_maybe(row[real_var_name]), make_maybe(0)
-                    )
-                else:
-                    value = row[var]
-                    # The census returns large negative values sometimes
-                    if (not value) or (value < -1000):
-                        value = Empty()
-                    else:
-                        value = make_maybe(value)
+        namespace = {
+            "geoid": columns["geoid"],
+            "name": columns["name"],
+        }
 
-                    error = row[var + "_moe"]
-                    # Negative errors don't make sense, so default to empty
-                    if (not error) or (error < 0):
-                        error = Empty()
-                    else:
-                        error = make_maybe(error)
+        if geom:
+            namespace["geom"] = columns["geom"]
 
-                    wrapped_row[var] = TearValue(value, error)
+        for var in variables:
+            if var in cls.special_variables:
+                # Get the special var real name if alias is provided
+                # otherwise use the name provided.
+                real_var_name = cls.special_variables.get(var, var)
 
-            wrapped_rows.append(wrapped_row)
+                # Special variables don't have errors
+                namespace[var] = TearColumn.wrap(columns[real_var_name])
+            else:
+                namespace[var] = TearColumn.wrap(
+                    columns[var], columns[var + "_moe"]
+                )
 
-        return pd.DataFrame(wrapped_rows)
+        return namespace
 
     @classmethod
-    def create_namespace(
+    def namespace_query(
         cls,
         prepared_geos: list[str],
         variables: list[str],
-        db,
-        release: str,
         geom=False,
-    ):
+        resolution="full",
+    ) -> str:
         st_asgeojson = CustomFunction("ST_AsGeoJSON", ["geom"])
 
         tables = {
@@ -222,7 +270,9 @@ class Indicator:
             # I don't like this nesting
             if geom:
                 stmt = stmt.select(
-                    st_asgeojson(tiger2022.census_name_lookup.geom).as_("geom")
+                    st_asgeojson(
+                        tiger2022.census_name_lookup[geom_column(resolution)]
+                    ).as_("geom")
                 )
 
             if specials:
@@ -235,30 +285,20 @@ class Indicator:
 
         stmt = stmt.where(geoheader.geoid.isin(prepared_geos))
 
-        db.execute(
-            text("SET search_path TO :acs, d3_2024, d3_present, public;"),
-            {"acs": release},
-        )
-
-        return Indicator.wrap_values(
-            pd.read_sql(text(str(stmt)), db), variables, geom=geom
-        )
+        return str(stmt)
 
     @classmethod
-    def identify_missing_tables(cls, variables, db, release=DEFAULT_ACS_YEAR):
-        tables = {
-            var[:-3].upper()
-            for var in variables
-            if var not in cls.special_variables
-        }
-
-        unified_tables = AliasedQuery("unified_tables")
-
-        match_tables = (
-            Query.with_(cls.unified_table_q, "unified_tables")
-            .from_(unified_tables)
-            .select(unified_tables.table_id)
-            .where(fn.Upper(unified_tables.table_id).isin(Parameter(":tables")))
+    def create_namespace(
+        cls,
+        prepared_geos: list[str],
+        variables: list[str],
+        db,
+        release: str,
+        geom=False,
+        resolution="full",
+    ):
+        query = cls.namespace_query(
+            prepared_geos, variables, geom=geom, resolution=resolution
         )
 
         db.execute(
@@ -266,122 +306,116 @@ class Indicator:
             {"acs": release},
         )
 
-        rows = db.execute(text(str(match_tables)), {"tables": tuple(tables)})
-
-        available_tables = {table.table_id for table in rows}
-
-        missing_tables = (
-            tables - available_tables
-        )  # This set operations shows elements in a that aren't in b
-
-        return missing_tables
-
-    @staticmethod
-    def compile(prepared_geos, formulae, variables, db, release, geom=False):
-        namespace = Indicator.create_namespace(
-            prepared_geos, variables, db, release, geom=geom
+        return Indicator.wrap_values(
+            fetch_columns(db.execute(text(query))), variables, geom=geom
         )
-        non_formula_vars = ["geoid", "name"]
-
-        if geom:
-            non_formula_vars.append("geom")
 
-        calculated_rows = pd.concat(
-            [namespace[non_formula_vars]]
-            + [
-                execute(arithmetic, namespace).rename(name.lower())
-                for name, arithmetic in formulae
-            ],
-            axis=1,
+    @classmethod
+    def identify_missing_variables(cls, variables, db, release=DEFAULT_ACS_YEAR):
+        """
+        The tables that aren't in the release (or the D3 tables), and the
+        columns that aren't in the tables that are, checked against the
+        in-memory table catalog.
+        """
+        return find_missing(
+            [var for var in variables if var not in cls.special_variables],
+            [get_table_index(release, db), get_table_index(DEFAULT_D3_YEAR, db)],
         )
 
-        result = []
-        for row in calculated_rows.to_dict(orient="records"):
-            record = {}
-            record["geoid"] = row["geoid"]
-            record["name"] = row["name"]
+    @staticmethod
+    def compile(
+        prepared_geos,
+        formulae,
+        variables,
+        db,
+        release,
+        geom=False,
+        resolution="full",
+        deadline=None,
+        reuse_namespace=True,
+    ):
+        if deadline is None:
+            deadline = time.monotonic() + TEARSHEET_TIME_LIMIT
+
+        key = namespace_key(prepared_geos, release, geom=geom, resolution=resolution)
+        entry = namespace_cache.get(key) if reuse_namespace else None
+
+        namespace = None
+        computed = {}
+        if entry is not None:
+            # Only pull the variables this sheet didn't have before
+            missing = [var for var in dict.fromkeys(variables) if var not in entry.namespace]
+            if missing:
+                fetched = Indicator.create_namespace(
+                    prepared_geos, missing, db, release
+                )
+                namespace = extend_namespace(entry.namespace, fetched)
+            else:
+                namespace = entry.namespace
 
-            if geom:
-                record["geom"] = row["geom"]
+            if namespace is not None:
+                computed = entry.computed
 
-            for formula in formulae:
-                ind_name = formula[0]
+        if namespace is None:
+            namespace = Indicator.create_namespace(
+                prepared_geos, variables, db, release, geom=geom, resolution=resolution
+            )
 
-                try:
-                    record[ind_name] = serialize_maybes(
-                        row[ind_name.lower()].value
-                    )
-                    record[ind_name + "_moe"] = serialize_maybes(
-                        row[ind_name.lower()].error
-                    )
-                except AttributeError as e:
-                    if isinstance(row[ind_name.lower()], bool):
-                        record[ind_name] = row[ind_name]
-                    else:
-                        raise e
+        # ... and only compute the indicators it hasn't computed before
+        new = {
+            formula.text: formula
+            for _, formula in formulae
+            if formula.text not in computed
+        }
+        if new:
+            results = compute_sheet(
+                Plan(list(new.items())),
+                namespace,
+                seconds=deadline - time.monotonic(),
+            )
+            computed = {**computed, **dict(results)}
 
-            result.append(record)
+        if reuse_namespace:
+            namespace_cache.put(key, NamespaceEntry(namespace, computed))
 
-        return result
+        return build_records(
+            namespace,
+            [(ind_name, computed[formula.text]) for ind_name, formula in formulae],
+            geom=geom,
+        )
 
     @classmethod
     def search(cls, query: str, db):
-        # db.execute(
-        # text("SET search_path TO :acs, d3_2024, d3_present, public;"),
-        # {"acs": release},
-        # )
-
-        # TODO: Get the first five tables, then join all variables
-        # Use more complete text search
-        # Add D3 tables
-        #    - Use table title,
-
-        unified_col_q = Query.from_(
-            Schema(DEFAULT_ACS_YEAR).census_column_metadata
-        ).select("*") + Query.from_(
-            Schema(DEFAULT_D3_YEAR).census_column_metadata
-        ).select(
-            "*"
-        )
-
-        unified_tables = AliasedQuery("unified_tables")
-        unified_columns = AliasedQuery("unified_columns")
+        """
+        The columns of the ten best matching tables across the ACS and D3
+        metadata, answered from the in-memory table indexes.
+        """
+        indexes = [
+            get_table_index(DEFAULT_ACS_YEAR, db),
+            get_table_index(DEFAULT_D3_YEAR, db),
+        ]
 
-        match_tables = (
-            Query.with_(cls.unified_table_q, "unified_tables")
-            .from_(unified_tables)
-            .select(unified_tables.table_id)
-            .where(
-                fn.Lower(unified_tables.table_title).like(Parameter(":query"))
-            )
-            .limit(10)
-            .offset(0)
+        best = heapq.nsmallest(
+            10,
+            (
+                (key, index, table_id)
+                for index in indexes
+                for key, table_id in index.rank(query)
+            ),
+            key=lambda match: match[0],
         )
 
-        stmt = (
-            Query.with_(match_tables, "match_tables")
-            .with_(cls.unified_table_q, "unified_tables")
-            .with_(unified_col_q, "unified_columns")
-            .from_(unified_tables)
-            .select(
-                unified_tables.table_id,
-                unified_tables.table_title,
-                unified_columns.column_id,
-                unified_columns.column_title,
-                unified_columns.indent,  # use this to indent the variables
-            )
-            .join(unified_columns)
-            .on(unified_tables.table_id == unified_columns.table_id)
-            .join(AliasedQuery("match_tables"))
-            .on(
-                AliasedQuery("match_tables").table_id == unified_tables.table_id
+        return [
+            IndicatorSearchRow(
+                table_id,
+                index.tables[table_id].table_title,
+                column.column_id,
+                column.column_title,
+                column.indent,
             )
-            .orderby(unified_tables.table_id, unified_columns.column_id)
-        )
-
-        result = db.execute(text(str(stmt)), {"query": f"%{query.lower()}%"})
-
-        return result.fetchall()
+            for _, index, table_id in sorted(best, key=lambda match: match[2])
+            for column in index.columns[table_id]
+        ]
 
 
 class CensusAPIIndicator:
@@ -393,23 +427,87 @@ class CensusAPIIndicator:
 
 class Tearsheet:
     @staticmethod
-    def create(geographies, indicators, db, release=DEFAULT_ACS_YEAR, geom=False):
-        prepared_geos = Geography.prep_geo_request(geographies, db)
-        formulae, variables = Indicator.prep_ind_request(indicators)
+    def create(
+        geographies,
+        indicators,
+        db,
+        release=DEFAULT_ACS_YEAR,
+        geom=False,
+        resolution="full",
+        time_limit=TEARSHEET_TIME_LIMIT,
+        max_cells=MAX_TEARSHEET_CELLS,
+        reuse_namespace=True,
+    ):
+        deadline = time.monotonic() + time_limit
 
-        return Indicator.compile(
-            prepared_geos, formulae, variables, db, release, geom=geom
+        # The queries get the same limit, and Postgres cancels them past it
+        db.execute(
+            text("SELECT set_config('statement_timeout', :ms, true);"),
+            {"ms": str(time_limit * 1000)},
         )
 
+        formulae, variables = Indicator.prep_ind_request(indicators)
+        prepared_geos = Geography.prep_geo_request(geographies, db)
+        check_sheet_size(len(prepared_geos), len(formulae), max_cells)
+
+        try:
+            return Indicator.compile(
+                prepared_geos,
+                formulae,
+                variables,
+                db,
+                release,
+                geom=geom,
+                resolution=resolution,
+                deadline=deadline,
+                reuse_namespace=reuse_namespace,
+            )
+        except OperationalError as e:
+            if isinstance(e.orig, QueryCanceled):
+                raise TearsheetLimitError(
+                    f"Pulling the data for this sheet took longer than "
+                    f"{time_limit} seconds. Try fewer geographies or indicators."
+                ) from e
+            raise
+
     @staticmethod
     def explain(geographies, indicators, db, release=DEFAULT_ACS_YEAR):
-        prepared_geos = Geography.prep_geo_request(geographies, db)
-        formulae, variables = Indicator.prep_ind_request(indicators)
+        """
+        Profile a tearsheet request: the geoids each requested geography
+        (or group, like 'tracts|05000US26163') resolves to, the wall time of
+        each stage, and what Indicator.explain reports. Everything runs in
+        this process, so the stages can be timed on their own.
+        """
+        db.execute(
+            text("SELECT set_config('statement_timeout', :ms, true);"),
+            {"ms": str(TEARSHEET_TIME_LIMIT * 1000)},
+        )
+
+        timings = {}
+        with timed(timings, "parse"):
+            formulae, variables = Indicator.prep_ind_request(indicators)
+
+        with timed(timings, "geo_expansion"):
+            prepared_geos = Geography.prep_geo_request(geographies, db)
+
+        # Each group is cached by now, so this doesn't query again
+        groups = [
+            (geo, Geography.prep_geo_request([geo], db)) for geo in geographies
+        ]
+        check_sheet_size(len(prepared_geos), len(formulae))
 
-        return Indicator.explain(
-            prepared_geos, formulae, variables, db, release
+        explained = Indicator.explain(
+            prepared_geos, formulae, variables, db, release, timings
         )
 
+        return {
+            "geographies": [
+                {"geography": geo, "geoids": len(geoids)} for geo, geoids in groups
+            ],
+            **explained,
+            "timings_ms": timings,
+        }
+
 
 class Geography:
     sum_lev_aliases = {
@@ -426,7 +524,7 @@ class Geography:
     valid_sum_levs = {"040", "050", "060", "160", "140", "860", "970", "950"}
 
     @classmethod
-    def find_within(cls, sumlev: str, geoid: str, db) -> list[str]:
+    def numlev(cls, sumlev: str) -> str:
         numlev = cls.sum_lev_aliases.get(sumlev, sumlev)
 
         if numlev not in cls.valid_sum_levs:
@@ -434,28 +532,32 @@ class Geography:
                 f"'{sumlev}' is not a valid summary level or alias."
             )
 
-        geo_schema = Schema("tiger2022")
+        return numlev
 
-        stmt = (
-            Query.from_(geo_schema.census_geo_containment)
-            .select("child_geoid")
-            .where(geo_schema.census_geo_containment.parent_geoid == geoid)
-            .where(
-                geo_schema.census_geo_containment.child_geoid.like(numlev + "%")
-            )
-        )
+    @classmethod
+    def find_within(cls, sumlev: str, geoid: str, db) -> list[str]:
+        numlev = cls.numlev(sumlev)
+        return list(find_within([(numlev, geoid)], db)[(numlev, geoid)])
 
-        result = db.execute(text(str(stmt)))
+    @classmethod
+    def prep_geo_request(cls, geographies: list[str], db) -> list[str]:
+        """
+        The geoids of geographies, with groups like 'tracts|05000US26163'
+        expanded to their members, all the groups in one query (or none,
+        if they've been expanded before).
+        """
+        groups = {}
+        for geo in geographies:
+            if "|" in geo:
+                sumlev, geoid = geo.split("|")
+                groups[geo] = (cls.numlev(sumlev), geoid)
 
-        return [item.child_geoid for item in result]
+        within = find_within(list(groups.values()), db) if groups else {}
 
-    @staticmethod
-    def prep_geo_request(geographies: list[str], db) -> list[str]:
         result = []
         for geo in geographies:
-            if "|" in geo:
-                sumlev, geoid = geo.split("|")
-                result.extend(Geography.find_within(sumlev, geoid, db))
+            if geo in groups:
+                result.extend(within[groups[geo]])
             else:
                 result.append(geo)
 
@@ -473,52 +575,40 @@ class Geography:
                 select display_name, full_geoid, population, name_vec, priority
                 from tiger2022.census_name_lookup
                 where state_fp = 26
+            ),
+            matches as (
+                select full_geoid, display_name, priority, population
+                from michigan
+                where name_vec @@ to_tsquery(:query)
+                and priority is not null
+                order by priority::int asc, population desc
+                limit 10
             )
-            select full_geoid, display_name
-            from michigan
-            where name_vec @@ to_tsquery(:query)
-            and priority is not null
-            order by priority::int asc, population desc
-            limit 10;
+            select m.full_geoid, m.display_name, c.sumlevels
+            from matches m
+            left join tiger2022.census_child_sumlevels c
+                on c.parent_geoid = m.full_geoid
+            order by m.priority::int asc, m.population desc;
             """
         )
 
         result = db.execute(search_q, {"query": " & ".join(query.split())})
 
-        geographies = [
+        # The child levels come precomputed (see
+        # migrations/0005_add_child_sumlevels.sql)
+        return [
             {
                 "full_geoid": row.full_geoid,
                 "display_name": row.display_name,
-            } for row in result.fetchall()
+                "children": [
+                    cls.rev_aliases[child]
+                    for child in row.sumlevels or []
+                    if child in cls.rev_aliases
+                ],
+            }
+            for row in result.fetchall()
         ]
 
-        children_q = text(
-            """
-            select distinct(left(child_geoid, 3)) as sum_lev, 
-                   parent_geoid
-            from tiger2022.census_geo_containment
-            where parent_geoid in :geoids
-            and not child_geoid like '150%'; -- no block groups!
-            """
-        )
-
-        children_levs = db.execute(
-            children_q, 
-            {"geoids": tuple(row["full_geoid"] for row in geographies)}
-        )
-
-        available_child_levs = defaultdict(list)
-        for row in children_levs.fetchall():
-            available_child_levs[row.parent_geoid].append(row.sum_lev)
-
-        for geography in geographies:
-            geography["children"] = [
-                cls.rev_aliases[child] 
-                for child in available_child_levs[geography["full_geoid"]]
-            ]
-
-        return geographies
-
 """
 The problem that we continue to face is that due to lack of consistant code 
 standards, tool choice, and deployment procedure, often facing time constraints,
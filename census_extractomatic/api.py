@@ -4,8 +4,10 @@ from __future__ import division
 from flask import Flask
 from flask import abort, request, g
 from flask import make_response, current_app, send_file
+from flask import Response, stream_with_context
 from flask import jsonify, redirect
 from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from raven.contrib.flask import Sentry
@@ -16,6 +18,7 @@ import simplejson as json
 from collections import OrderedDict
 import operator
 import math
+import gzip
 from datetime import timedelta
 import re
 import os
@@ -33,6 +36,7 @@ from census_extractomatic.validation import (
     StringList,
     Bool,
     OneOf,
+    Integer as ValidInteger,
     ClientRequestValidationException,
 )
 import tomli
@@ -44,12 +48,34 @@ from ._api.download_data import (
     prepare_geojson_response,
 )
 
-from ._api.access import safe_default
+from ._api.access import (
+    safe_default,
+    ViewportLocation,
+    get_boundary_metatile_mvt,
+    get_neighboring_boundaries_metatile,
+    search_geos_by_query,
+    search_geos_by_similarity,
+    search_geos_by_proximity,
+    locate_points,
+)
+from ._api.tile_store import read_stored_tile
+from ._api.topojson import topology
+from ._api.geo_index import get_prefix_index, get_spatial_index
+from ._api.table_index import get_table_index
+from ._api.trigram import FALLBACK_BELOW
+from ._api.federated import budgeted_connection, fan_out, fuse
+from ._api.reverse_geocode import (
+    csv_lines,
+    ndjson_lines,
+    parse_csv_points,
+    parse_json_points,
+    reverse_geocode,
+)
 
 from returns.result import Success, Failure
 from .tearsheet_caching import tearsheet_cache
 
-from ._api.reference import supported_formats
+from ._api.reference import supported_formats, GEOM_RESOLUTIONS, geom_column
 from ._api.endpoints import data_pull
 
 
@@ -87,9 +113,13 @@ register_d3_metadata_admin(app)
 from census_extractomatic.auth import auth
 app.register_blueprint(auth, url_prefix="/auth")
 
-from census_extractomatic.tearsheet import tearsheet
+from census_extractomatic.tearsheet import tearsheet, search_variables
+from census_extractomatic.access import DEFAULT_ACS_YEAR, DEFAULT_D3_YEAR
 app.register_blueprint(tearsheet, url_prefix="/tearsheet")
 
+from census_extractomatic.full_text_search import full_text
+app.register_blueprint(full_text)
+
 
 sentry = Sentry(app)
 
@@ -866,6 +896,20 @@ def convert_row(row):
     return data
 
 
+# Searched by /1.0/geo/search when it isn't given sumlevs
+DEFAULT_GEO_SEARCH_SUMLEVS = (
+    "140",
+    "060",
+    "310",
+    "330",
+    "350",
+    "860",
+    "950",
+    "960",
+    "970",
+)
+
+
 # Example: /1.0/geo/search?q=spok
 # Example: /1.0/geo/search?q=spok&sumlevs=050,160
 @app.route("/1.0/geo/search")
@@ -876,6 +920,8 @@ def convert_row(row):
         "q": {"valid": NonemptyString()},
         "sumlevs": {"valid": StringList(item_validator=OneOf(SUMLEV_NAMES))},
         "geom": {"valid": Bool()},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "low"},
+        "mode": {"valid": OneOf(["prefix", "text"]), "default": "prefix"},
     }
 )
 @crossdomain(origin="*")
@@ -888,45 +934,70 @@ def geo_search():
     
     app.logger.warning(sumlevs)
 
+    if sumlevs:
+        sumlevs = tuple(lev for lev in sumlevs if lev != '150')
+    else:
+        sumlevs = DEFAULT_GEO_SEARCH_SUMLEVS
+
     if lat and lon:
+        spatial_index = get_spatial_index(
+            "tiger2022", db.session, app.config.get("SPATIAL_INDEX_STATES")
+        )
+        entries = spatial_index.search(lat, lon, sumlevs) if spatial_index else None
+
+        if entries is not None:
+            return jsonify(
+                results=pack_geo_entries(
+                    entries, with_geom, request.qwargs.resolution
+                )
+            )
+
+        # Outside the states loaded into the index
         where = "ST_Intersects(geom, ST_SetSRID(ST_Point(:lon, :lat),4326))"
         where_args = {"lon": lon, "lat": lat}
+    elif q and request.qwargs.mode == "text":
+        search_args = dict(
+            with_geom=with_geom,
+            limit=25,
+            sumlevs=sumlevs,
+            resolution=request.qwargs.resolution,
+            release="tiger2022",
+        )
+        rows = search_geos_by_query(q, db.session, **search_args).fetchall()
+
+        if len(rows) < FALLBACK_BELOW:
+            # Probably misspelled
+            found = {row.full_geoid for row in rows}
+            rows += [
+                row
+                for row in search_geos_by_similarity(q, db.session, **search_args)
+                if row.full_geoid not in found
+            ][: 25 - len(rows)]
+
+        return jsonify(results=[convert_row(row._mapping) for row in rows])
     elif q:
         q = re.sub(r"[^a-zA-Z\,\.\-0-9]", " ", q)
         q = re.sub(r"\s+", " ", q)
-        where = "lower(prefix_match_name) LIKE lower(:q)"
-        q += "%"
-        where_args = {"q": q}
+        return jsonify(
+            results=search_geos_by_prefix(
+                q, sumlevs, with_geom, request.qwargs.resolution
+            )
+        )
     else:
         abort(400, "Must provide either a lat/lon OR a query term.")
 
     where += " AND lower(display_name) not like '%%not defined%%' "
     where += " AND sumlevel IN :sumlevs"
-
-    if sumlevs:
-        sumlevs = [lev for lev in sumlevs if lev != '150']
-        where_args["sumlevs"] = tuple(sumlevs)
-    else:
-        where_args["sumlevs"] = (
-            "140",
-            "060",
-            "310",
-            "330",
-            "350",
-            "860",
-            "950",
-            "960",
-            "970",
-        )
+    where_args["sumlevs"] = sumlevs
 
     if with_geom:
         sql = text(
-            """SELECT DISTINCT geoid,sumlevel,population,display_name,full_geoid,priority,ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,0.001), 5) as geom
+            """SELECT DISTINCT geoid,sumlevel,population,display_name,full_geoid,priority,ST_AsGeoJSON(%s, 5) as geom
             FROM tiger2022.census_name_lookup
             WHERE %s
             ORDER BY priority, population DESC NULLS LAST
             LIMIT 25;"""
-            % (where)
+            % (geom_column(request.qwargs.resolution), where)
         )
     else:
         sql = text(
@@ -942,6 +1013,338 @@ def geo_search():
     return jsonify(results=[convert_row(row._mapping) for row in result])
 
 
+def search_geos_by_prefix(q, sumlevs, with_geom, resolution):
+    """
+    The q= side of geo_search, answered from the in-memory prefix index.
+    """
+    entries = get_prefix_index("tiger2022", db.session).typeahead(
+        q, sumlevs, limit=25
+    )
+
+    return pack_geo_entries(entries, with_geom, resolution)
+
+
+def pack_geo_entries(entries, with_geom, resolution):
+    """
+    geo_search results for entries from the in-memory indexes. Only the
+    geometries (if asked for) come from the database.
+    """
+    geoms = {}
+    if with_geom and entries:
+        result = db.session.execute(
+            text(
+                """SELECT full_geoid, ST_AsGeoJSON(%s, 5) as geom
+                FROM tiger2022.census_name_lookup
+                WHERE full_geoid IN :geoids;"""
+                % (geom_column(resolution),)
+            ),
+            {"geoids": tuple(entry.full_geoid for entry in entries)},
+        )
+        geoms = {row.full_geoid: row.geom for row in result}
+
+    return [
+        convert_row({**entry._asdict(), "geom": geoms.get(entry.full_geoid)})
+        for entry in entries
+    ]
+
+
+# Example: /1.0/geo/nearest?lat=42.24&lon=-83.61&sumlevs=160&limit=5
+# Example: /1.0/geo/nearest?geoid=14000US26163517200&sumlevs=970
+@app.route("/1.0/geo/nearest")
+@qwarg_validate(
+    {
+        "lat": {"valid": FloatRange(-90.0, 90.0)},
+        "lon": {"valid": FloatRange(-180.0, 180.0)},
+        "geoid": {"valid": NonemptyString()},
+        "sumlevs": {"valid": StringList(item_validator=OneOf(SUMLEV_NAMES))},
+        "limit": {"valid": ValidInteger(), "default": 10},
+        "geom": {"valid": Bool()},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "low"},
+    }
+)
+@crossdomain(origin="*")
+def geo_nearest():
+    """
+    The geographies closest to a point or to another geography, closest
+    first, with their distance in meters.
+    """
+    lat = request.qwargs.lat
+    lon = request.qwargs.lon
+    geoid = request.qwargs.geoid
+    limit = max(1, min(request.qwargs.limit or 10, 100))
+    with_geom = request.qwargs.geom
+    resolution = request.qwargs.resolution
+
+    if geoid is None and (lat is None or lon is None):
+        abort(400, "Must provide either a lat/lon OR a geoid.")
+
+    if request.qwargs.sumlevs:
+        sumlevs = tuple(lev for lev in request.qwargs.sumlevs if lev != "150")
+    else:
+        sumlevs = DEFAULT_GEO_SEARCH_SUMLEVS
+
+    spatial_index = get_spatial_index(
+        "tiger2022", db.session, app.config.get("SPATIAL_INDEX_STATES")
+    )
+    nearest = (
+        spatial_index.nearest(sumlevs, limit, lat=lat, lon=lon, geoid=geoid)
+        if spatial_index
+        else None
+    )
+
+    if nearest is not None:
+        results = pack_geo_entries(
+            [entry for entry, _ in nearest], with_geom, resolution
+        )
+        for result, (_, meters) in zip(results, nearest):
+            result["distance"] = round(meters, 1)
+
+        return jsonify(results=results)
+
+    # Not answerable from the states loaded into the index
+    rows = search_geos_by_proximity(
+        db.session,
+        sumlevs,
+        lat=lat,
+        lon=lon,
+        geoid=geoid,
+        limit=limit,
+        with_geom=with_geom,
+        resolution=resolution,
+        release="tiger2022",
+    )
+
+    results = []
+    for row in rows:
+        result = convert_row(row._mapping)
+        result["distance"] = round(row.distance, 1)
+        results.append(result)
+
+    return jsonify(results=results)
+
+
+# Example: curl -X POST -H 'Content-Type: text/csv' --data-binary @parcels.csv \
+#     '/1.0/geo/locate?sumlevs=050,140'
+@app.route("/1.0/geo/locate", methods=["POST"])
+@qwarg_validate(
+    {
+        "sumlevs": {
+            "valid": StringList(item_validator=OneOf(SUMLEV_NAMES)),
+            "required": True,
+        },
+        "format": {"valid": OneOf(["csv", "ndjson"])},
+    }
+)
+@crossdomain(origin="*", headers=["Content-Type"])
+def geo_locate():
+    """
+    Batch reverse geocoding. Takes a JSON list of points or a CSV with lat
+    and lon columns and streams back each point's containing geography in
+    each of sumlevs, as CSV or newline delimited JSON (the same as the
+    request by default).
+    """
+    sumlevs = tuple(request.qwargs.sumlevs)
+    is_csv = request.mimetype == "text/csv"
+
+    try:
+        if is_csv:
+            points = parse_csv_points(request.get_data(as_text=True))
+        else:
+            points = parse_json_points(request.get_json(force=True, silent=True))
+    except ValueError as e:
+        abort(400, str(e))
+
+    max_points = app.config.get("MAX_POINTS_TO_LOCATE", 250000)
+    if len(points) > max_points:
+        abort(400, f"Send at most {max_points} points at a time.")
+
+    spatial_index = get_spatial_index(
+        "tiger2022", db.session, app.config.get("SPATIAL_INDEX_STATES")
+    )
+
+    def locate_in_memory(lats, lons):
+        if not spatial_index:
+            return [None] * len(lats)
+
+        return [
+            None
+            if found is None
+            else {sumlevel: entry.full_geoid for sumlevel, entry in found.items()}
+            for found in spatial_index.locate(lats, lons, sumlevs)
+        ]
+
+    def locate_in_db(lats, lons):
+        return locate_points(db.session, lats, lons, sumlevs, release="tiger2022")
+
+    results = reverse_geocode(points, locate_in_memory, locate_in_db)
+
+    if (request.qwargs.format or ("csv" if is_csv else "ndjson")) == "csv":
+        lines, mimetype = csv_lines(results, sumlevs), "text/csv"
+    else:
+        lines, mimetype = ndjson_lines(results, sumlevs), "application/x-ndjson"
+
+    return Response(stream_with_context(lines), mimetype=mimetype)
+
+
+# Example: /1.0/search?q=hamtramck
+@app.route("/1.0/search")
+@qwarg_validate(
+    {
+        "q": {"valid": NonemptyString(), "required": True},
+        "acs": {
+            "valid": OneOf(allowed_acs),
+            "default": default_table_search_release,
+        },
+        "limit": {"valid": ValidInteger(), "default": 20},
+    }
+)
+@crossdomain(origin="*")
+def federated_search():
+    """
+    Geographies, tables and variables for the search box, searched at the
+    same time and ranked together. Sources that take longer than
+    SEARCH_BUDGET_MS are left out, and marked as timed out in 'sources'.
+    """
+    q = request.qwargs.q
+    acs = request.qwargs.acs
+    limit = max(1, min(request.qwargs.limit or 20, 100))
+    budget = app.config.get("SEARCH_BUDGET_MS", 300) / 1000
+
+    # The workers don't have the app context, so they get their own
+    # connections straight from the engine.
+    engine = db.engine
+
+    def geos():
+        prefix_q = re.sub(r"\s+", " ", re.sub(r"[^a-zA-Z\,\.\-0-9]", " ", q))
+        with engine.connect() as connection:
+            index = get_prefix_index("tiger2022", connection)
+
+        return [
+            {
+                "type": "geography",
+                "id": entry.full_geoid,
+                "name": entry.display_name,
+                "sumlevel": entry.sumlevel,
+            }
+            for entry in index.typeahead(
+                prefix_q, DEFAULT_GEO_SEARCH_SUMLEVS, limit=limit
+            )
+        ]
+
+    def tables():
+        with engine.connect() as connection:
+            index = get_table_index(acs, connection)
+
+        return [
+            {
+                "type": "table",
+                "id": row.table_id,
+                "name": row.table_title,
+                "universe": row.universe,
+            }
+            for row in index.search_tables(q, limit=limit)
+        ]
+
+    def variables():
+        with budgeted_connection(engine, budget) as connection:
+            rows = search_variables(q, connection)
+
+        return [
+            {
+                "type": "variable" if row.variable_id else "table",
+                "id": row.variable_id or row.table_id,
+                "table_id": row.table_id,
+                "name": row.highlighted_variable or row.highlighted_table,
+                "universe": row.universe,
+            }
+            for row in rows
+        ]
+
+    results = fan_out(
+        {"geo": geos, "table": tables, "variable": variables}, budget
+    )
+
+    return jsonify(
+        results=fuse(results, limit=limit),
+        sources={
+            name: {
+                "status": result.status,
+                "ms": round(result.ms, 1),
+                "count": len(result.hits),
+            }
+            for name, result in results.items()
+        },
+        partial=any(result.status != "ok" for result in results.values()),
+    )
+
+
+def build_search_indexes():
+    """
+    Called from wsgi.py so each worker builds its indexes as it starts
+    instead of on its first search.
+    """
+    with app.app_context():
+        # Each on its own, so one failing doesn't keep the others from being
+        # built. Whatever isn't built here is built by the first search.
+        try:
+            get_prefix_index("tiger2022", db.session)
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception("Couldn't build the geo prefix index")
+
+        try:
+            get_spatial_index(
+                "tiger2022", db.session, app.config.get("SPATIAL_INDEX_STATES")
+            )
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception("Couldn't build the spatial index")
+
+        # Only the default releases; the rest are built when they're searched
+        for release in dict.fromkeys([DEFAULT_ACS_YEAR, DEFAULT_D3_YEAR]):
+            # A connection each, so one missing schema doesn't abort the rest
+            try:
+                with db.engine.connect() as connection:
+                    get_table_index(release, connection)
+            except SQLAlchemyError:
+                app.logger.exception(f"Couldn't build the {release} table index")
+
+
+# Live tiles are rendered METATILE_SIZE x METATILE_SIZE at a time
+METATILE_SIZE = 4
+
+
+def tile_cache_key(release, sumlevel, zoom, x, y, ext):
+    return f"1.0/geo/{release}/tiles/{sumlevel}/{zoom}/{x}/{y}.{ext}"
+
+
+def cache_tiles(release, sumlevel, zoom, tiles, ext):
+    for (x, y), tile in tiles.items():
+        try:
+            put_in_cache(
+                tile_cache_key(release, sumlevel, zoom, x, y, ext),
+                tile,
+                try_s3=False,
+            )
+        except pylibmc.Error:
+            # Low zoom tiles can be over memcache's item size limit
+            pass
+
+
+def get_cached_tile(release, sumlevel, zoom, x, y, ext):
+    """
+    The cached tile, or None if it isn't cached or memcache can't be
+    reached, in which case the tile is rendered as if it weren't cached.
+    """
+    try:
+        return get_from_cache(
+            tile_cache_key(release, sumlevel, zoom, x, y, ext), try_s3=False
+        )
+    except pylibmc.Error:
+        app.logger.warning("Couldn't read tiles from memcache", exc_info=True)
+        return None
+
+
 def num2deg(xtile, ytile, zoom):
     n = 2.0**zoom
     lon_deg = xtile / n * 360.0 - 180.0
@@ -964,58 +1367,40 @@ def geo_tiles(release, sumlevel, zoom, x, y):
     if sumlevel == "010":
         abort(400, "Don't support US tiles")
 
-    (miny, minx) = num2deg(x, y, zoom)
-    (maxy, maxx) = num2deg(x + 1, y + 1, zoom)
+    result = get_cached_tile(release, sumlevel, zoom, x, y, "geojson")
 
-    tiles_across = 2**zoom
-    deg_per_tile = 360.0 / tiles_across
-    deg_per_pixel = deg_per_tile / 256
-    tile_buffer = 10 * deg_per_pixel  # ~ 10 pixel buffer
-    simplify_threshold = deg_per_pixel / 5
+    if result is None:
+        # Map clients ask for tiles in clusters, so render the whole block
+        # this tile sits in and cache its siblings for the requests to come.
+        block = get_neighboring_boundaries_metatile(
+            sumlevel,
+            ViewportLocation(zoom, x, y).metatile(METATILE_SIZE),
+            db.session,
+            release=release,
+        )
 
-    result = db.session.execute(
-        text(
-            """SELECT
-            ST_AsGeoJSON(ST_SimplifyPreserveTopology(
-                ST_Intersection(ST_Buffer(ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326), %f, 'join=mitre'), geom),
-                %f), 5) as geom,
-            full_geoid,
-            display_name
-           FROM %s.census_name_lookup
-           WHERE sumlevel=:sumlev AND ST_Intersects(ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326), geom)"""
-            % (
-                tile_buffer,
-                simplify_threshold,
-                release,
+        rendered = {}
+        for (tile_x, tile_y), rows in block.items():
+            features = [
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "geoid": row._mapping["full_geoid"],
+                        "name": row._mapping["display_name"],
+                    },
+                    "geometry": json.loads(row._mapping["geom"])
+                    if row._mapping["geom"]
+                    else None,
+                }
+                for row in rows
+            ]
+            rendered[(tile_x, tile_y)] = json.dumps(
+                dict(type="FeatureCollection", features=features),
+                separators=(",", ":"),
             )
-        ),
-        {
-            "minx": minx,
-            "miny": miny,
-            "maxx": maxx,
-            "maxy": maxy,
-            "sumlev": sumlevel,
-        },
-    )
-
-    results = []
-    for row in result:
-        results.append(
-            {
-                "type": "Feature",
-                "properties": {
-                    "geoid": row._mapping["full_geoid"],
-                    "name": row._mapping["display_name"],
-                },
-                "geometry": json.loads(row._mapping["geom"])
-                if row._mapping["geom"]
-                else None,
-            }
-        )
 
-    result = json.dumps(
-        dict(type="FeatureCollection", features=results), separators=(",", ":")
-    )
+        cache_tiles(release, sumlevel, zoom, rendered, "geojson")
+        result = rendered[(x, y)]
 
     resp = make_response(result)
 
@@ -1024,10 +1409,61 @@ def geo_tiles(release, sumlevel, zoom, x, y):
     return resp
 
 
+# Example: /1.0/geo/tiger2022/tiles/140/11/550/757.mvt
+@app.route(
+    "/1.0/geo/<release>/tiles/<sumlevel>/<int:zoom>/<int:x>/<int:y>.mvt"
+)
+@crossdomain(origin="*")
+def geo_vector_tiles(release, sumlevel, zoom, x, y):
+    if release not in allowed_tiger:
+        abort(404, "Unknown TIGER release")
+    if sumlevel not in SUMLEV_NAMES:
+        abort(404, "Unknown sumlevel")
+    if sumlevel == "010":
+        abort(400, "Don't support US tiles")
+
+    stored = read_stored_tile(
+        app.config.get("TILE_STORE_DIR"), release, sumlevel, zoom, x, y
+    )
+
+    if stored is not None:
+        # Stored gzipped, which nearly every client takes as is
+        if request.accept_encodings["gzip"]:
+            resp = make_response(stored)
+            resp.headers.set("Content-Encoding", "gzip")
+        else:
+            resp = make_response(gzip.decompress(stored))
+    else:
+        # Not pre-rendered (or outside the pre-rendered area), draw it live
+        tile = get_cached_tile(release, sumlevel, zoom, x, y, "mvt")
+
+        if tile is None:
+            block = get_boundary_metatile_mvt(
+                sumlevel,
+                ViewportLocation(zoom, x, y).metatile(METATILE_SIZE),
+                db.session,
+                release=release,
+            )
+            cache_tiles(release, sumlevel, zoom, block, "mvt")
+            tile = block[(x, y)]
+
+        resp = make_response(tile)
+
+    resp.headers.set("Content-Type", "application/vnd.mapbox-vector-tile")
+    resp.headers.set("Cache-Control", "public,max-age=86400")  # 1 day
+    resp.headers.set("Vary", "Accept-Encoding")
+    return resp
+
+
 # Example: /1.0/geo/tiger2014/04000US53
 # Example: /1.0/geo/tiger2013/04000US53
 @app.route("/1.0/geo/<release>/<geoid>")
-@qwarg_validate({"geom": {"valid": Bool(), "default": False}})
+@qwarg_validate(
+    {
+        "geom": {"valid": Bool(), "default": False},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "high"},
+    }
+)
 @crossdomain(origin="*")
 def geo_lookup(release, geoid):
     if release not in allowed_tiger:
@@ -1042,11 +1478,11 @@ def geo_lookup(release, geoid):
         result = db.session.execute(
             text(
                 """SELECT display_name,simple_name,sumlevel,full_geoid,population,aland,awater,
-               ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom, 0.00005), 6) as geom
+               ST_AsGeoJSON(%s, 6) as geom
                FROM %s.census_name_lookup
                WHERE full_geoid=:geoid
                LIMIT 1"""
-                % (release,)
+                % (geom_column(request.qwargs.resolution), release)
             ),
             {"geoid": geoid},
         )
@@ -1164,6 +1600,8 @@ def show_custom_data(release):
 @qwarg_validate(
     {
         "geo_ids": {"valid": StringList(), "required": True},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "adaptive"},
+        "format": {"valid": OneOf(["geojson", "topojson"]), "default": "geojson"},
     }
 )
 @crossdomain(origin="*")
@@ -1189,10 +1627,10 @@ def show_specified_geo_data(release):
             aland,
             awater,
             population,
-            ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,ST_Perimeter(geom) / 2500)) as geom
+            ST_AsGeoJSON(%s) as geom
            FROM %s.census_name_lookup
            WHERE geom is not null and full_geoid IN :geoids;"""
-            % (release,)
+            % (geom_column(request.qwargs.resolution), release)
         ),
         {"geoids": tuple(geo_ids)},
     )
@@ -1205,6 +1643,7 @@ def show_specified_geo_data(release):
         results.append(
             {
                 "type": "Feature",
+                "id": row["full_geoid"],
                 "properties": {
                     "geoid": row["full_geoid"],
                     "name": row["display_name"],
@@ -1220,10 +1659,15 @@ def show_specified_geo_data(release):
     if invalid_geo_ids:
         abort(404, "GeoID(s) %s are not valid." % (",".join(invalid_geo_ids)))
 
-    resp_data = json.dumps({"type": "FeatureCollection", "features": results})
+    if request.qwargs.format == "topojson":
+        resp_data = json.dumps(topology({"geographies": results}))
+    else:
+        resp_data = json.dumps({"type": "FeatureCollection", "features": results})
 
     resp = make_response(resp_data)
     resp.headers["Content-Type"] = "application/json"
+    if request.qwargs.format == "topojson":
+        resp.headers.set("Cache-Control", "public,max-age=%d" % int(3600 * 4))
     return resp
 
 
@@ -1283,27 +1727,25 @@ def format_table_search_result(obj, obj_type, release):
 def table_search():
     data = []
 
-    # Matching for table id
-    db.session.execute(text("SET search_path TO :acs, public;"), {"acs": request.qwargs.acs})
-    result = db.session.execute(
-        text(
-            """SELECT tab.table_id,
-                  tab.table_title,
-                  tab.simple_table_title,
-                  tab.universe,
-                  tab.topics
-           FROM census_table_metadata tab
-           WHERE lower(table_id) like lower(:table_id)"""
-        ),
-        {"table_id": "{}%".format(request.qwargs.q)},
-    )
-    for row in result:
-        data.append(
-            format_table_search_result(row, "table", request.qwargs.acs)
-        )
+    # Matching for table id (already in id order). Without q there's no
+    # prefix to match, rather than every table matching the empty one.
+    index = get_table_index(request.qwargs.acs, db.session)
+    if request.qwargs.q:
+        for row in index.tables_by_id_prefix(request.qwargs.q):
+            data.append(
+                format_table_search_result(row, "table", request.qwargs.acs)
+            )
+
+    if request.qwargs.q and len(data) < FALLBACK_BELOW:
+        # Not a table id, so look for a table title like it
+        found = {result["table_id"] for result in data}
+        for row in index.similar_tables(request.qwargs.q, limit=25):
+            if row.table_id not in found:
+                data.append(
+                    format_table_search_result(row, "table", request.qwargs.acs)
+                )
 
     if data:
-        data.sort(key=lambda x: x["unique_key"])
         return json.dumps(data)
 
     else:
@@ -2073,6 +2515,8 @@ def download_specified_data(acs):
         "within": {"valid": NonemptyString(), "required": True},
         "sumlevel": {"valid": OneOf(SUMLEV_NAMES), "required": True},
         "geom": {"valid": Bool(), "default": False},
+        "resolution": {"valid": OneOf(GEOM_RESOLUTIONS), "default": "low"},
+        "format": {"valid": OneOf(["geojson", "topojson"]), "default": "geojson"},
     }
 )
 @crossdomain(origin="*")
@@ -2182,15 +2626,16 @@ def data_compare_geographies_within_parent(acs, table_id):
         # get the parent geometry and add to API response
         result = db.session.execute(
             text(
-                """SELECT ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,0.001), 5) as geometry
+                """SELECT ST_AsGeoJSON(%s, 5) as geometry
                FROM tiger2022.census_name_lookup
                WHERE full_geoid=:geo_ids;"""
+                % (geom_column(request.qwargs.resolution),)
             ),
             {"geo_ids": parent_geoid},
         )
         parent_geometry = result.fetchone()
         try:
-            parent_geography._mapping["geography"]["geometry"] = json.loads(
+            parent_geography["geography"]["geometry"] = json.loads(
                 parent_geometry._mapping["geometry"]
             )
         except:
@@ -2200,10 +2645,11 @@ def data_compare_geographies_within_parent(acs, table_id):
         # get the child geometries and store for later
         result = db.session.execute(
             text(
-                """SELECT geoid, ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,0.001), 5) as geometry
+                """SELECT geoid, ST_AsGeoJSON(%s, 5) as geometry
                FROM tiger2022.census_name_lookup
                WHERE full_geoid IN :geo_ids
                ORDER BY full_geoid;"""
+                % (geom_column(request.qwargs.resolution),)
             ),
             {"geo_ids": tuple(child_geoid_list)},
         )
@@ -2292,6 +2738,40 @@ def data_compare_geographies_within_parent(acs, table_id):
     else:
         comparison["results"] = 0
 
+    if request.qwargs.geom and request.qwargs.format == "topojson":
+        # Children tile the parent, so sharing arcs between them pays off
+        # twice: once for the borders between children, again for the outline.
+        parent_geometry = parent_geography["geography"].pop("geometry", None)
+        child_features = [
+            {
+                "type": "Feature",
+                "id": child_geoid,
+                "geometry": child_data["geography"].pop("geometry", None),
+            }
+            for child_geoid, child_data in child_geographies.items()
+        ]
+
+        resp = jsonify(
+            comparison=comparison,
+            table=table,
+            parent_geography=parent_geography,
+            child_geographies=child_geographies,
+            topology=topology(
+                {
+                    "parent": [
+                        {
+                            "type": "Feature",
+                            "id": parent_geoid,
+                            "geometry": parent_geometry,
+                        }
+                    ],
+                    "children": child_features,
+                }
+            ),
+        )
+        resp.headers.set("Cache-Control", "public,max-age=%d" % int(3600 * 4))
+        return resp
+
     return jsonify(
         comparison=comparison,
         table=table,
@@ -9,7 +9,18 @@ class Config(object):
     SENTRY_DSN = os.environ.get('SENTRY_DSN')
     MAX_GEOIDS_TO_SHOW = 3500
     MAX_GEOIDS_TO_DOWNLOAD = 3500
+    MAX_POINTS_TO_LOCATE = 250000
     CENSUS_REPORTER_URL_ROOT = 'https://censusreporter.org'
+    # Where prerender_tiles.py writes its .mbtiles files
+    TILE_STORE_DIR = os.environ.get('TILE_STORE_DIR', 'tiles')
+    # State FIPS codes whose geographies are loaded into each worker for
+    # lat/lon lookups. Points elsewhere are looked up in PostGIS.
+    SPATIAL_INDEX_STATES = ['26']
+    # How long /1.0/search waits for its backends before answering with
+    # whatever has come back
+    SEARCH_BUDGET_MS = 300
+    # Where /tearsheet/sheet?mode=async jobs keep their status and results
+    TEARSHEET_JOB_DIR = os.environ.get('TEARSHEET_JOB_DIR', 'tearsheet_jobs')
 
 
 class Production(Config):
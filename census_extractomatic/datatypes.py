@@ -2,6 +2,8 @@ from typing import Union
 from math import sqrt, isnan
 from dataclasses import dataclass
 
+import numpy as np
+
 """
 Maybes
 
@@ -415,5 +417,201 @@ class TearValue:  # (Real)
         return f"{self.value.inner:.2f}±{self.error.inner:.2f}"
 
 
+
+"""
+TearColumn is TearValue for a whole column of geographies at once: a pair of
+float arrays, estimates and margins of error, with NaN standing in for
+Empty. Every operation works on the whole arrays, following the same rules
+TearValue and the maybes follow one value at a time, so a tearsheet doesn't
+build (and then unpack) an object per geography per variable.
+"""
+
+
+def _maybe_add(a, b):
+    """Some + Empty is the Some, Empty + Empty is Empty."""
+    both_empty = np.isnan(a) & np.isnan(b)
+    return np.where(both_empty, np.nan, np.nan_to_num(a) + np.nan_to_num(b))
+
+
+def _maybe_sub(a, b):
+    """Some - Empty is the Some, Empty - Some is -Some."""
+    return _maybe_add(a, -b)
+
+
+def _maybe_div(a, b):
+    """Anything divided by zero or involving Empty is Empty."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b == 0, np.nan, a / b)
+
+
+@dataclass(slots=True, frozen=True)
+class TearColumn:
+    value: np.ndarray
+    error: np.ndarray
+
+    @classmethod
+    def wrap(cls, values, errors=None) -> "TearColumn":
+        """
+        Wrap columns as they come from the database. Zero, missing and the
+        large negative 'annotation' estimates the census uses are Empty, as
+        are zero, missing or negative errors.
+
+        Without errors (land area and the like) the error is exactly 0.
+        """
+        value = np.asarray(values, dtype=float)
+
+        if errors is None:
+            return cls(value, np.zeros_like(value))
+
+        value = np.where((value == 0) | (value < -1000), np.nan, value)
+
+        error = np.asarray(errors, dtype=float)
+        error = np.where(error <= 0, np.nan, error)
+
+        return cls(value, error)
+
+    def __len__(self):
+        return len(self.value)
+
+    def take(self, indices) -> "TearColumn":
+        """The column with its rows in the order of indices."""
+        return TearColumn(self.value[indices], self.error[indices])
+
+    def __abs__(self) -> "TearColumn":
+        return TearColumn(np.abs(self.value), self.error)
+
+    def __neg__(self) -> "TearColumn":
+        return TearColumn(-self.value, self.error)
+
+    def __add__(self, other) -> "TearColumn":
+        if isinstance(other, TearColumn):
+            return TearColumn(
+                _maybe_add(self.value, other.value),
+                np.sqrt(self.error**2 + other.error**2),
+            )
+
+        # A plain number is exact
+        return TearColumn(self.value + other, self.error)
+
+    def __radd__(self, other) -> "TearColumn":
+        # sum() starts from 0
+        if isinstance(other, (int, float)) and other == 0:
+            return self
+        return self + other
+
+    def __sub__(self, other) -> "TearColumn":
+        if isinstance(other, TearColumn):
+            return TearColumn(
+                _maybe_sub(self.value, other.value),
+                np.sqrt(self.error**2 + other.error**2),
+            )
+
+        return TearColumn(self.value - other, self.error)
+
+    def __rsub__(self, other) -> "TearColumn":
+        return (-self) + other
+
+    def __mul__(self, other) -> "TearColumn":
+        if isinstance(other, TearColumn):
+            # The census' formula for the MOE of a product
+            return TearColumn(
+                self.value * other.value,
+                np.sqrt(
+                    self.value**2 * other.error**2
+                    + other.value**2 * self.error**2
+                ),
+            )
+
+        return TearColumn(self.value * other, self.error * abs(other))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other) -> "TearColumn":
+        """
+        'self' is the numerator, other, the denominator. The error uses
+        the proportion formula, or the ratio formula where the proportion
+        formula would take the root of a negative number.
+        """
+        if not isinstance(other, TearColumn):
+            return TearColumn(
+                _maybe_div(self.value, other), _maybe_div(self.error, abs(other))
+            )
+
+        new_value = _maybe_div(self.value, other.value)
+
+        numerator_error = self.error**2
+        denominator_error = new_value * other.error**2
+
+        radicand = _maybe_sub(numerator_error, denominator_error)
+        radicand = np.where(
+            radicand < 0, _maybe_add(numerator_error, denominator_error), radicand
+        )
+
+        with np.errstate(invalid="ignore"):
+            error = _maybe_div(np.sqrt(radicand), other.value)
+
+        return TearColumn(new_value, error)
+
+    def __rtruediv__(self, other):
+        raise TypeError(f"You cannot divide a {type(other)} by a TearColumn")
+
+    def __lt__(self, other):
+        other = other.value if isinstance(other, TearColumn) else other
+        return self.value < other
+
+    def __le__(self, other):
+        other = other.value if isinstance(other, TearColumn) else other
+        return self.value <= other
+
+    def __gt__(self, other):
+        other = other.value if isinstance(other, TearColumn) else other
+        return self.value > other
+
+    def __ge__(self, other):
+        other = other.value if isinstance(other, TearColumn) else other
+        return self.value >= other
+
+    def __ceil__(self):
+        raise NotImplementedError("'ceil' doesn't work for CensusValues")
+
+    def __floor__(self):
+        raise NotImplementedError("'floor' doesn't work for CensusValues")
+
+    def __floordiv__(self, _):
+        raise NotImplementedError("'floordiv' doesn't work for CensusValues")
+
+    def __mod__(self, _):
+        raise NotImplementedError("'mod' doesn't work for CensusValues")
+
+    def serialize(self) -> tuple[list, list]:
+        """
+        (estimates, errors) as lists ready for JSON, rounded to two places
+        like serialize_maybes, with None for Empty.
+        """
+        return _serialize_array(self.value), _serialize_array(self.error)
+
+
+def _serialize_array(values: np.ndarray) -> list:
+    serialized = np.round(values, 2).astype(object)
+    serialized[~np.isfinite(values)] = None
+    return serialized.tolist()
+
+
+def fetch_columns(result, object_columns=("geoid", "name", "geom")) -> dict:
+    """
+    A query's rows as an array per column, straight from the cursor:
+    object_columns as object arrays and everything else as floats, with
+    NaN for NULL.
+    """
+    names = list(result.keys())
+    rows = result.fetchall()
+    columns = zip(*rows) if rows else [()] * len(names)
+
+    return {
+        name: np.array(values, dtype=object if name in object_columns else float)
+        for name, values in zip(names, columns)
+    }
+
+
 if __name__ == "__main__":
     pass
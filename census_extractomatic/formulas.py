@@ -0,0 +1,300 @@
+"""
+Tearsheet formulas (Crisp, see templates/tearsheet/help.html) compiled once.
+
+A formula like
+
+    (/ (+ B01001003 B01001004) B01001001)
+
+is parsed into a tree of Number, Variable and Call nodes, checked, and
+lowered to a flat list of steps that each work on whole TearColumns, so
+evaluating it for a few thousand geographies is a handful of numpy
+operations. Compiled formulas are cached by their normalized text (lower
+case, single spaces), so the same indicator requested again, or validated
+and then requested, is only parsed the first time.
+
+Operators are applied cumulatively, (- a b c) is (a - b) - c. With a single
+argument - negates, + and * pass it through. The comparisons <, >, <= and >=
+take exactly two arguments and give a flag per geography, so they can't be
+nested inside arithmetic.
+"""
+
+from collections import namedtuple
+from functools import lru_cache, reduce
+import operator
+import re
+
+
+Number = namedtuple("Number", ["value"])
+Variable = namedtuple("Variable", ["name"])
+Call = namedtuple("Call", ["op", "args"])
+
+# op is 'load' (args is a variable name), 'const' (a number), or an
+# operator applied to the results of earlier steps (their indexes).
+Step = namedtuple("Step", ["op", "args"])
+
+ARITHMETIC = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+COMPARISONS = {
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+
+TOKEN = re.compile(r"[()]|[^\s()]+")
+NUMBER = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)$")
+NAME = re.compile(r"[a-z_][a-z0-9_]*$")
+
+
+class FormulaError(ValueError):
+    pass
+
+
+def tokenize(source: str) -> list[str]:
+    return TOKEN.findall(source.lower())
+
+
+def normalize(source: str) -> str:
+    """' (+  B01001003 B01001004 ) ' -> '(+ b01001003 b01001004)'"""
+    return " ".join(tokenize(source)).replace("( ", "(").replace(" )", ")")
+
+
+def parse(tokens: list[str]):
+    if not tokens:
+        raise FormulaError("The formula is empty.")
+
+    def expression(i):
+        token = tokens[i]
+
+        if token == ")":
+            raise FormulaError("There's a ')' without a matching '('.")
+
+        if token != "(":
+            if NUMBER.match(token):
+                return Number(float(token)), i + 1
+            if NAME.match(token):
+                return Variable(token), i + 1
+            raise FormulaError(f"'{token}' isn't a variable name or a number.")
+
+        if i + 1 == len(tokens):
+            raise FormulaError("There's a '(' without a matching ')'.")
+
+        op = tokens[i + 1]
+        if op == ")":
+            raise FormulaError("Empty parentheses '()' don't mean anything.")
+        if op not in ARITHMETIC and op not in COMPARISONS:
+            raise FormulaError(
+                f"'{op}' isn't an operator, use one of + - * / < > <= >=."
+            )
+
+        args = []
+        i += 2
+        while i < len(tokens) and tokens[i] != ")":
+            arg, i = expression(i)
+            args.append(arg)
+
+        if i == len(tokens):
+            raise FormulaError("There's a '(' without a matching ')'.")
+
+        return Call(op, tuple(args)), i + 1
+
+    tree, end = expression(0)
+    if end != len(tokens):
+        raise FormulaError(
+            f"Unexpected '{' '.join(tokens[end:])}' after the end of the formula."
+        )
+
+    return tree
+
+
+class Formula:
+    """
+    A parsed and checked formula. evaluate() runs its steps over a
+    namespace of TearColumns (see Indicator.wrap_values).
+    """
+
+    __slots__ = ("text", "tree", "variables", "steps")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tree = parse(tokenize(text))
+        self.steps = []
+        self._lower(self.tree, top=True)
+        self.variables = frozenset(
+            step.args for step in self.steps if step.op == "load"
+        )
+
+    def _add(self, op, args) -> int:
+        self.steps.append(Step(op, args))
+        return len(self.steps) - 1
+
+    def _lower(self, node, top=False) -> tuple[int, str]:
+        """
+        Append the steps computing node and return the index of the last
+        one along with what it makes: a 'number', a 'column' or 'flags'.
+        """
+        match node:
+            case Number(value):
+                return self._add("const", value), "number"
+
+            case Variable(name):
+                return self._add("load", name), "column"
+
+            case Call(op, args) if op in COMPARISONS:
+                if not top:
+                    raise FormulaError(
+                        f"A comparison '({op} ...)' can only be the whole formula."
+                    )
+                if len(args) != 2:
+                    raise FormulaError(f"'{op}' compares exactly two values.")
+
+                lowered = [self._lower(arg) for arg in args]
+                return self._add(op, tuple(i for i, _ in lowered)), "flags"
+
+            case Call(op, args):
+                if not args:
+                    raise FormulaError(f"'({op})' needs something to work on.")
+                if op == "/" and len(args) == 1:
+                    raise FormulaError("'/' needs at least two values.")
+
+                lowered = [self._lower(arg) for arg in args]
+                kinds = [kind for _, kind in lowered]
+
+                if "flags" in kinds:
+                    raise FormulaError("Comparisons can't be used inside arithmetic.")
+
+                if op == "/" and kinds[0] == "number" and "column" in kinds[1:]:
+                    raise FormulaError(
+                        "A number can't be divided by a variable, only a variable by a number."
+                    )
+
+                if len(args) == 1 and op != "-":
+                    return lowered[0]
+
+                kind = "column" if "column" in kinds else "number"
+                if kind == "number":
+                    # Fold constant arithmetic like (* 2.59 1000000) now
+                    # (each argument is a single 'const' step at the end).
+                    values = [self.steps[i].args for i, _ in lowered]
+                    if op == "/" and 0 in values[1:]:
+                        raise FormulaError("Division by zero")
+                    del self.steps[lowered[0][0] :]
+                    return self._add("const", _apply(op, values)), "number"
+
+                return self._add(op, tuple(i for i, _ in lowered)), kind
+
+        raise FormulaError(f"Can't compile {node}.")
+
+    def evaluate(self, namespace: dict):
+        return _run(self.steps, namespace)[-1]
+
+    def describe(self) -> list[str]:
+        """The steps, readably: ['t0 = b01001001', 't1 = 2589988.0', ...]"""
+        return _describe(self.steps)
+
+    def __repr__(self):
+        return f"Formula({self.text!r})"
+
+
+class Plan:
+    """
+    Every formula in a tearsheet merged into one graph, so a subexpression
+    the formulas share (the same variable, or a whole (/ land_area 2589988))
+    is computed once per request. A step is the same as an earlier one when
+    it has the same op applied to the same (already merged) steps.
+    """
+
+    def __init__(self, formulae: list[tuple[str, Formula]]):
+        self.steps = []
+        self.outputs = []
+        self.unshared_operations = 0
+
+        merged_index = {}
+        for name, formula in formulae:
+            merged = []
+            for op, args in formula.steps:
+                if op not in ("load", "const"):
+                    args = tuple(merged[i] for i in args)
+                    self.unshared_operations += 1
+
+                key = (op, args)
+                if key not in merged_index:
+                    merged_index[key] = len(self.steps)
+                    self.steps.append(Step(op, args))
+                merged.append(merged_index[key])
+
+            self.outputs.append((name, merged[-1]))
+
+    @property
+    def operations(self) -> int:
+        return sum(op not in ("load", "const") for op, _ in self.steps)
+
+    def evaluate(self, namespace: dict) -> list[tuple[str, object]]:
+        """(name, result) for each formula, in order."""
+        results = _run(self.steps, namespace)
+        return [(name, results[i]) for name, i in self.outputs]
+
+    def describe(self) -> dict:
+        return {
+            "steps": _describe(self.steps),
+            "outputs": {name: f"t{i}" for name, i in self.outputs},
+            "operations": self.operations,
+            "operations_without_sharing": self.unshared_operations,
+        }
+
+
+def _run(steps, namespace) -> list:
+    results = []
+    for op, args in steps:
+        match op:
+            case "load":
+                results.append(namespace[args])
+            case "const":
+                results.append(args)
+            case _:
+                results.append(_apply(op, [results[i] for i in args]))
+
+    return results
+
+
+def _describe(steps) -> list[str]:
+    lines = []
+    for n, (op, args) in enumerate(steps):
+        match op:
+            case "load" | "const":
+                lines.append(f"t{n} = {args}")
+            case "-" if len(args) == 1:
+                lines.append(f"t{n} = -t{args[0]}")
+            case _:
+                lines.append(f"t{n} = " + f" {op} ".join(f"t{i}" for i in args))
+
+    return lines
+
+
+def _apply(op, values):
+    if op == "-" and len(values) == 1:
+        return -values[0]
+
+    if op in COMPARISONS:
+        return COMPARISONS[op](*values)
+
+    return reduce(ARITHMETIC[op], values)
+
+
+@lru_cache(maxsize=2048)
+def _compile(text: str) -> Formula:
+    return Formula(text)
+
+
+def compile_formula(source: str) -> Formula:
+    """
+    The compiled formula for source, from the cache if it (or the same
+    formula spaced or capitalized differently) was compiled before. Raises a
+    FormulaError explaining what's wrong if it isn't a valid formula.
+    """
+    return _compile(normalize(source))
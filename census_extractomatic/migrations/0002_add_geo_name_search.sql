@@ -0,0 +1,20 @@
+-- Full text search over geography names, used by search_geos_by_query
+-- (/1.0/geo/search?mode=text). Run against each TIGER release that's served.
+-- The column is generated, so it stays in step with display_name on reloads.
+
+ALTER TABLE tiger2021.census_name_lookup
+    ADD COLUMN IF NOT EXISTS searchable_geo_name tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(display_name, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS display_name_search_idx
+    ON tiger2021.census_name_lookup USING GIN (searchable_geo_name);
+
+ALTER TABLE tiger2022.census_name_lookup
+    ADD COLUMN IF NOT EXISTS searchable_geo_name tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(display_name, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS display_name_search_idx
+    ON tiger2022.census_name_lookup USING GIN (searchable_geo_name);
+
+ANALYZE tiger2021.census_name_lookup;
+ANALYZE tiger2022.census_name_lookup;
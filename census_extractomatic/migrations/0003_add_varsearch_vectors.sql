@@ -0,0 +1,50 @@
+-- Stored search vectors for /tearsheet/varsearch, so the tsvectors aren't
+-- rebuilt from keyword, unkeyed and full_label for every row on every search.
+-- The weights match the ranking the endpoint has always used: for a table
+-- match keyword is A and unkeyed C, for a variable match the table's keyword
+-- is B, unkeyed C and the variable's label D.
+
+ALTER TABLE censearch.acs_tables
+    ADD COLUMN IF NOT EXISTS table_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(keyword, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(unkeyed, '')), 'C')
+        ) STORED,
+    ADD COLUMN IF NOT EXISTS context_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(keyword, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(unkeyed, '')), 'C')
+        ) STORED;
+
+CREATE INDEX IF NOT EXISTS acs_tables_vector_idx
+    ON censearch.acs_tables USING GIN (table_vector);
+
+-- For the 'B01001'-style id prefix fallback
+CREATE INDEX IF NOT EXISTS acs_tables_id_pattern_idx
+    ON censearch.acs_tables (id text_pattern_ops);
+
+ALTER TABLE censearch.acs_variables
+    ADD COLUMN IF NOT EXISTS label_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(full_label, '')), 'D')
+        ) STORED;
+
+CREATE INDEX IF NOT EXISTS acs_variables_vector_idx
+    ON censearch.acs_variables USING GIN (label_vector);
+
+-- ts_rewrite parses every alias out of category_aliases each time it's
+-- called. This keeps them as tsqueries, with a GiST index so only the
+-- aliases contained in the search are looked at (WHERE query @> target).
+-- Run REFRESH MATERIALIZED VIEW censearch.category_alias_rewrites after
+-- changing category_aliases.
+CREATE MATERIALIZED VIEW IF NOT EXISTS censearch.category_alias_rewrites AS
+    SELECT expected_q::tsquery AS target,
+           alias_q::tsquery AS substitute
+    FROM censearch.category_aliases;
+
+CREATE INDEX IF NOT EXISTS category_alias_rewrites_target_idx
+    ON censearch.category_alias_rewrites USING GIST (target);
+
+ANALYZE censearch.acs_tables;
+ANALYZE censearch.acs_variables;
+ANALYZE censearch.category_alias_rewrites;
@@ -0,0 +1,34 @@
+-- Trigram indexes for the typo tolerant fallbacks in geography search
+-- (search_geos_by_similarity, /1.0/geo/search?mode=text) and table search
+-- (/1.0/table/search). They're only used when the exact search finds too
+-- few results, to catch things like 'Ypsilanty' or 'Hamtramk'.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS display_name_trgm_idx
+    ON tiger2021.census_name_lookup USING GIN (display_name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS display_name_trgm_idx
+    ON tiger2022.census_name_lookup USING GIN (display_name gin_trgm_ops);
+
+-- Every ACS and D3 release with table metadata
+DO $$
+DECLARE
+    release text;
+BEGIN
+    FOR release IN
+        SELECT table_schema
+        FROM information_schema.tables
+        WHERE table_name = 'census_table_metadata'
+    LOOP
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS table_title_trgm_idx '
+            'ON %I.census_table_metadata USING GIN (table_title gin_trgm_ops)',
+            release
+        );
+    END LOOP;
+END
+$$;
+
+ANALYZE tiger2021.census_name_lookup;
+ANALYZE tiger2022.census_name_lookup;
@@ -0,0 +1,23 @@
+-- The summary levels available under each parent geography, so the
+-- tearsheet's geography search (Geography.search) can offer 'tracts|...'
+-- and the like without grouping census_geo_containment on every keystroke.
+-- Children count when they're more than 10 percent inside the parent, the
+-- same as when the groups are resolved (see _api/containment.py).
+--
+-- Refresh after loading new containment data:
+--     REFRESH MATERIALIZED VIEW CONCURRENTLY tiger2022.census_child_sumlevels;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS tiger2022.census_child_sumlevels AS
+SELECT parent_geoid,
+       array_agg(DISTINCT left(child_geoid, 3) ORDER BY left(child_geoid, 3)) AS sumlevels
+FROM tiger2022.census_geo_containment
+WHERE child_geoid NOT LIKE '150%' -- no block groups!
+  AND percent_covered > 10
+GROUP BY parent_geoid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS census_child_sumlevels_parent_idx
+    ON tiger2022.census_child_sumlevels (parent_geoid);
+
+-- For the batched lookups in _api/containment.py
+CREATE INDEX IF NOT EXISTS census_geo_containment_parent_child_idx
+    ON tiger2022.census_geo_containment (parent_geoid, child_geoid text_pattern_ops);
@@ -1,4 +1,5 @@
 from urllib.parse import quote, unquote
+import os
 import re
 from itertools import groupby
 
@@ -9,6 +10,7 @@ from flask import (
     jsonify,
     Blueprint,
     current_app,
+    send_file,
     url_for,
 )
 from flask_cors import CORS
@@ -17,10 +19,18 @@ from sqlalchemy.exc import ProgrammingError
 from psycopg2.errors import UndefinedTable
 import tomli
 
-from lesp.analyze import extract_variables
 from census_extractomatic._api.download_data import pack_geojson_response
+from census_extractomatic._api.topojson import topology
 
 from .access import Geography, Indicator, Tearsheet
+from .formulas import compile_formula, FormulaError
+from .tearsheet_jobs import read_status, result_path, submit_job
+from .tearsheet_workers import (
+    TearsheetLimitError,
+    ASYNC_MAX_TEARSHEET_CELLS,
+    ASYNC_TEARSHEET_TIME_LIMIT,
+)
+from ._api.reference import GEOM_RESOLUTIONS
 from .tearsheet_caching import tearsheet_cache
 
 
@@ -94,6 +104,8 @@ def sheet():
 
         release = request.form.get("release", VALID_RELEASES[0])
         how = request.form.get("how")
+        mode = request.form.get("mode")
+        resolution = request.form.get("resolution", "full")
 
     else:
         geographies = (
@@ -110,17 +122,30 @@ def sheet():
         )
         release = unquote(request.args.get("release", VALID_RELEASES[0]))
         how = request.args.get("how")
+        mode = request.args.get("mode")
+        resolution = request.args.get("resolution", "full")
+
+    if resolution not in GEOM_RESOLUTIONS:
+        resolution = "full"
+
+    if mode == "async":
+        return start_sheet_job(geographies, indicators, release, how, resolution)
 
     url = f"sheet?geographies={quote(','.join(geographies))}&indicators={quote(','.join(indicators))}&how=html&release={release}"
-    geojsonurl = f"sheet?geographies={quote(','.join(geographies))}&indicators={quote(','.join(indicators))}&how=geojson&release={release}"
+    geojsonurl = f"sheet?geographies={quote(','.join(geographies))}&indicators={quote(','.join(indicators))}&how=geojson&release={release}&resolution={resolution}"
     jsonurl = f"sheet?geographies={quote(','.join(geographies))}&indicators={quote(','.join(indicators))}&how=json&release={release}"
     mapurl = f"sheet?geographies={quote(','.join(geographies))}&indicators={quote(','.join(indicators))}&how=map&release={release}"
 
     try:
         with db_engine.connect() as db:
-            geom = how == "geojson"
+            geom = how in ("geojson", "topojson")
             tearsheet = Tearsheet.create(
-                geographies, indicators, db, release=release, geom=geom
+                geographies,
+                indicators,
+                db,
+                release=release,
+                geom=geom,
+                resolution=resolution,
             )
 
         if how == "html":
@@ -147,9 +172,15 @@ def sheet():
         if how == "geojson":
             return jsonify(pack_geojson_response(tearsheet))
 
+        if how == "topojson":
+            features = pack_geojson_response(tearsheet)["features"]
+            resp = jsonify(topology({"tearsheet": features}))
+            resp.headers.set("Cache-Control", "public,max-age=%d" % int(3600 * 4))
+            return resp
+
         if (how is not None) | (how != "json"):
             print(
-                "WARNING: {how} is not a valid 'how', must be one of ('html', 'geojson', 'json'). Returning json."
+                "WARNING: {how} is not a valid 'how', must be one of ('html', 'geojson', 'topojson', 'json'). Returning json."
             )
 
         return jsonify(tearsheet)
@@ -170,6 +201,14 @@ def sheet():
                                 e="Data retrevial error",
                                 error_type="Unknown",
                             )
+                case FormulaError():
+                    return render_template(
+                        "error.html", e=e.args[0], error_type="equation error"
+                    )
+                case TearsheetLimitError():
+                    return render_template(
+                        "error.html", e=e.args[0], error_type="sheet too large"
+                    )
                 case AttributeError():
                     return render_template(
                         "error.html",
@@ -184,17 +223,117 @@ def sheet():
         return jsonify({"message": f"there was an error with your request {e}"})
 
 
-@tearsheet.route("/explain")
-def explain():
-    geographies = unquote(request.args.get("geographies", "").split(","))
-    indicators = unquote(request.args.get("indicators", "").split(","))
-    release = unquote(request.args.get("release", "acs2022_5yr"))
+ASYNC_FORMATS = ("json", "geojson", "topojson")
+
+
+def job_directory():
+    return current_app.config.get("TEARSHEET_JOB_DIR", "tearsheet_jobs")
+
 
+def compute_sheet_job(params):
     with db_engine.connect() as db:
-        the_fineprint = Tearsheet.explain(
-            geographies, indicators, db, release=release
+        tearsheet = Tearsheet.create(
+            params["geographies"],
+            params["indicators"],
+            db,
+            release=params["release"],
+            geom=params["how"] in ("geojson", "topojson"),
+            resolution=params["resolution"],
+            time_limit=ASYNC_TEARSHEET_TIME_LIMIT,
+            max_cells=ASYNC_MAX_TEARSHEET_CELLS,
+            # Too big to keep around for the next request
+            reuse_namespace=False,
         )
 
+    if params["how"] == "geojson":
+        return pack_geojson_response(tearsheet)
+
+    if params["how"] == "topojson":
+        features = pack_geojson_response(tearsheet)["features"]
+        return topology({"tearsheet": features})
+
+    return tearsheet
+
+
+def job_response(status):
+    return {
+        **status,
+        "status_url": url_for("tearsheet.sheet_job_status", job_id=status["job_id"]),
+        "result_url": url_for("tearsheet.sheet_job_result", job_id=status["job_id"]),
+    }
+
+
+def start_sheet_job(geographies, indicators, release, how, resolution):
+    """
+    Queue the sheet to be computed in the background and answer with the
+    job's id and where to poll for it. html and map sheets come back as json.
+    """
+    params = {
+        "geographies": [geo for geo in geographies if geo],
+        "indicators": [ind for ind in indicators if ind],
+        "release": release,
+        "how": how if how in ASYNC_FORMATS else "json",
+        "resolution": resolution,
+    }
+
+    status = submit_job(job_directory(), params, compute_sheet_job)
+
+    return jsonify(job_response(status)), 202
+
+
+@tearsheet.route("/jobs/<job_id>")
+def sheet_job_status(job_id):
+    status = read_status(job_directory(), job_id)
+    if status is None:
+        return jsonify({"message": f"There's no tearsheet job '{job_id}'."}), 404
+
+    return jsonify(job_response(status))
+
+
+@tearsheet.route("/jobs/<job_id>/result")
+def sheet_job_result(job_id):
+    status = read_status(job_directory(), job_id)
+    if status is None:
+        return jsonify({"message": f"There's no tearsheet job '{job_id}'."}), 404
+
+    if status["status"] != "done":
+        # Not ready (or failed), the status says which
+        return jsonify(job_response(status)), 409
+
+    return send_file(
+        os.path.abspath(result_path(job_directory(), job_id)),
+        mimetype="application/json",
+        download_name=f"tearsheet_{job_id}.{status['params']['how']}",
+    )
+
+
+@tearsheet.route("/explain")
+def explain():
+    """
+    Profile a sheet: how many geoids each geography resolves to, the query
+    and its plan, the indicators' computation plan and the time each stage
+    takes.
+    """
+    geographies = [
+        item.strip()
+        for item in unquote(request.args.get("geographies", "")).split(",")
+        if item.strip()
+    ]
+    indicators = [
+        item.strip()
+        for item in unquote(request.args.get("indicators", "")).split(",")
+        if item.strip()
+    ]
+    release = unquote(request.args.get("release", VALID_RELEASES[0]))
+
+    try:
+        with db_engine.connect() as db:
+            the_fineprint = Tearsheet.explain(
+                geographies, indicators, db, release=release
+            )
+    except (FormulaError, TearsheetLimitError) as e:
+        return jsonify({"message": e.args[0]}), 400
+
     return jsonify(the_fineprint)
 
 
@@ -318,24 +457,120 @@ def validate_lesp():
     for indicator in indicators:
         name, *eq = indicator.split("|")
         if eq:
-            variables = variables | extract_variables(eq[0])
+            variables = variables | compile_formula(eq[0]).variables
         else:
             variables.add(name)
 
     if variables:
         with db_engine.connect() as db:
-            missing_tables = Indicator.identify_missing_tables(variables, db)
+            missing_tables, missing_columns = Indicator.identify_missing_variables(
+                variables, db
+            )
 
         helpers = [
             f"{table} isn't available in the ACS 5-year, check your variable spelling"
-            for table in missing_tables
+            for table in sorted(missing_tables)
             if table.strip()  # Trying to handle weird edge case where '' is getting warned on.
+        ] + [
+            f"{column} isn't a column of {column[:-3]}, check your variable spelling"
+            for column in sorted(missing_columns)
         ]
 
         return render_template("validation.html", helpers=helpers)
     return render_template("validation.html")
 
 
+# Everything is ranked on the stored vectors first (see
+# migrations/0003_add_varsearch_vectors.sql), and ts_headline, which has
+# to re-parse the text, only runs on the ten results that are returned.
+VARSEARCH_QUERY = text(
+    """
+    WITH params AS (
+        SELECT websearch_to_tsquery('english', :q) AS raw_q
+    ),
+         prepped AS (
+        SELECT ts_rewrite(
+            raw_q,
+            'SELECT target, substitute '
+            || 'FROM censearch.category_alias_rewrites '
+            || 'WHERE ' || quote_literal(raw_q::text) || '::tsquery @> target'
+        ) AS prepped_q
+        FROM params
+    ),
+         table_results AS (
+        SELECT
+           id as table_id,
+           '' as variable_id,
+           ts_rank(
+               '{0.25, 0.5, 0.75, 1.0}', table_vector, prepped.prepped_q
+           ) as rnk
+        FROM censearch.acs_tables, prepped
+        WHERE (
+                table_vector @@ prepped.prepped_q
+                OR id like :q || '%' -- Last resort
+            )
+            AND length(id) = 6
+         ),
+         variable_results AS (
+        SELECT
+           var.table_id,
+           var.id as variable_id,
+           ts_rank(
+               '{0.25, 0.5, 0.75, 1.0}',
+               coalesce(tab.context_vector, '') || var.label_vector,
+               prepped.prepped_q
+           ) as rnk
+        FROM censearch.acs_variables AS var
+        LEFT JOIN censearch.acs_tables AS tab
+            ON tab.id = var.table_id
+        CROSS JOIN prepped
+        WHERE var.label_vector @@ prepped.prepped_q
+            AND length(var.table_id) = 6
+         ),
+         top_results AS (
+        SELECT *
+        FROM table_results t
+        UNION ALL
+        SELECT *
+        FROM variable_results v
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM table_results t
+            WHERE t.table_id = v.table_id
+        )
+        ORDER BY rnk desc, table_id, variable_id
+        LIMIT 10
+         )
+    SELECT top.table_id,
+           top.variable_id,
+           ts_headline(
+               'english', tab.description, prepped_q,
+               'MaxWords=200, StartSel="<mark>", StopSel="</mark>"'
+           ) AS highlighted_table,
+           CASE WHEN top.variable_id = '' THEN '' ELSE ts_headline(
+               'english', var.full_label, prepped_q,
+               'MaxWords=200, StartSel="<mark>", StopSel="</mark>"'
+           ) END AS highlighted_variable,
+           tab.universe,
+           top.rnk
+    FROM top_results AS top
+    CROSS JOIN prepped
+    LEFT JOIN censearch.acs_tables AS tab
+        ON tab.id = top.table_id
+    LEFT JOIN censearch.acs_variables AS var
+        ON var.id = top.variable_id
+    ORDER BY top.rnk desc, top.table_id, top.variable_id;
+    """
+)
+
+
+def search_variables(q, db):
+    """
+    The ten best tables and variables for q, with the matches highlighted.
+    """
+    return db.execute(VARSEARCH_QUERY, {"q": q}).fetchall()  # type: ignore
+
+
 @tearsheet.route("/varsearch")
 @tearsheet_cache.cached(timeout=300, query_string=True)
 def text_search():
@@ -347,91 +582,8 @@ def text_search():
     q = request.args.get("q")
     how = request.args.get("how", "html")
 
-    stmt = text(
-        """
-        WITH params AS (
-            SELECT ts_rewrite(
-                websearch_to_tsquery(:q), 
-                'SELECT expected_q, alias_q FROM censearch.category_aliases'
-            ) AS prepped_q
-        ),
-             table_results AS (
-            SELECT
-               id as table_id,
-               '' as variable_id,
-               ts_headline(
-                   'english', description, prepped_q, 
-                   'MaxWords=200, StartSel="<mark>", StopSel="</mark>"'
-               ) AS highlighted_table,
-               '' as highlighted_variable,
-               universe,
-               ts_rank(
-                   '{0.25, 0.5, 0.75, 1.0}',
-                   setweight(to_tsvector(keyword), 'A')
-                   || setweight(to_tsvector(unkeyed), 'C'),
-                   params.prepped_q
-               ) as rnk  
-            FROM censearch.acs_tables, params
-            WHERE (
-                    to_tsvector(keyword) @@ params.prepped_q
-                    OR to_tsvector(unkeyed) @@ params.prepped_q
-                    OR id like :q || '%' -- Last resort
-                )
-                AND length(id) = 6
-             ),
-             variable_results AS (
-            SELECT
-               tab.id as table_id,
-               var.id as variable_id,
-               ts_headline(
-                   'english', tab.description, prepped_q, 
-                   'MaxWords=200, StartSel="<mark>", StopSel="</mark>"'
-               ) AS highlighted_table,
-               ts_headline(
-                   'english', full_label, prepped_q, 
-                   'MaxWords=200, StartSel="<mark>", StopSel="</mark>"'
-               ) AS highlighted_variable,
-               tab.universe,
-               ts_rank(
-                   '{0.25, 0.5, 0.75, 1.0}',
-                   setweight(to_tsvector(tab.keyword), 'B')
-                   || setweight(to_tsvector(tab.unkeyed), 'C')
-                   || setweight(to_tsvector(full_label), 'D'),
-                   params.prepped_q
-               ) as rnk  
-            FROM censearch.acs_variables AS var
-            LEFT JOIN censearch.acs_tables AS tab
-                ON tab.id = var.table_id
-            CROSS JOIN params 
-            WHERE to_tsvector(full_label) @@ params.prepped_q
-                AND length(var.table_id) = 6
-             )
-        SELECT table_id, 
-               variable_id, 
-               highlighted_table, 
-               highlighted_variable, 
-               universe,
-               rnk
-        FROM (
-            SELECT * 
-            FROM table_results t
-            UNION ALL
-            SELECT *            
-            FROM variable_results v
-            WHERE NOT EXISTS (
-                SELECT 1
-                FROM table_results t
-                WHERE t.table_id = v.table_id
-            )
-        ) AS everything
-        ORDER BY rnk desc, table_id, variable_id
-        LIMIT 10;
-        """
-    )
-
     with db_engine.connect() as db:
-        rows = db.execute(stmt, {"q": q})  # type: ignore
-        results = rows.fetchall()
+        results = search_variables(q, db)
 
     row_dicts = [
         {
@@ -0,0 +1,207 @@
+"""
+Tearsheets too big to wait for (/tearsheet/sheet?mode=async): the request
+gets a job id back straight away, the sheet is computed in the background,
+and the client polls /tearsheet/jobs/<job_id> until it can download the
+result from /tearsheet/jobs/<job_id>/result.
+
+Job status and results are files in a shared directory, so whichever web
+worker a poll lands on can answer it. A job's id is a hash of what it asks
+for, so the same sheet requested again (while it's running or after it's
+done) is the same job rather than another copy of the work. Jobs more than
+a day old are deleted when the next one is submitted (see remove_expired).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+
+logger = logging.getLogger()
+
+
+# One background sheet at a time per web worker, so async jobs never hold
+# more than one of the tearsheet compute workers.
+_job_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tearsheet-job")
+
+# Results are kept this long (seconds) before the sheet is computed again
+RESULT_TTL = 24 * 3600
+
+# A queued or running job that hasn't finished in this long (seconds) died
+# with its web worker and is started again when it's requested.
+STALE_AFTER = 3600
+
+JOB_ID = re.compile(r"[0-9a-f]{32}$")
+
+
+def job_id(params: dict) -> str:
+    encoded = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+def status_path(directory, job_id):
+    return os.path.join(directory, f"{job_id}.status.json")
+
+
+def result_path(directory, job_id):
+    return os.path.join(directory, f"{job_id}.json")
+
+
+def _write_json(path, data):
+    # Written to the side and renamed, so a reader never sees half a file
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+    with open(partial, "w") as f:
+        json.dump(data, f)
+    os.replace(partial, path)
+
+
+def _set_status(directory, job_id, status, **details):
+    now = time.time()
+    _write_json(
+        status_path(directory, job_id),
+        {"job_id": job_id, "status": status, "updated": now, **details},
+    )
+
+
+def read_status(directory, job_id) -> dict | None:
+    """The job's status, or None if there's no such job."""
+    if not JOB_ID.match(job_id):
+        return None
+
+    try:
+        with open(status_path(directory, job_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _is_current(status: dict | None) -> bool:
+    if status is None:
+        return False
+
+    age = time.time() - status["updated"]
+    match status["status"]:
+        case "queued" | "running":
+            return age < STALE_AFTER
+        case "done":
+            return age < RESULT_TTL
+        case _:
+            return False
+
+
+def _run(directory, job_id, params, compute):
+    _set_status(directory, job_id, "running", params=params)
+    try:
+        _write_json(result_path(directory, job_id), compute(params))
+    except Exception as e:
+        logger.exception("Tearsheet job %s failed", job_id)
+        _set_status(directory, job_id, "failed", params=params, message=str(e))
+    else:
+        _set_status(directory, job_id, "done", params=params)
+
+
+def remove_expired(directory):
+    """
+    Delete the status, result and leftover partial files that haven't been
+    written to in RESULT_TTL. Jobs are only kept that long anyway (see
+    _is_current), so without this the directory would grow by a result for
+    every distinct sheet ever requested.
+    """
+    cutoff = time.time() - RESULT_TTL
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            # Another worker got to it first
+            pass
+
+
+def _claim(directory, job_id, params) -> bool:
+    """
+    Create the job's status file, as queued, if there isn't one. Exactly one
+    of the web workers trying at the same time gets True.
+    """
+    try:
+        fd = os.open(
+            status_path(directory, job_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL
+        )
+    except FileExistsError:
+        return False
+
+    with os.fdopen(fd, "w") as f:
+        json.dump(
+            {
+                "job_id": job_id,
+                "status": "queued",
+                "updated": time.time(),
+                "params": params,
+            },
+            f,
+        )
+
+    return True
+
+
+def _retire(directory, job_id, status):
+    """
+    Move a failed, stale or expired job's status out of the way so it can be
+    claimed again. Only one worker's rename can succeed, and if what it moved
+    turns out to be a newer claim than status (another worker retired the old
+    one and claimed the job first), it's put back.
+    """
+    path = status_path(directory, job_id)
+    retired = f"{path}.{os.getpid()}.{threading.get_ident()}.retired"
+    try:
+        os.rename(path, retired)
+    except FileNotFoundError:
+        return
+
+    try:
+        with open(retired) as f:
+            moved = json.load(f)
+    except json.JSONDecodeError:
+        # A claim still being written
+        moved = None
+
+    if moved != status:
+        try:
+            os.link(retired, path)
+        except FileExistsError:
+            pass
+    os.unlink(retired)
+
+
+def submit_job(directory, params: dict, compute) -> dict:
+    """
+    Start compute(params) in the background, writing its (JSON serializable)
+    result to the job directory, unless the same job is already queued,
+    running or done. Returns the job's status.
+
+    Expired jobs are cleared out of the directory first (see remove_expired).
+    """
+    os.makedirs(directory, exist_ok=True)
+    remove_expired(directory)
+
+    id = job_id(params)
+    status = read_status(directory, id)
+    if _is_current(status):
+        return status
+
+    if status is not None:
+        _retire(directory, id, status)
+
+    if _claim(directory, id, params):
+        _job_pool.submit(_run, directory, id, params, compute)
+
+    # Either ours or the one another worker queued just now
+    return read_status(directory, id) or {
+        "job_id": id,
+        "status": "queued",
+        "updated": time.time(),
+        "params": params,
+    }
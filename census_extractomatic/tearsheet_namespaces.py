@@ -0,0 +1,76 @@
+"""
+Sheets are usually built a step at a time: the same geographies and
+release, with an indicator added or edited on each request. The columns
+already pulled for those geographies, and the indicators already computed
+from them, are kept here so the next request only pulls the variables it
+doesn't have yet and only computes the indicators that are new.
+
+Entries are keyed by the set of geographies, the release and the geometry
+resolution (None without geometries), and the least recently used entry is
+dropped once there are NAMESPACE_CACHE_SIZE of them. Census releases don't
+change once they're loaded, so entries are never stale.
+"""
+
+from collections import OrderedDict, namedtuple
+import threading
+
+from .datatypes import TearColumn
+
+
+NAMESPACE_CACHE_SIZE = 16
+
+# namespace is what Indicator.wrap_values returns; computed maps formula
+# text to its result for those geographies.
+NamespaceEntry = namedtuple("NamespaceEntry", ["namespace", "computed"])
+
+
+def namespace_key(prepared_geos, release, geom=False, resolution="full"):
+    return (frozenset(prepared_geos), release, resolution if geom else None)
+
+
+class NamespaceCache:
+    def __init__(self, maxsize=NAMESPACE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> NamespaceEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry: NamespaceEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def extend_namespace(namespace: dict, fetched: dict) -> dict | None:
+    """
+    A new namespace with fetched's variables added to namespace's, with
+    fetched's rows put in namespace's geoid order. None if the two don't
+    have the same geographies.
+    """
+    position = {geoid: i for i, geoid in enumerate(fetched["geoid"].tolist())}
+    geoids = namespace["geoid"].tolist()
+    if len(position) != len(geoids) or not all(g in position for g in geoids):
+        return None
+
+    order = [position[geoid] for geoid in geoids]
+
+    extended = dict(namespace)
+    for name, column in fetched.items():
+        if isinstance(column, TearColumn) and name not in extended:
+            extended[name] = column.take(order)
+
+    return extended
+
+
+namespace_cache = NamespaceCache()
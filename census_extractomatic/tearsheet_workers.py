@@ -0,0 +1,167 @@
+"""
+Tearsheet arithmetic runs in a small pool of worker processes, not in the
+web worker handling the request.
+
+A sheet with every tract in several counties and dozens of indicators can
+keep the CPU busy for seconds. In the pool it only ties up one of a few
+workers, and every sheet gets a time limit: the worker interrupts itself
+when the sheet runs over (see time_limit), and the request gives up waiting
+shortly after. Sheets too big to be worth starting are turned away before
+any data is pulled (see check_sheet_size).
+"""
+
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import multiprocessing
+import signal
+import threading
+
+import numpy as np
+
+from .datatypes import TearColumn
+
+
+# Geographies x indicators
+MAX_TEARSHEET_CELLS = 250_000
+
+# Seconds for the whole sheet, from pulling the data to the last indicator
+TEARSHEET_TIME_LIMIT = 20
+
+# The same for sheets computed in the background (see tearsheet_jobs.py)
+ASYNC_MAX_TEARSHEET_CELLS = 5_000_000
+ASYNC_TEARSHEET_TIME_LIMIT = 600
+
+TEARSHEET_WORKERS = 2
+
+# How much longer than the limit to wait for a worker before giving up on it
+GRACE = 1.0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class TearsheetLimitError(ValueError):
+    pass
+
+
+def check_sheet_size(geographies: int, indicators: int, max_cells=MAX_TEARSHEET_CELLS):
+    if geographies * indicators > max_cells:
+        raise TearsheetLimitError(
+            f"This sheet would have {geographies * indicators:,} values "
+            f"({geographies:,} geographies by {indicators} indicators), more "
+            f"than the limit of {max_cells:,}. Split it into smaller sheets."
+        )
+
+
+def _out_of_time(*_):
+    raise TearsheetLimitError(
+        "This sheet took too long to compute. Try fewer geographies or "
+        "indicators, or request it with mode=async."
+    )
+
+
+@contextmanager
+def time_limit(seconds: float):
+    """
+    Raise a TearsheetLimitError in the running code after seconds. Only
+    works in a process's main thread, which is where pool workers run.
+    """
+    previous = signal.signal(signal.SIGALRM, _out_of_time)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def build_records(namespace: dict, results, geom=False) -> list[dict]:
+    """
+    One dict per geography with its geoid, name (and geom), and the value
+    and moe of every (name, result) in results.
+    """
+    result = [
+        {"geoid": geoid, "name": name}
+        for geoid, name in zip(
+            namespace["geoid"].tolist(), namespace["name"].tolist()
+        )
+    ]
+
+    if geom:
+        for record, geometry in zip(result, namespace["geom"].tolist()):
+            record["geom"] = geometry
+
+    for ind_name, calculated in results:
+        if isinstance(calculated, TearColumn):
+            values, errors = calculated.serialize()
+            for record, value, error in zip(result, values, errors):
+                record[ind_name] = value
+                record[ind_name + "_moe"] = error
+        else:
+            # Comparisons give a boolean for each geography
+            flags = np.broadcast_to(calculated, len(result)).tolist()
+            for record, flag in zip(result, flags):
+                record[ind_name] = flag
+
+    return result
+
+
+def _evaluate_in_worker(plan, namespace, seconds):
+    with time_limit(seconds):
+        return plan.evaluate(namespace)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked, so workers don't inherit the web
+            # worker's database connections and threads.
+            _pool = ProcessPoolExecutor(
+                max_workers=TEARSHEET_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def compute_sheet(plan, namespace: dict, seconds=TEARSHEET_TIME_LIMIT):
+    """
+    plan.evaluate(namespace) in a worker process, with a limit of seconds.
+    Raises a TearsheetLimitError if the sheet runs over.
+    """
+    if seconds <= 0:
+        _out_of_time()
+
+    # Only the columns the plan uses are sent to the worker
+    needed = {
+        name: namespace[name]
+        for op, name in plan.steps
+        if op == "load"
+    }
+
+    pool = _get_pool()
+    try:
+        future = pool.submit(_evaluate_in_worker, plan, needed, seconds)
+        return future.result(timeout=seconds + GRACE)
+    except TimeoutError:
+        # The worker didn't stop itself, so it can't be trusted with the
+        # next sheet.
+        _discard_pool(pool)
+        _out_of_time()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
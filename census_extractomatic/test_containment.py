@@ -0,0 +1,51 @@
+from ._api.containment import ContainmentCache, find_within
+
+
+WAYNE = "05000US26163"
+WASHTENAW = "05000US26161"
+
+
+def fake_fetch(calls):
+    def fetch(db, geo_schema, groups):
+        calls.append(list(groups))
+        return {
+            ("140", WAYNE): ["14000US26163500100", "14000US26163500200"],
+            ("060", WAYNE): ["06000US2616322000"],
+        }
+
+    return fetch
+
+
+def test_groups_are_fetched_together_and_cached():
+    calls = []
+    cache = ContainmentCache()
+    groups = [("140", WAYNE), ("060", WAYNE), ("140", WASHTENAW), ("140", WAYNE)]
+
+    within = find_within(groups, None, cache=cache, fetch=fake_fetch(calls))
+
+    assert calls == [[("140", WAYNE), ("060", WAYNE), ("140", WASHTENAW)]]
+    assert within[("140", WAYNE)] == ("14000US26163500100", "14000US26163500200")
+    assert within[("140", WASHTENAW)] == ()
+
+    # Already looked up, including the group with no children
+    again = find_within(groups[1:3], None, cache=cache, fetch=fake_fetch(calls))
+    assert len(calls) == 1
+    assert again[("060", WAYNE)] == ("06000US2616322000",)
+
+    # Other geography vintages are cached separately
+    find_within(
+        groups[:1], None, geo_schema="tiger2021", cache=cache, fetch=fake_fetch(calls)
+    )
+    assert calls[-1] == [("140", WAYNE)]
+
+
+def test_cache_drops_least_recently_used():
+    cache = ContainmentCache(maxsize=2)
+    cache.put("a", ())
+    cache.put("b", ())
+    cache.get("a")
+    cache.put("c", ())
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == ()
@@ -0,0 +1,163 @@
+import math
+import random
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+from .datatypes import Empty, TearColumn, TearValue, fetch_columns, make_maybe
+
+
+def random_column(rng, n=400):
+    values, errors = [], []
+    for _ in range(n):
+        values.append(rng.choice([None, 0, -666666666, rng.uniform(1, 5000)]))
+        errors.append(rng.choice([None, 0, -1, rng.uniform(1, 500)]))
+    return values, errors
+
+
+def wrap_one(value, error):
+    """What Indicator.wrap_values used to do for each cell."""
+    if (not value) or (value < -1000):
+        value = Empty()
+    else:
+        value = make_maybe(value)
+
+    if (not error) or (error < 0):
+        error = Empty()
+    else:
+        error = make_maybe(error)
+
+    return TearValue(value, error)
+
+
+def inner(maybe):
+    return math.nan if maybe.inner is None else maybe.inner
+
+
+def assert_matches(column, i, expected):
+    assert column.value[i] == pytest.approx(inner(expected.value), nan_ok=True)
+    assert column.error[i] == pytest.approx(inner(expected.error), nan_ok=True)
+
+
+@pytest.fixture
+def columns():
+    rng = random.Random(7)
+    a, a_moe = random_column(rng)
+    b, b_moe = random_column(rng)
+
+    return (
+        TearColumn.wrap(a, a_moe),
+        TearColumn.wrap(b, b_moe),
+        [wrap_one(v, e) for v, e in zip(a, a_moe)],
+        [wrap_one(v, e) for v, e in zip(b, b_moe)],
+    )
+
+
+def test_wrap_matches_tear_values(columns):
+    a, _, a_values, _ = columns
+    for i, expected in enumerate(a_values):
+        assert_matches(a, i, expected)
+
+    land = TearColumn.wrap([0, 10, None])
+    assert land.value[0] == 0
+    assert np.isnan(land.value[2])
+    assert list(land.error) == [0, 0, 0]
+
+
+def test_addition_matches_tear_values(columns):
+    a, b, a_values, b_values = columns
+    total = a + b
+    for i, (x, y) in enumerate(zip(a_values, b_values)):
+        assert_matches(total, i, x + y)
+
+
+def test_subtraction_matches_tear_values(columns):
+    a, b, a_values, b_values = columns
+    difference = a - b
+    for i, (x, y) in enumerate(zip(a_values, b_values)):
+        try:
+            expected = x - y
+        except TypeError:
+            # TearValue gives up on an Empty error; the column says Empty
+            assert np.isnan(difference.error[i])
+            continue
+        assert_matches(difference, i, expected)
+
+
+def test_division_matches_tear_values(columns):
+    a, b, a_values, b_values = columns
+    share = a / b
+    checked = 0
+    for i, (x, y) in enumerate(zip(a_values, b_values)):
+        try:
+            expected = x / y
+        except ValueError:
+            continue
+        assert_matches(share, i, expected)
+        checked += 1
+
+    assert checked > 300
+
+
+def test_scalars_and_comparisons():
+    a = TearColumn.wrap([100.0, None], [10.0, 5.0])
+
+    per_sq_mile = a / 2.5
+    assert per_sq_mile.value[0] == 40 and per_sq_mile.error[0] == 4
+    assert np.isnan(per_sq_mile.value[1])
+
+    assert (a * 3).value[0] == 300
+    assert (3 * a).error[0] == 30
+    assert sum([a, a]).value[0] == 200
+
+    assert list(a < TearColumn.wrap([200.0, 1.0], [1.0, 1.0])) == [True, False]
+    assert list(a > 50) == [True, False]
+
+
+def test_serialize():
+    column = TearColumn(np.array([1.23456, np.nan, 0.0]), np.array([0.5, 1.0, np.nan]))
+    assert column.serialize() == ([1.23, None, 0.0], [0.5, 1.0, None])
+
+
+def test_statewide_tract_sheet():
+    rng = np.random.default_rng(1)
+    geos, indicators = 3000, 20
+    columns = [
+        TearColumn.wrap(rng.uniform(0, 5000, geos), rng.uniform(0, 500, geos))
+        for _ in range(indicators * 2)
+    ]
+
+    for i in range(indicators):
+        numerator, denominator = columns[2 * i], columns[2 * i + 1]
+        values, errors = ((numerator + denominator) / (denominator * 2.0)).serialize()
+        assert len(values) == len(errors) == geos
+
+
+def test_fetch_columns():
+    engine = create_engine("sqlite://")
+    with engine.connect() as db:
+        columns = fetch_columns(
+            db.execute(
+                text(
+                    """
+                    SELECT '14000US26163500100' AS geoid, 'Tract 5001' AS name,
+                           1200 AS b01001001, 85.5 AS b01001001_moe
+                    UNION ALL
+                    SELECT '14000US26163500200', 'Tract 5002', NULL, NULL
+                    """
+                )
+            )
+        )
+
+        assert columns["geoid"].dtype == object
+        assert columns["name"].tolist() == ["Tract 5001", "Tract 5002"]
+        assert columns["b01001001"].dtype == float
+        assert columns["b01001001"][0] == 1200
+        assert np.isnan(columns["b01001001_moe"][1])
+
+        empty = fetch_columns(
+            db.execute(text("SELECT 'x' AS geoid, 1 AS b01001001 WHERE 1 = 0"))
+        )
+        assert len(empty["geoid"]) == 0
+        assert empty["b01001001"].dtype == float
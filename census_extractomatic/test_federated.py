@@ -0,0 +1,65 @@
+import time
+
+from ._api.federated import SourceResult, fan_out, fuse
+
+
+def test_fan_out_runs_concurrently_and_keeps_partial_results():
+    def fast():
+        return [{"id": "a"}]
+
+    def slow():
+        time.sleep(0.2)
+        return [{"id": "b"}]
+
+    def broken():
+        raise RuntimeError("backend down")
+
+    start = time.perf_counter()
+    results = fan_out({"fast": fast, "slow": slow, "broken": broken}, budget=0.05)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.15
+    assert results["fast"].status == "ok"
+    assert results["fast"].hits == [{"id": "a"}]
+    assert results["slow"].status == "timeout"
+    assert results["slow"].hits == []
+    assert results["broken"].status == "error"
+
+
+def test_fan_out_waits_for_everything_inside_the_budget():
+    def sleeper(seconds, hit):
+        def search():
+            time.sleep(seconds)
+            return [hit]
+
+        return search
+
+    start = time.perf_counter()
+    results = fan_out(
+        {name: sleeper(0.05, {"id": name}) for name in ["a", "b", "c"]}, budget=1
+    )
+
+    # Concurrent, so about as long as one of them
+    assert time.perf_counter() - start < 0.14
+    assert all(result.status == "ok" for result in results.values())
+
+
+def test_fuse_interleaves_and_combines_sources():
+    results = {
+        "geo": SourceResult("ok", 1.0, [{"id": "g1"}, {"id": "g2"}]),
+        "table": SourceResult("ok", 2.0, [{"id": "B01001"}, {"id": "B19013"}]),
+        "variable": SourceResult("ok", 3.0, [{"id": "B19013"}, {"id": "B19013001"}]),
+    }
+
+    fused = fuse(results, limit=10)
+
+    assert [hit["id"] for hit in fused] == [
+        "B19013",  # second for tables and first for variables
+        "g1",
+        "B01001",
+        "g2",
+        "B19013001",
+    ]
+    assert fused[0]["sources"] == ["table", "variable"]
+    assert fused[1]["sources"] == ["geo"]
+    assert [hit["id"] for hit in fuse(results, limit=2)] == ["B19013", "g1"]
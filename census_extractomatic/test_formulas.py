@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from .datatypes import TearColumn
+from .formulas import (
+    Call,
+    Number,
+    Variable,
+    FormulaError,
+    Plan,
+    compile_formula,
+    normalize,
+)
+
+
+@pytest.fixture
+def namespace():
+    return {
+        "b01001001": TearColumn.wrap([100.0, 200.0, None], [10.0, 20.0, 5.0]),
+        "b01001003": TearColumn.wrap([10.0, 30.0, 4.0], [2.0, 3.0, 1.0]),
+        "b01001004": TearColumn.wrap([15.0, 20.0, 6.0], [2.0, 4.0, 1.0]),
+        "land_area": TearColumn.wrap([2589988.0, 5179976.0, 0]),
+    }
+
+
+def test_normalize():
+    assert (
+        normalize(" (/ ( +  B01001003 B01001004 )\tB01001001) ")
+        == "(/ (+ b01001003 b01001004) b01001001)"
+    )
+
+
+def test_parse_tree():
+    formula = compile_formula("(/ (+ B01001003 B01001004) 100)")
+
+    assert formula.tree == Call(
+        "/",
+        (Call("+", (Variable("b01001003"), Variable("b01001004"))), Number(100.0)),
+    )
+    assert formula.variables == {"b01001003", "b01001004"}
+
+
+def test_compiled_once():
+    first = compile_formula("(+ B01001003 B01001004)")
+    assert compile_formula("(+  b01001003   B01001004 )") is first
+
+
+def test_evaluate(namespace):
+    share = compile_formula("(/ (+ B01001003 B01001004) B01001001)").evaluate(namespace)
+    expected = (namespace["b01001003"] + namespace["b01001004"]) / namespace["b01001001"]
+
+    np.testing.assert_array_equal(share.value, expected.value)
+    np.testing.assert_array_equal(share.error, expected.error)
+
+
+def test_cumulative_and_unary(namespace):
+    difference = compile_formula("(- b01001001 b01001003 b01001004)").evaluate(namespace)
+    assert difference.value[0] == 75
+
+    negated = compile_formula("(- b01001003)").evaluate(namespace)
+    assert negated.value[1] == -30
+
+    assert compile_formula("(+ b01001003)").steps == compile_formula("b01001003").steps
+
+
+def test_constants_are_folded(namespace):
+    formula = compile_formula("(/ B01001001 (/ land_area (* 2589.988 1000)))")
+
+    assert [step.op for step in formula.steps] == ["load", "load", "const", "/", "/"]
+    density = formula.evaluate(namespace)
+    assert density.value[0] == pytest.approx(100)
+
+
+def test_comparison(namespace):
+    flags = compile_formula("(> b01001004 b01001003)").evaluate(namespace)
+    assert list(flags) == [True, False, True]
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "",
+        "(+ b01001003 b01001004",
+        "(+ b01001003) b01001004)",
+        "()",
+        "(^ b01001003 2)",
+        "(/ b01001003)",
+        "(/ 1 b01001003)",
+        "(/ 1 0)",
+        "(* 2 (/ 5 (- 3 3)))",
+        "(+ (< b01001003 b01001004) 1)",
+        "(< b01001003 b01001004 b01001001)",
+        "(+ b01001003 $)",
+        "b01001003 b01001004",
+    ],
+)
+def test_invalid_formulas(source):
+    with pytest.raises(FormulaError):
+        compile_formula(source)
+
+
+def test_division_by_zero(namespace):
+    with pytest.raises(FormulaError, match="Division by zero"):
+        compile_formula("(/ 2589988 0)")
+
+    # A variable divided by zero is Empty, like any other zero denominator
+    share = compile_formula("(/ b01001003 0)").evaluate(namespace)
+    assert np.isnan(share.value).all()
+
+
+def test_describe():
+    assert compile_formula("(- (* b01001003 2) b01001004)").describe() == [
+        "t0 = b01001003",
+        "t1 = 2.0",
+        "t2 = t0 * t1",
+        "t3 = b01001004",
+        "t4 = t2 - t3",
+    ]
+
+
+def test_plan_shares_subexpressions(namespace):
+    formulae = [
+        ("pct_under_5", compile_formula("(/ b01001003 b01001001)")),
+        ("pct_5_to_9", compile_formula("(/ b01001004 b01001001)")),
+        ("pct_under_10", compile_formula("(/ (+ b01001003 b01001004) b01001001)")),
+        ("under_10", compile_formula("(+ b01001003 b01001004)")),
+        ("density", compile_formula("(/ b01001001 (/ land_area 2589988))")),
+        ("density_under_10", compile_formula("(/ (+ b01001003 b01001004) (/ land_area 2589988))")),
+    ]
+    plan = Plan(formulae)
+
+    # Each variable is loaded once, and (+ b01001003 b01001004) and
+    # (/ land_area 2589988) are each computed once
+    loads = [step.args for step in plan.steps if step.op == "load"]
+    assert sorted(loads) == ["b01001001", "b01001003", "b01001004", "land_area"]
+    assert plan.unshared_operations == 10
+    assert plan.operations == 7
+
+    results = dict(plan.evaluate(namespace))
+    assert list(results) == [name for name, _ in formulae]
+    for name, formula in formulae:
+        expected = formula.evaluate(namespace)
+        np.testing.assert_array_equal(results[name].value, expected.value)
+        np.testing.assert_array_equal(results[name].error, expected.error)
+
+    described = plan.describe()
+    assert described["operations_without_sharing"] == 10
+    under_10 = described["outputs"]["under_10"]
+    assert f"{described['outputs']['pct_under_10']} = {under_10} / t1" in described["steps"]
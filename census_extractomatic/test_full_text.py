@@ -0,0 +1,37 @@
+from ._api.full_text import (
+    choose_table,
+    search_metadata,
+    to_prefix_tsquery,
+    top_results,
+)
+
+
+def test_to_prefix_tsquery():
+    assert to_prefix_tsquery("median household inc") == "median & household & inc:*"
+    assert to_prefix_tsquery("  O'Brien!  ") == "O & Brien:*"
+    assert to_prefix_tsquery("&|!") is None
+    assert to_prefix_tsquery(None) is None
+
+
+def test_search_without_q():
+    # Nothing to search for, so the database isn't asked
+    assert search_metadata(None, None) == []
+
+
+def test_choose_table():
+    assert choose_table(["B19013", "C19013", "B19013A"]) == "C19013"
+    assert choose_table(["B19013A", "B19013B", "B19013"]) == "B19013"
+    assert choose_table(["B19013B", "C19013A", "B19013A"]) == "C19013A"
+    assert choose_table(["B19013C"]) == ""
+
+
+def test_top_results_merges_types_and_pages():
+    profiles = [{"type": "profile", "score": 0.9}, {"type": "profile", "score": 0.2}]
+    tables = [{"type": "table", "score": 0.7}, {"type": "table", "score": 0.5}]
+    topics = [{"type": "topic", "score": 1}]
+
+    ranked = top_results([profiles, tables, topics], limit=10)
+    assert [row["score"] for row in ranked] == [1, 0.9, 0.7, 0.5, 0.2]
+
+    assert top_results([profiles, tables, topics], limit=2, offset=1) == ranked[1:3]
+    assert top_results([[], []], limit=5) == []
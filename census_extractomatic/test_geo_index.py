@@ -0,0 +1,226 @@
+from collections import namedtuple
+import random
+
+import shapely
+
+from ._api.geo_index import PrefixIndex, SpatialIndex, rank
+
+
+Row = namedtuple(
+    "Row",
+    [
+        "full_geoid",
+        "sumlevel",
+        "display_name",
+        "population",
+        "priority",
+        "prefix_match_name",
+    ],
+)
+
+
+ROWS = [
+    Row("16000US2622000", "160", "Detroit, MI", 639111, 20, "Detroit, MI"),
+    Row("16000US2622000", "160", "Detroit, MI", 639111, 20, "Detroit city"),
+    Row("06000US2616322000", "060", "Detroit city, Wayne County, MI", 639111, 30, "Detroit city, Wayne County, MI"),
+    Row("31000US19820", "310", "Detroit-Warren-Dearborn, MI Metro Area", 4345761, 10, "Detroit-Warren-Dearborn, MI Metro Area"),
+    Row("16000US2621000", "160", "Dearborn, MI", 109976, 20, "Dearborn, MI"),
+    Row("16000US2649000", "160", "Livonia, MI", 95535, 20, "Livonia, MI"),
+    Row("14000US26163500100", "140", "Census Tract 5001, Wayne, MI", None, 30, "Census Tract 5001, Wayne, MI"),
+]
+
+
+def test_prefix_ranked_and_deduped():
+    index = PrefixIndex(ROWS)
+
+    results = index.search("det", ("160", "060", "310"))
+
+    assert [r.full_geoid for r in results] == [
+        "31000US19820",  # lowest priority wins
+        "16000US2622000",  # only once despite two matching names
+        "06000US2616322000",
+    ]
+
+
+def test_prefix_sumlevel_filter_and_case():
+    index = PrefixIndex(ROWS)
+
+    assert [r.full_geoid for r in index.search("DEtroit c", ("160",))] == [
+        "16000US2622000"
+    ]
+    assert index.search("detroit", ("140",)) == []
+    assert index.search("zzz", ("160",)) == []
+
+
+def test_fuzzy_search_misspelled_names():
+    index = PrefixIndex(ROWS)
+
+    assert index.search("dettroit", ("160", "060")) == []
+    assert [r.full_geoid for r in index.fuzzy_search("dettroit", ("160", "060"))] == [
+        "16000US2622000",  # 'Detroit, MI' is the closer match
+        "06000US2616322000",
+    ]
+    assert [r.full_geoid for r in index.fuzzy_search("livonai", ("160",))] == [
+        "16000US2649000"
+    ]
+    assert index.fuzzy_search("livonai", ("060",)) == []
+
+
+def test_short_and_long_prefixes_agree_with_brute_force():
+    rng = random.Random(1)
+    letters = "abc"
+    rows = [
+        Row(
+            f"16000US{i:07d}",
+            rng.choice(["140", "160", "060"]),
+            f"geo {i}",
+            rng.choice([None, rng.randint(0, 1000)]),
+            rng.choice([10, 20, 30]),
+            "".join(rng.choice(letters) for _ in range(rng.randint(1, 6))),
+        )
+        for i in range(500)
+    ]
+    index = PrefixIndex(rows, depth=2, top_k=10)
+
+    for q in ["a", "ab", "abc", "b", "cab", "ca"]:
+        for sumlevs in [("160",), ("140", "060"), ("140", "160", "060")]:
+            expected = sorted(
+                {
+                    (row.full_geoid, row.sumlevel, row.display_name, row.population, row.priority)
+                    for row in rows
+                    if row.prefix_match_name.startswith(q)
+                    and row.sumlevel in sumlevs
+                },
+                key=lambda entry: rank(index._entries[entry[0]]),
+            )[:10]
+
+            assert [r.full_geoid for r in index.search(q, sumlevs, limit=10)] == [
+                entry[0] for entry in expected
+            ]
+
+
+GeomRow = namedtuple(
+    "GeomRow",
+    ["full_geoid", "sumlevel", "display_name", "population", "priority", "geom"],
+)
+
+
+def box_wkb(west, south, east, north):
+    return shapely.to_wkb(shapely.box(west, south, east, north))
+
+
+def spatial_index():
+    rows = [
+        GeomRow("05000US26163", "050", "Wayne County, MI", 1793561, 20, box_wkb(0, 0, 2, 2)),
+        GeomRow("05000US26125", "050", "Oakland County, MI", 1274395, 20, box_wkb(0, 2, 2, 4)),
+        GeomRow("14000US26163000100", "140", "Census Tract 1", 3000, 30, box_wkb(0, 0, 1, 1)),
+        GeomRow("14000US26163000200", "140", "Census Tract 2", 2000, 30, box_wkb(1, 0, 2, 1)),
+        # A duplicate alias row shouldn't show up twice
+        GeomRow("14000US26163000200", "140", "Census Tract 2", 2000, 30, box_wkb(1, 0, 2, 1)),
+    ]
+    # No NECTAs (350) in Michigan, but they were loaded
+    return SpatialIndex(
+        rows, {"04000US26": box_wkb(0, 0, 2, 4)}, ("050", "140", "350")
+    )
+
+
+def test_spatial_point_lookup():
+    index = spatial_index()
+
+    assert len(index) == 4
+    assert [e.full_geoid for e in index.search(0.5, 0.5, ("050", "140"))] == [
+        "05000US26163",
+        "14000US26163000100",
+    ]
+    # ST_Intersects counts the shared border for both neighbors
+    assert {e.full_geoid for e in index.search(0.5, 1.0, ("140",))} == {
+        "14000US26163000100",
+        "14000US26163000200",
+    }
+    assert index.search(1.5, 1.5, ("140",)) == []
+
+
+def test_spatial_falls_back_outside_loaded_states_and_sumlevels():
+    index = spatial_index()
+
+    assert index.search(10, 10, ("050",)) is None
+    assert index.search(0.5, 0.5, ("160",)) is None
+
+
+def test_spatial_sumlevels_with_nothing_in_the_loaded_states():
+    index = spatial_index()
+
+    assert [e.full_geoid for e in index.search(0.5, 0.5, ("050", "350"))] == [
+        "05000US26163"
+    ]
+    assert index.search(0.5, 0.5, ("350",)) == []
+    assert index.locate([0.5], [0.5], ("350",)) == [{}]
+
+
+def test_nearest_in_meters():
+    rows = [
+        GeomRow("05000US26163", "050", "Wayne County, MI", 1793561, 20, box_wkb(0, 0, 2, 2)),
+        GeomRow("05000US26125", "050", "Oakland County, MI", 1274395, 20, box_wkb(0, 2, 2, 4)),
+        GeomRow("14000US26163000100", "140", "Census Tract 1", 3000, 30, box_wkb(0, 0, 1, 1)),
+        GeomRow("14000US26163000200", "140", "Census Tract 2", 2000, 30, box_wkb(1, 0, 2, 1)),
+    ]
+    index = SpatialIndex(rows, {"04000US26": box_wkb(-10, -10, 10, 10)})
+
+    tracts = index.nearest(("140",), limit=2, lat=1.5, lon=0.5)
+    assert [entry.full_geoid for entry, _ in tracts] == [
+        "14000US26163000100",
+        "14000US26163000200",
+    ]
+    # Half a degree of latitude, then to the corner at (1, 1)
+    assert abs(tracts[0][1] - 55597) < 10
+    assert abs(tracts[1][1] - 78608) < 100
+
+    counties = index.nearest(("050",), limit=2, lat=1.5, lon=0.5)
+    assert [(entry.full_geoid, meters) for entry, meters in counties][0] == (
+        "05000US26163",
+        0.0,
+    )
+
+    # From a geography, leaving itself out
+    assert [
+        (entry.full_geoid, meters)
+        for entry, meters in index.nearest(("140",), limit=1, geoid="14000US26163000100")
+    ] == [("14000US26163000200", 0.0)]
+
+
+def test_nearest_falls_back_near_the_edge_of_the_loaded_states():
+    index = spatial_index()
+
+    assert index.nearest(("140",), limit=2, lat=0.5, lon=0.5) is None
+    assert index.nearest(("160",), limit=2, lat=0.5, lon=0.5) is None
+    assert index.nearest(("140",), limit=2, geoid="14000US99999999999") is None
+
+
+def test_nearest_with_sumlevels_that_have_nothing_loaded():
+    rows = [
+        GeomRow("14000US26163000100", "140", "Census Tract 1", 3000, 30, box_wkb(0, 0, 1, 1)),
+    ]
+    index = SpatialIndex(rows, {"04000US26": box_wkb(-10, -10, 10, 10)}, ("140", "350"))
+
+    assert [
+        entry.full_geoid
+        for entry, _ in index.nearest(("140", "350"), limit=1, lat=1.5, lon=0.5)
+    ] == ["14000US26163000100"]
+
+
+def test_locate_many_points():
+    index = spatial_index()
+
+    located = index.locate([0.5, 0.5, 10.0], [0.5, 1.5, 10.0], ("050", "140"))
+
+    assert {s: e.full_geoid for s, e in located[0].items()} == {
+        "050": "05000US26163",
+        "140": "14000US26163000100",
+    }
+    assert {s: e.full_geoid for s, e in located[1].items()} == {
+        "050": "05000US26163",
+        "140": "14000US26163000200",
+    }
+    # Outside the loaded states
+    assert located[2] is None
+    assert index.locate([0.5], [0.5], ("150",)) == [None]
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from ._api.reverse_geocode import (
+    Point,
+    csv_lines,
+    ndjson_lines,
+    parse_csv_points,
+    parse_json_points,
+    reverse_geocode,
+)
+
+
+def test_parse_json_points():
+    assert parse_json_points({"points": [{"lat": 42.3, "lon": -83.0}]}) == [
+        Point(1, 42.3, -83.0)
+    ]
+    assert parse_json_points([{"id": "a", "lat": "42.3", "lon": "-83"}]) == [
+        Point("a", 42.3, -83.0)
+    ]
+
+    with pytest.raises(ValueError):
+        parse_json_points({"points": [{"lat": 142, "lon": 0}]})
+    with pytest.raises(ValueError):
+        parse_json_points({"points": [[42.3, -83.0]]})
+    with pytest.raises(ValueError):
+        parse_json_points(None)
+
+
+def test_parse_csv_points():
+    body = "parcel,ID,Latitude,Longitude\nx,17,42.33,-83.05\ny,18,42.24,-83.61\n"
+    assert parse_csv_points(body) == [
+        Point("17", 42.33, -83.05),
+        Point("18", 42.24, -83.61),
+    ]
+    assert parse_csv_points("lat,lon\n1,2\n") == [Point(1, 1.0, 2.0)]
+
+    with pytest.raises(ValueError):
+        parse_csv_points("x,y\n1,2\n")
+    with pytest.raises(ValueError):
+        parse_csv_points("lat,lon\nnorth,west\n")
+
+
+def test_reverse_geocode_uses_db_only_for_uncovered_points():
+    points = [Point(i, float(i), float(-i)) for i in range(7)]
+    db_calls = []
+
+    def in_memory(lats, lons):
+        # Even latitudes are 'covered'
+        return [{"140": f"mem{lat:g}"} if lat % 2 == 0 else None for lat in lats]
+
+    def in_db(lats, lons):
+        db_calls.append(lats)
+        return [{"140": f"db{lat:g}"} for lat in lats]
+
+    results = list(reverse_geocode(points, in_memory, in_db, chunk_size=3))
+
+    assert [point.id for point, _ in results] == list(range(7))
+    assert [geoids["140"] for _, geoids in results] == [
+        "mem0", "db1", "mem2", "db3", "mem4", "db5", "mem6",
+    ]
+    assert db_calls == [[1.0], [3.0, 5.0]]
+
+
+def test_output_formats():
+    results = [(Point("a", 1.0, 2.0), {"140": "14000US1"}), (Point("b", 3.0, 4.0), {})]
+
+    lines = list(ndjson_lines(results, ("140", "050")))
+    assert json.loads(lines[0]) == {
+        "id": "a",
+        "lat": 1.0,
+        "lon": 2.0,
+        "geoids": {"140": "14000US1", "050": None},
+    }
+    assert all(line.endswith("\n") for line in lines)
+
+    assert "".join(csv_lines(results, ("140",))).splitlines() == [
+        "id,lat,lon,geoid_140",
+        "a,1.0,2.0,14000US1",
+        "b,3.0,4.0,",
+    ]
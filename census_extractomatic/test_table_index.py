@@ -0,0 +1,127 @@
+from collections import namedtuple
+
+from ._api.table_index import TableIndex, find_missing, tokenize
+
+
+TableRow = namedtuple(
+    "TableRow",
+    ["table_id", "table_title", "simple_table_title", "universe", "topics"],
+)
+ColumnRow = namedtuple(
+    "ColumnRow",
+    ["table_id", "column_id", "column_title", "indent", "parent_column_id"],
+)
+
+
+TABLES = [
+    TableRow("B01001", "Sex by Age", "Sex by Age", "Total population", ["age", "gender"]),
+    TableRow("B19013", "Median Household Income in the Past 12 Months", "Median Household Income", "Households", ["income"]),
+    TableRow("B19001", "Household Income in the Past 12 Months", "Household Income", "Households", ["income"]),
+    TableRow("B25003", "Tenure", "Tenure", "Occupied housing units", ["housing"]),
+    TableRow("B11001", "Household Type", "Household Type", "Households", ["families"]),
+]
+
+COLUMNS = [
+    ColumnRow("B01001", "B01001002", "Male:", 1, "B01001001"),
+    ColumnRow("B01001", "B01001001", "Total:", 0, None),
+    ColumnRow("B25003", "B25003002", "Owner occupied", 1, "B25003001"),
+    ColumnRow("B11001", "B11001002", "Family households:", 1, "B11001001"),
+]
+
+
+def test_tokenize():
+    assert tokenize("Median Household Income in the Past 12 Months") == [
+        "median",
+        "household",
+        "income",
+        "past",
+        "12",
+        "month",
+    ]
+    assert tokenize(["families", None, "age"]) == ["family", "age"]
+    assert tokenize(None) == []
+
+
+def test_ranked_multi_word_search():
+    index = TableIndex(TABLES, COLUMNS)
+
+    results = [row.table_id for row in index.search_tables("median household income", limit=5)]
+
+    # Matching all three words beats matching two, and both beat one
+    assert results[:2] == ["B19013", "B19001"]
+    assert "B11001" in results
+    assert "B01001" not in results
+
+
+def test_prefix_of_last_word_and_column_titles():
+    index = TableIndex(TABLES, COLUMNS)
+
+    assert [row.table_id for row in index.search_tables("tenu")] == ["B25003"]
+    # Only mentioned in a column title
+    assert [row.table_id for row in index.search_tables("owner")] == ["B25003"]
+    assert index.search_tables("zzz") == []
+    assert index.search_tables("the") == []
+
+
+def test_misspellings_fall_back_to_similar_titles():
+    index = TableIndex(TABLES, COLUMNS)
+
+    assert [row.table_id for row in index.search_tables("houshold incme")] == [
+        "B19001",
+        "B19013",
+    ]
+    # Similar titles rank below any table matching a word exactly
+    assert all(key[0] == 0 for key, _ in index.rank("houshold incme"))
+    assert all(key[0] < 0 for key, _ in index.rank("median"))
+
+
+def test_similar_tables():
+    index = TableIndex(TABLES, COLUMNS)
+
+    assert [row.table_id for row in index.similar_tables("houshold incme")] == [
+        "B19001",
+        "B19013",
+    ]
+    assert [
+        row.table_id for row in index.similar_tables("houshold incme", offset=1)
+    ] == ["B19013"]
+    assert index.similar_tables("zzzzzz") == []
+
+
+def test_paging():
+    index = TableIndex(TABLES, COLUMNS)
+
+    everything = index.search_tables("household", limit=10)
+    assert index.search_tables("household", limit=2, offset=1) == everything[1:3]
+
+
+def test_table_id_prefix_and_columns():
+    index = TableIndex(TABLES, COLUMNS)
+
+    assert [row.table_id for row in index.tables_by_id_prefix("b190")] == [
+        "B19001",
+        "B19013",
+    ]
+    assert [column.column_id for column in index.columns["B01001"]] == [
+        "B01001001",
+        "B01001002",
+    ]
+
+
+def test_find_missing_variables():
+    acs = TableIndex(TABLES, COLUMNS)
+    d3 = TableIndex(
+        [TableRow("D3EVICT", "Evictions", "Evictions", "Renter households", ["housing"])],
+        [ColumnRow("D3EVICT", "D3EVICT001", "Total filings", 0, None)],
+    )
+
+    assert acs.has_table("b01001") and acs.has_column("b01001002")
+    assert not acs.has_column("B01001099")
+
+    missing_tables, missing_columns = find_missing(
+        ["b01001001", "B01001099", "b99999001", "d3evict001", "D3EVICT002"],
+        [acs, d3],
+    )
+
+    assert missing_tables == {"B99999"}
+    assert missing_columns == {"B01001099", "D3EVICT002"}
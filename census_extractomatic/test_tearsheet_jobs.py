@@ -0,0 +1,104 @@
+import json
+import os
+import time
+
+from .tearsheet_jobs import (
+    RESULT_TTL,
+    job_id,
+    read_status,
+    result_path,
+    status_path,
+    submit_job,
+)
+
+
+PARAMS = {
+    "geographies": ["tracts|05000US26163"],
+    "indicators": ["pct_under_5|(/ B01001003 B01001001)"],
+    "release": "acs2022_5yr",
+    "how": "json",
+    "resolution": "full",
+}
+
+
+def wait_for(directory, id, seconds=5):
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        status = read_status(directory, id)
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.01)
+
+    raise AssertionError(f"job {id} didn't finish")
+
+
+def test_job_id_is_a_hash_of_the_request():
+    assert job_id(PARAMS) == job_id(dict(reversed(PARAMS.items())))
+    assert job_id(PARAMS) != job_id({**PARAMS, "how": "geojson"})
+
+
+def test_jobs_are_run_once(tmp_path):
+    calls = []
+
+    def compute(params):
+        calls.append(params)
+        return [{"geoid": "14000US26163500100", "pct_under_5": 0.25}]
+
+    status = submit_job(tmp_path, PARAMS, compute)
+    assert status["status"] in ("queued", "running", "done")
+
+    done = wait_for(tmp_path, status["job_id"])
+    assert done["status"] == "done"
+
+    with open(result_path(tmp_path, status["job_id"])) as f:
+        assert json.load(f)[0]["pct_under_5"] == 0.25
+
+    assert submit_job(tmp_path, PARAMS, compute)["status"] == "done"
+    assert len(calls) == 1
+
+
+def test_failed_jobs(tmp_path):
+    def compute(params):
+        raise ValueError("This sheet would have too many values")
+
+    status = submit_job(tmp_path, PARAMS, compute)
+    failed = wait_for(tmp_path, status["job_id"])
+
+    assert failed["status"] == "failed"
+    assert failed["message"] == "This sheet would have too many values"
+
+    # A failed job is tried again when it's requested again
+    assert submit_job(tmp_path, PARAMS, lambda params: [])["status"] != "failed"
+
+
+def test_a_claimed_job_is_not_run_again(tmp_path):
+    # Another web worker created the status file first
+    id = job_id(PARAMS)
+    with open(status_path(tmp_path, id), "x") as f:
+        json.dump({"job_id": id, "status": "queued", "updated": time.time()}, f)
+
+    calls = []
+    status = submit_job(tmp_path, PARAMS, calls.append)
+
+    assert status["status"] == "queued"
+    time.sleep(0.05)
+    assert calls == []
+
+
+def test_expired_jobs_are_removed(tmp_path):
+    old = time.time() - RESULT_TTL - 60
+    for name in ("0" * 32 + ".status.json", "0" * 32 + ".json"):
+        (tmp_path / name).write_text("{}")
+        os.utime(tmp_path / name, (old, old))
+
+    status = submit_job(tmp_path, PARAMS, lambda params: [])
+    wait_for(tmp_path, status["job_id"])
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [f"{status['job_id']}.status.json", f"{status['job_id']}.json"]
+    )
+
+
+def test_unknown_jobs(tmp_path):
+    assert read_status(tmp_path, "0" * 32) is None
+    assert read_status(tmp_path, "../../etc/passwd") is None
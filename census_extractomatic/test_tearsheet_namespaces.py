@@ -0,0 +1,51 @@
+import numpy as np
+
+from .datatypes import TearColumn
+from .tearsheet_namespaces import (
+    NamespaceCache,
+    NamespaceEntry,
+    extend_namespace,
+    namespace_key,
+)
+
+
+def test_keys():
+    assert namespace_key(["a", "b"], "acs2022_5yr") == namespace_key(
+        ["b", "a"], "acs2022_5yr", resolution="low"
+    )
+    assert namespace_key(["a"], "acs2022_5yr", geom=True, resolution="low") != (
+        namespace_key(["a"], "acs2022_5yr", geom=True, resolution="full")
+    )
+
+
+def test_least_recently_used_entries_are_dropped():
+    cache = NamespaceCache(maxsize=2)
+    for key in "abc":
+        cache.put(key, NamespaceEntry({}, {}))
+        cache.get("a")
+
+    assert len(cache) == 2
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+
+
+def test_extend_namespace_aligns_rows():
+    namespace = {
+        "geoid": np.array(["g1", "g2", "g3"]),
+        "name": np.array(["One", "Two", "Three"]),
+        "b01001001": TearColumn.wrap([100.0, 200.0, 300.0], [1.0, 2.0, 3.0]),
+    }
+    fetched = {
+        "geoid": np.array(["g3", "g1", "g2"]),
+        "name": np.array(["Three", "One", "Two"]),
+        "b01001003": TearColumn.wrap([30.0, 10.0, 20.0], [3.0, 1.0, 2.0]),
+    }
+
+    extended = extend_namespace(namespace, fetched)
+
+    assert list(extended["b01001003"].value) == [10.0, 20.0, 30.0]
+    assert extended["b01001001"] is namespace["b01001001"]
+    assert "b01001003" not in namespace
+
+    fetched["geoid"] = np.array(["g3", "g1", "g4"])
+    assert extend_namespace(namespace, fetched) is None
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+import pytest
+
+from .datatypes import TearColumn
+from .formulas import Plan, compile_formula
+from .tearsheet_workers import (
+    TearsheetLimitError,
+    build_records,
+    check_sheet_size,
+    compute_sheet,
+    time_limit,
+)
+
+
+@pytest.fixture
+def plan():
+    return Plan(
+        [
+            ("b01001001", compile_formula("b01001001")),
+            ("pct_under_5", compile_formula("(/ b01001003 b01001001)")),
+            ("mostly_young", compile_formula("(> b01001003 50)")),
+        ]
+    )
+
+
+@pytest.fixture
+def namespace():
+    return {
+        "geoid": np.array(["14000US26163500100", "14000US26163500200"]),
+        "name": np.array(["Census Tract 5001", "Census Tract 5002"]),
+        "b01001001": TearColumn.wrap([200.0, 400.0], [20.0, 30.0]),
+        "b01001003": TearColumn.wrap([50.0, 100.0], [5.0, 10.0]),
+    }
+
+
+def test_build_records(plan, namespace):
+    records = build_records(namespace, plan.evaluate(namespace))
+
+    assert records[0]["geoid"] == "14000US26163500100"
+    assert records[0]["b01001001"] == 200.0
+    assert records[1]["b01001001_moe"] == 30.0
+    assert records[1]["pct_under_5"] == 0.25
+    assert [record["mostly_young"] for record in records] == [False, True]
+
+
+def test_compute_sheet_in_worker(plan, namespace):
+    results = compute_sheet(plan, namespace)
+
+    assert [name for name, _ in results] == ["b01001001", "pct_under_5", "mostly_young"]
+    assert build_records(namespace, results) == build_records(
+        namespace, plan.evaluate(namespace)
+    )
+
+
+def test_out_of_time():
+    with pytest.raises(TearsheetLimitError):
+        compute_sheet(Plan([]), {}, seconds=0)
+
+    start = time.monotonic()
+    with pytest.raises(TearsheetLimitError):
+        with time_limit(0.05):
+            while True:
+                pass
+    assert time.monotonic() - start < 1
+
+
+def test_check_sheet_size():
+    check_sheet_size(3000, 20)
+
+    with pytest.raises(TearsheetLimitError, match="Split it"):
+        check_sheet_size(20000, 40)
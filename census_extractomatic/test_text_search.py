@@ -1,7 +1,11 @@
 import logging
 
 from census_extractomatic.metadata_api.connection import public_engine
-from ._api.access import get_parent_geoids, get_details_for_geoids
+from ._api.access import (
+    get_parent_geoids,
+    get_details_for_geoids,
+    search_geos_by_query as ranked_geo_search,
+)
 from ._api._access.geography import search_geos_by_query
 
 logger = logging.getLogger()
@@ -13,6 +17,22 @@ def __test_search_geods_by_query():
         assert result.fetchone().full_geoid == "06000US2616322000"
 
 
+def test_ranked_geo_search():
+    with public_engine.connect() as db:
+        first_page = ranked_geo_search(
+            "Detroit", db, limit=5, sumlevs=("160", "060")
+        ).fetchall()
+        second_page = ranked_geo_search(
+            "Detroit", db, limit=5, offset=5, sumlevs=("160", "060")
+        ).fetchall()
+
+        assert len(first_page) == 5
+        assert all("Detroit" in row.display_name for row in first_page)
+        assert not {row.full_geoid for row in first_page} & {
+            row.full_geoid for row in second_page
+        }
+
+
 def test_get_parent_geoids():
     with public_engine.connect() as db:
         parents = get_parent_geoids("06000US2616322000", db)
@@ -0,0 +1,122 @@
+import gzip
+import os
+
+import pytest
+
+from ._api.access import ViewportLocation, block_params
+from ._api.tile_store import (
+    MBTilesStore,
+    _get_store,
+    read_stored_tile,
+    tile_store_path,
+)
+
+
+def test_viewport_bounds_world():
+    west, south, east, north = ViewportLocation(0, 0, 0).bounds()
+
+    assert west == -180.0
+    assert east == 180.0
+    assert north == pytest.approx(85.0511, abs=1e-4)
+    assert south == pytest.approx(-85.0511, abs=1e-4)
+
+
+def test_viewport_bounds_livonia():
+    # One of the tiles Livonia, MI requests at zoom 11
+    west, south, east, north = ViewportLocation(11, 549, 757).bounds()
+
+    assert west < east
+    assert south < north
+    assert west < -83.37 < east
+    assert south < 42.4 < north
+
+
+def test_viewport_containing_roundtrip():
+    loc = ViewportLocation(11, 549, 757)
+    west, south, east, north = loc.bounds()
+
+    found = ViewportLocation.containing(11, (south + north) / 2, (west + east) / 2)
+
+    assert (found.x, found.y) == (549, 757)
+
+
+def test_viewport_covering_michigan():
+    tiles = list(ViewportLocation.covering(5, -90.42, 41.69, -82.12, 48.31))
+
+    assert len(tiles) == len({(t.x, t.y) for t in tiles})
+    assert all(t.zoom == 5 for t in tiles)
+    livonia = ViewportLocation.containing(5, 42.4, -83.37)
+    assert (livonia.x, livonia.y) in {(t.x, t.y) for t in tiles}
+
+
+def test_viewport_metatile():
+    # Livonia's viewport spans x=548-552, y=756-758
+    block = ViewportLocation(11, 549, 757).metatile(4)
+
+    assert len(block) == 16
+    assert {(t.x, t.y) for t in block} == {
+        (x, y) for x in range(548, 552) for y in range(756, 760)
+    }
+    assert ViewportLocation(11, 551, 759).metatile(4) == block
+    assert ViewportLocation(11, 552, 757) not in block
+
+
+def test_viewport_metatile_edge_of_map():
+    assert ViewportLocation(0, 0, 0).metatile(4) == [ViewportLocation(0, 0, 0)]
+    assert len(ViewportLocation(1, 1, 1).metatile(4)) == 4
+
+
+def test_block_params():
+    block = ViewportLocation(11, 549, 757).metatile(4)
+    params = block_params(block)
+
+    assert len(params["xs"]) == len(params["wests"]) == 16
+    assert params["block_west"] == block[0].bounds()[0]
+    assert params["block_north"] == block[0].bounds()[3]
+    assert params["block_east"] == block[-1].bounds()[2]
+    assert params["block_south"] == block[-1].bounds()[1]
+
+
+def test_tile_store_roundtrip(tmp_path):
+    path = tile_store_path(tmp_path, "tiger2022", "140")
+    store = MBTilesStore.create(path, "test", (-90.42, 41.69, -82.12, 48.31), 9, 13)
+    with store:
+        store.put_many([(11, 549, 757, b"tile bytes"), (11, 549, 758, b"")])
+
+    with MBTilesStore.open(path) as store:
+        # Stored in TMS order, read back in XYZ order
+        row = store.connection.execute(
+            "SELECT tile_row FROM tiles WHERE tile_column=549 ORDER BY tile_row"
+        ).fetchall()
+        assert [r[0] for r in row] == [2**11 - 1 - 758, 2**11 - 1 - 757]
+        assert store.metadata()["format"] == "pbf"
+
+    tile = read_stored_tile(tmp_path, "tiger2022", "140", 11, 549, 757)
+    assert gzip.decompress(tile) == b"tile bytes"
+
+    # Empty tiles are stored so they aren't re-rendered live
+    empty = read_stored_tile(tmp_path, "tiger2022", "140", 11, 549, 758)
+    assert gzip.decompress(empty) == b""
+    assert read_stored_tile(tmp_path, "tiger2022", "140", 11, 550, 757) is None
+    assert read_stored_tile(tmp_path, "tiger2022", "050", 11, 549, 757) is None
+    assert read_stored_tile(None, "tiger2022", "140", 11, 549, 757) is None
+
+
+def test_stored_tiles_reuse_the_connection(tmp_path):
+    path = tile_store_path(tmp_path, "tiger2022", "140")
+    bounds = (-90.42, 41.69, -82.12, 48.31)
+    with MBTilesStore.create(path, "test", bounds, 9, 13) as store:
+        store.put_many([(11, 549, 757, b"first")])
+
+    tile = read_stored_tile(tmp_path, "tiger2022", "140", 11, 549, 757)
+    assert gzip.decompress(tile) == b"first"
+    assert _get_store(path) is _get_store(path)
+
+    # Re-rendered into a new file and moved into place
+    rendered = tmp_path / "rendered.mbtiles"
+    with MBTilesStore.create(rendered, "test", bounds, 9, 13) as store:
+        store.put_many([(11, 549, 757, b"second")])
+    os.replace(rendered, path)
+
+    tile = read_stored_tile(tmp_path, "tiger2022", "140", 11, 549, 757)
+    assert gzip.decompress(tile) == b"second"
@@ -0,0 +1,121 @@
+import pytest
+
+from ._api.topojson import topology
+
+
+def square(x, y, size=1.0):
+    return {
+        "type": "Polygon",
+        "coordinates": [
+            [
+                [x, y],
+                [x + size, y],
+                [x + size, y + size],
+                [x, y + size],
+                [x, y],
+            ]
+        ],
+    }
+
+
+def decode_ring(topo, arc_ids):
+    (kx, ky), (x0, y0) = topo["transform"]["scale"], topo["transform"]["translate"]
+
+    points = []
+    for arc_id in arc_ids:
+        x = y = 0
+        arc = []
+        for dx, dy in topo["arcs"][arc_id if arc_id >= 0 else ~arc_id]:
+            x, y = x + dx, y + dy
+            arc.append((x * kx + x0, y * ky + y0))
+        if arc_id < 0:
+            arc.reverse()
+        # Consecutive arcs share their joining point
+        points.extend(arc if not points else arc[1:])
+
+    return points
+
+
+def test_shared_border_stored_once():
+    topo = topology(
+        {
+            "tracts": [
+                {"type": "Feature", "id": "a", "geometry": square(0, 0)},
+                {"type": "Feature", "id": "b", "geometry": square(1, 0)},
+            ]
+        }
+    )
+
+    a, b = topo["objects"]["tracts"]["geometries"]
+
+    # Two outer borders and the one they share
+    assert len(topo["arcs"]) == 3
+    assert (a["id"], b["id"]) == ("a", "b")
+
+    shared = set(a["arcs"][0]) & {~arc for arc in b["arcs"][0]}
+    assert len(shared) == 1
+
+
+def test_rings_decode_to_original_coordinates():
+    features = [
+        {"type": "Feature", "id": "a", "geometry": square(-83.5, 42.3, 0.1)},
+        {"type": "Feature", "id": "b", "geometry": square(-83.4, 42.3, 0.1)},
+    ]
+    topo = topology({"tracts": features})
+
+    for feature, geometry in zip(features, topo["objects"]["tracts"]["geometries"]):
+        ring = decode_ring(topo, geometry["arcs"][0])
+        original = feature["geometry"]["coordinates"][0]
+
+        assert ring[0] == ring[-1]
+        assert len(ring) == len(original)
+        assert {(round(x, 5), round(y, 5)) for x, y in ring} == {
+            (round(x, 5), round(y, 5)) for x, y in original
+        }
+
+
+def test_identical_rings_share_an_arc():
+    # A hole and the island filling it, walked in opposite directions
+    outer = square(0, 0, 3)["coordinates"][0]
+    hole = list(reversed(square(1, 1)["coordinates"][0]))
+
+    topo = topology(
+        {
+            "geos": [
+                {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [outer, hole]}},
+                {"type": "Feature", "geometry": square(1, 1)},
+            ]
+        }
+    )
+
+    donut, island = topo["objects"]["geos"]["geometries"]
+    assert len(topo["arcs"]) == 2
+    assert donut["arcs"][1][0] in (island["arcs"][0][0], ~island["arcs"][0][0])
+
+
+def test_multipolygon_and_missing_geometry():
+    multi = {
+        "type": "MultiPolygon",
+        "coordinates": [square(0, 0)["coordinates"], square(5, 5)["coordinates"]],
+    }
+    topo = topology(
+        {
+            "geos": [
+                {"type": "Feature", "properties": {"name": "Islands"}, "geometry": multi},
+                {"type": "Feature", "properties": {}, "geometry": None},
+            ]
+        }
+    )
+
+    islands, missing = topo["objects"]["geos"]["geometries"]
+    assert islands["type"] == "MultiPolygon"
+    assert len(islands["arcs"]) == 2
+    assert islands["properties"] == {"name": "Islands"}
+    assert missing == {"type": None}
+
+
+def test_unsupported_geometry():
+    with pytest.raises(ValueError):
+        topology(
+            {"geos": [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [0, 0]}}]}
+        )
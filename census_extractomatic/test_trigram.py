@@ -0,0 +1,49 @@
+import pytest
+
+from ._api.trigram import TrigramIndex, trigrams, word_similarity
+
+
+def test_trigrams_match_pg_trgm():
+    # SELECT show_trgm('Ann Arbor');
+    assert trigrams("Ann Arbor") == {
+        "  a", " an", "ann", "nn ",
+        " ar", "arb", "rbo", "bor", "or ",
+    }
+    assert trigrams("!!") == set()
+
+
+def test_word_similarity_matches_pg_trgm():
+    # The examples in the pg_trgm docs: the best extent of 'two words' is
+    # '  w' to 'ord', which doesn't end at the end of a word.
+    assert word_similarity("word", "two words") == pytest.approx(0.8)
+    assert word_similarity("word", "words") == pytest.approx(0.8)
+
+    # SELECT word_similarity('hamtramk', 'Hamtramck city, Wayne County, MI');
+    assert word_similarity(
+        "hamtramk", "Hamtramck city, Wayne County, MI"
+    ) == pytest.approx(7 / 9)
+
+
+def test_word_similarity_finds_the_best_words():
+    assert word_similarity("hamtramck", "Hamtramck city, Wayne County, MI") == 1.0
+    assert word_similarity("wayne county", "Hamtramck city, Wayne County, MI") == 1.0
+    assert word_similarity("wayne", "Hamtramck city, Wayne County, MI") == 1.0
+    assert word_similarity("detroit", "Ypsilanti city, MI") < 0.2
+    assert word_similarity("", "Ypsilanti city, MI") == 0.0
+
+
+def test_index_search():
+    index = TrigramIndex(
+        [
+            "Ypsilanti city, MI",
+            "Ypsilanti charter township, MI",
+            "Hamtramck city, MI",
+            "Detroit city, MI",
+            None,
+        ]
+    )
+
+    assert [i for _, i in index.search("ypsilanty")] == [0, 1]
+    assert [i for _, i in index.search("hamtramk")] == [2]
+    assert index.search("zzzzzz") == []
+    assert index.search("ypsilanty", threshold=0.9) == []
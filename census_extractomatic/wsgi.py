@@ -1,7 +1,11 @@
 #import newrelic.agent
 #newrelic.agent.initialize('newrelic.ini')
 
-from census_extractomatic.api import app as application
+from census_extractomatic.api import app as application, build_search_indexes
+
+# Gunicorn imports this once per worker, so each worker builds its own
+# in-memory search indexes before it takes any requests.
+build_search_indexes()
 
 if __name__ == "__main__":
     application.run()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import psycopg2
+
+# The scoring is the API's own, so the benchmark times the real query
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from census_extractomatic._api.access import GEO_TEXT_SCORE  # noqa: E402
+
+""" geo_search_benchmark.py
+Time the two ways /1.0/geo/search can look up a geography by name.
+
+'like' is the prefix match the typeahead has always used (when it isn't
+answered from the in-memory index), 'text' is the ranked full text search
+behind mode=text. Run migrations/0002_add_geo_name_search.sql first.
+
+    python geo_search_benchmark.py "dbname=census user=census" --runs 50
+"""
+
+QUERIES = [
+    "detroit",
+    "ann arbor",
+    "wayne county",
+    "livonia",
+    "grand rapids",
+    "census tract 5001",
+    "sault ste marie",
+    "48226",
+]
+
+SUMLEVS = ("140", "060", "160", "310", "330", "350", "860", "950", "960", "970")
+
+LIKE_SQL = """
+    SELECT DISTINCT geoid, sumlevel, population, display_name, full_geoid, priority
+    FROM {release}.census_name_lookup
+    WHERE lower(prefix_match_name) LIKE lower(%(q)s)
+    AND lower(display_name) NOT LIKE '%%not defined%%'
+    AND sumlevel IN %(sumlevs)s
+    ORDER BY priority, population DESC NULLS LAST
+    LIMIT 25;
+"""
+
+TEXT_SQL = """
+    WITH matches AS (
+        SELECT DISTINCT ON (full_geoid) full_geoid, {score} AS score
+        FROM {release}.census_name_lookup,
+             websearch_to_tsquery('english', %(q)s) AS query
+        WHERE searchable_geo_name @@ query
+        AND sumlevel IN %(sumlevs)s
+        ORDER BY full_geoid, score DESC
+    )
+    SELECT full_geoid, score
+    FROM matches
+    ORDER BY score DESC, full_geoid
+    LIMIT 25;
+"""
+
+
+def time_query(cur, sql, params, runs):
+    """ Run the query `runs` times; return (timings in ms, row count) """
+
+    timings = []
+    rows = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        rows = len(cur.fetchall())
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings, rows
+
+
+def describe(timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return "median {:7.2f} ms  p95 {:7.2f} ms".format(
+        statistics.median(timings), p95
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the LIKE and full text geography searches"
+    )
+    parser.add_argument("dsn", help="libpq connection string")
+    parser.add_argument("--release", default="tiger2022")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(args.dsn)
+    cur = connection.cursor()
+
+    like_sql = LIKE_SQL.format(release=args.release)
+    text_sql = TEXT_SQL.format(release=args.release, score=GEO_TEXT_SCORE)
+
+    for q in QUERIES:
+        like, like_rows = time_query(
+            cur, like_sql, {"q": q + "%", "sumlevs": SUMLEVS}, args.runs
+        )
+        ts, ts_rows = time_query(
+            cur, text_sql, {"q": q, "sumlevs": SUMLEVS}, args.runs
+        )
+
+        print(q)
+        print("    like  {}  ({} rows)".format(describe(like), like_rows))
+        print("    text  {}  ({} rows)".format(describe(ts), ts_rows))
+
+    cur.close()
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Render boundary vector tiles ahead of time into MBTiles files that the
+/1.0/geo/<release>/tiles/<sumlevel>/<z>/<x>/<y>.mvt endpoint serves directly.
+Tiles outside the rendered area or zoom range are still drawn live.
+
+    python prerender_tiles.py --release tiger2022 --sumlevel 140 --sumlevel 150
+
+Tiles are rendered in a process pool (each worker keeps its own database
+connection) and written to the store from this process as they come back.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+
+import click
+from sqlalchemy import create_engine
+import tomllib
+
+from census_extractomatic._api.access import (
+    ViewportLocation,
+    get_boundary_tile_mvt,
+)
+from census_extractomatic._api.tile_store import MBTilesStore, tile_store_path
+
+
+# West, south, east, north
+MICHIGAN_BOUNDS = (-90.42, 41.69, -82.12, 48.31)
+
+# The zooms at which each summary level is actually looked at on the map.
+DEFAULT_ZOOMS = {
+    "040": (3, 8),
+    "050": (5, 10),
+    "060": (7, 12),
+    "160": (7, 12),
+    "140": (9, 13),
+    "150": (10, 14),
+    "860": (8, 13),
+    "970": (7, 12),
+}
+
+BATCH_SIZE = 64
+
+worker_engine = None
+
+
+def init_worker(database_uri):
+    global worker_engine
+    worker_engine = create_engine(database_uri, pool_size=1)
+
+
+def render_batch(release, sumlevel, locations):
+    with worker_engine.connect() as connection:
+        return [
+            (
+                loc.zoom,
+                loc.x,
+                loc.y,
+                get_boundary_tile_mvt(sumlevel, loc, connection, release=release),
+            )
+            for loc in locations
+        ]
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@click.command()
+@click.option("--release", default="tiger2022", help="TIGER release schema")
+@click.option(
+    "--sumlevel",
+    "sumlevels",
+    multiple=True,
+    default=list(DEFAULT_ZOOMS),
+    help="Summary level to render (repeatable)",
+)
+@click.option("--min-zoom", type=int, help="Override the sumlevel's min zoom")
+@click.option("--max-zoom", type=int, help="Override the sumlevel's max zoom")
+@click.option(
+    "--bbox",
+    type=float,
+    nargs=4,
+    default=MICHIGAN_BOUNDS,
+    help="west south east north (defaults to Michigan)",
+)
+@click.option("--out", "out_dir", default="tiles", help="Output directory")
+@click.option("--workers", type=int, default=os.cpu_count(), help="Processes")
+@click.option("--config", default="config.toml", help="Config file path")
+def prerender(
+    release, sumlevels, min_zoom, max_zoom, bbox, out_dir, workers, config
+):
+    """Pre-render boundary tiles into one .mbtiles file per sumlevel."""
+
+    try:
+        with open(config, "rb") as f:
+            db = tomllib.load(f)["db"]
+    except FileNotFoundError:
+        click.echo(f"Error: Config file {config} not found", err=True)
+        return
+
+    database_uri = (
+        f"postgresql://{db['username']}:{db['password']}"
+        f"@{db['host']}:{db['port']}/{db['name']}"
+    )
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(database_uri,),
+    ) as pool:
+        for sumlevel in sumlevels:
+            default_min, default_max = DEFAULT_ZOOMS.get(sumlevel, (8, 12))
+            low = default_min if min_zoom is None else min_zoom
+            high = default_max if max_zoom is None else max_zoom
+
+            path = tile_store_path(out_dir, release, sumlevel)
+            store = MBTilesStore.create(
+                path, f"{release} {sumlevel} boundaries", bbox, low, high
+            )
+
+            locations = (
+                loc
+                for zoom in range(low, high + 1)
+                for loc in ViewportLocation.covering(zoom, *bbox)
+            )
+
+            futures = [
+                pool.submit(render_batch, release, sumlevel, batch)
+                for batch in batched(locations, BATCH_SIZE)
+            ]
+
+            rendered = 0
+            with store, click.progressbar(
+                length=len(futures), label=f"{release} {sumlevel} z{low}-{high}"
+            ) as bar:
+                for future in as_completed(futures):
+                    tiles = future.result()
+                    store.put_many(tiles)
+                    rendered += len(tiles)
+                    bar.update(1)
+
+            click.echo(f"Wrote {rendered} tiles to {path}")
+
+
+if __name__ == "__main__":
+    prerender()